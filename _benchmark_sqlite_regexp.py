@@ -0,0 +1,65 @@
+"""This script compares the REGEXP function that the OLD provides for SQLite
+(cf. onlinelinguisticdatabase/lib/sqliteregexp.py) with the callback it
+replaced, which called re.compile for every row.  Each pattern is used to
+filter a table of n transcriptions in an in-memory SQLite database.
+
+Usage: python _benchmark_sqlite_regexp.py [n]
+
+Data from tests:
+n = 200000
+times in seconds (best of 3)
+
+pattern             legacy      current
+a                   0.228       0.106
+^tr                 0.239       0.141
+^transcription 1$   0.294       0.124
+^tr[a-z]+ 1[0-9]    0.276       0.194
+[0-9]{3}$           0.327       0.229
+a|b                 0.268       0.166
+
+Note that re.compile itself caches the patterns it has compiled, so the legacy
+callback's cost per row is that of re.compile's cache lookup, not that of
+compiling the pattern.  Literal and anchored literal patterns benefit most.
+
+"""
+
+import re
+import sys
+import sqlite3
+import timeit
+from onlinelinguisticdatabase.lib.sqliteregexp import get_regexp_function
+
+def legacy_regexp(expr, item):
+    patt = re.compile(expr)
+    try:
+        return item and patt.search(item) is not None
+    except TypeError:
+        return item and patt.search(str(item)) is not None
+
+patterns = [u'a', u'^tr', u'^transcription 1$', u'^tr[a-z]+ 1[0-9]', u'[0-9]{3}$', u'a|b']
+
+def get_connection(regexp, n):
+    connection = sqlite3.connect(':memory:')
+    connection.create_function('regexp', 2, regexp)
+    connection.execute('CREATE TABLE form (id INTEGER PRIMARY KEY, transcription TEXT)')
+    connection.executemany('INSERT INTO form (transcription) VALUES (?)',
+        ((u'transcription %d' % i,) for i in xrange(n)))
+    return connection
+
+def count(connection, pattern):
+    return connection.execute('SELECT COUNT(*) FROM form WHERE transcription REGEXP ?',
+                              (pattern,)).fetchone()[0]
+
+def main(n=200000):
+    legacy = get_connection(legacy_regexp, n)
+    current = get_connection(get_regexp_function(), n)
+    print 'n = %d' % n
+    print '%-20s%-12s%-12s' % ('pattern', 'legacy', 'current')
+    for pattern in patterns:
+        assert count(legacy, pattern) == count(current, pattern)
+        times = [min(timeit.repeat(lambda: count(connection, pattern), number=1, repeat=3))
+                 for connection in (legacy, current)]
+        print '%-20s%-12.3f%-12.3f' % (pattern, times[0], times[1])
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
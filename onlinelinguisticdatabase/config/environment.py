@@ -19,17 +19,24 @@
 
 """
 
-import os, re
+import os
 
 from mako.lookup import TemplateLookup
 from pylons.configuration import PylonsConfig
 from pylons.error import handle_mako_error
 from sqlalchemy import engine_from_config
+from paste.deploy.converters import asbool
 import onlinelinguisticdatabase.lib.app_globals as app_globals
 import onlinelinguisticdatabase.lib.helpers
 from onlinelinguisticdatabase.lib.foma_worker import start_foma_worker
+from onlinelinguisticdatabase.lib.parser import flookup_pool
+from onlinelinguisticdatabase.lib.sqliteregexp import get_regexp_function
 from onlinelinguisticdatabase.config.routing import make_map
 from onlinelinguisticdatabase.model import init_model
+from onlinelinguisticdatabase.model.formtrigram import configure_trigram_index, ensure_trigram_index
+from onlinelinguisticdatabase.model.collection import ensure_collection_references
+from onlinelinguisticdatabase.model.form import ensure_morpheme_token_index
+from onlinelinguisticdatabase.model.dataversion import ensure_data_versions
 import logging
 
 log = logging.getLogger(__name__)
@@ -88,20 +95,11 @@ def load_environment(global_conf, app_conf):
             from sqlalchemy.engine import Engine
             @event.listens_for(Engine, 'connect')
             def sqlite_patches(dbapi_connection, connection_record):
-                # Define a regexp function for SQLite,
-                def regexp(expr, item):
-                    """This is the Python re-based regexp function that we provide
-                    for SQLite.  Note that searches will be case-sensitive by
-                    default.  Such behaviour is assured in MySQL by inserting
-                    COLLATE expressions into the query (cf. in SQLAQueryBuilder.py).
-                    """
-                    patt = re.compile(expr)
-                    try:
-                        return item and patt.search(item) is not None
-                    # This will make regexp searches work on int, date & datetime fields.
-                    except TypeError:
-                        return item and patt.search(str(item)) is not None
-                dbapi_connection.create_function('regexp', 2, regexp)
+                # Define a regexp function for SQLite, cf. lib/sqliteregexp.py.
+                # Searches are case-sensitive by default.  Such behaviour is
+                # assured in MySQL by inserting COLLATE expressions into the
+                # query (cf. in SQLAQueryBuilder.py).
+                dbapi_connection.create_function('regexp', 2, get_regexp_function())
                 # Make LIKE searches case-sensitive in SQLite.
                 cursor = dbapi_connection.cursor()
                 cursor.execute("PRAGMA case_sensitive_like=ON")
@@ -112,19 +110,7 @@ def load_environment(global_conf, app_conf):
                 """A PoolListener used to provide the SQLite dbapi with a regexp function.
                 """
                 def connect(self, conn, conn_record):
-                    conn.create_function('regexp', 2, self.regexp)
-
-                def regexp(self, expr, item):
-                    """This is the Python re-based regexp function that we provide for SQLite.
-                    Note that searches will be case-sensitive by default, which may not be
-                    the default for the MySQL regexp, depending on the collation."""
-                    patt = re.compile(expr)
-                    try:
-                        return item and patt.search(item) is not None
-                    # This will make regexp searches work on int, date & datetime fields.
-                    # I think this is desirable ...
-                    except TypeError:
-                        return item and patt.search(str(item)) is not None
+                    conn.create_function('regexp', 2, get_regexp_function())
             engine = engine_from_config(
                 config, 'sqlalchemy.', listeners=[SQLiteSetup()])
             # Make LIKE searches case sensitive in SQLite
@@ -132,7 +118,50 @@ def load_environment(global_conf, app_conf):
 
     init_model(engine)
 
-    # start foma worker -- used for long-running tasks like FST compilation
-    foma_worker = start_foma_worker()
+    # start the job dispatcher -- it runs long-running tasks like FST
+    # compilation in worker processes
+    foma_worker = start_foma_worker(engine, max_workers=config.get('job_workers'),
+                                    poll_interval=config.get('job_poll_interval'),
+                                    stale_timeout=config.get('job_stale_timeout'))
+
+    # configure the cache of the counts of paginated queries
+    onlinelinguisticdatabase.lib.helpers.paginator_count_cache.configure(
+        ttl=config.get('paginator_count_cache_ttl'))
+
+    # configure the cache of the JSON documents of forms
+    onlinelinguisticdatabase.lib.helpers.form_json_cache.configure(
+        max_size=config.get('form_json_cache_size'), ttl=config.get('form_json_cache_ttl'))
+
+    # count the writes to each table, sharing the counts with the other
+    # processes through the dataversion table if it exists (it is created by
+    # setup-app), and configure the cache of the ordered ids of search results,
+    # which is invalidated by them
+    onlinelinguisticdatabase.lib.helpers.data_versions.listen(engine)
+    onlinelinguisticdatabase.lib.helpers.data_versions.configure(
+        shared=engine.has_table('dataversion'))
+    onlinelinguisticdatabase.lib.helpers.search_result_cache.configure(
+        max_size=config.get('search_result_cache_size'),
+        ttl=config.get('search_result_cache_ttl'))
+
+    # enable the trigram index used by like and regexp searches and build it,
+    # the table of collection references and the morpheme token index if
+    # necessary (their tables are created by setup-app, cf. websetup.py)
+    configure_trigram_index(asbool(config.get('search_trigram_index', False)))
+    connection = engine.connect()
+    transaction = connection.begin()
+    if engine.has_table('formtrigram'):
+        ensure_trigram_index(connection)
+    if engine.has_table('collectionreference'):
+        ensure_collection_references(connection)
+    if engine.has_table('formmorphemetoken'):
+        ensure_morpheme_token_index(connection)
+    if engine.has_table('dataversion'):
+        ensure_data_versions(connection)
+    transaction.commit()
+    connection.close()
+
+    # configure the pool of persistent flookup processes used to apply FSTs
+    flookup_pool.configure(max_processes=config.get('flookup_max_processes'),
+                           idle_timeout=config.get('flookup_idle_timeout'))
 
     return config
@@ -80,6 +80,8 @@ def make_map(config):
 
     map.connect('/forms/{id}/history', controller='forms', action='history')
     map.connect('/forms/remember', controller='forms', action='remember')
+    map.connect('/forms/import', controller='forms', action='import_forms',
+                conditions=dict(method='POST'))
     map.connect('/forms/update_morpheme_references', controller='forms',
                 action='update_morpheme_references', conditions=dict(method='PUT'))
 
@@ -173,6 +175,7 @@ def make_map(config):
     map.resource('form', 'forms')
     map.resource('formsearch', 'formsearches')
     map.resource('formbackup', 'formbackups')       # read-only
+    map.resource('job', 'jobs')                     # read-only
     map.resource('language', 'languages')           # read-only
     map.resource('morphemelanguagemodel', 'morphemelanguagemodels')
     map.resource('morphemelanguagemodelbackup', 'morphemelanguagemodelbackups')       # read-only
@@ -152,9 +152,9 @@ class CollectionbackupsController(BaseController):
         """
         collection_backup = Session.query(CollectionBackup).get(id)
         if collection_backup:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, collection_backup, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, collection_backup, unrestricted_user_ids):
                 return collection_backup
             else:
                 response.status_int = 403
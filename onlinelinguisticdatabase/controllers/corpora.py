@@ -21,7 +21,7 @@
 
 import logging
 import os
-import codecs
+import gzip
 from uuid import uuid4
 from shutil import rmtree
 import simplejson as json
@@ -29,12 +29,14 @@ from paste.fileapp import FileApp
 from pylons import request, response, session, config
 from pylons.controllers.util import forward
 from formencode.validators import Invalid
+from sqlalchemy import func
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import CorpusSchema, CorpusFormatSchema
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder, OLDSearchParseError
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import Corpus, CorpusBackup, CorpusFile, Form
+from onlinelinguisticdatabase.model.corpus import corpusform_table
 from subprocess import call, Popen
 
 log = logging.getLogger(__name__)
@@ -64,9 +66,11 @@ class CorporaController(BaseController):
         :request body: A JSON object of the form::
 
                 {"query": {"filter": [ ... ], "order_by": [ ... ]},
-                 "paginator": { ... }}
+                 "paginator": { ... }, "fields": [ ... ]}
 
-            where the ``order_by`` and ``paginator`` attributes are optional.
+            where the ``order_by``, ``paginator`` and ``fields`` attributes are
+            optional.  If present, ``fields`` is a list of the attributes of
+            the forms to be returned, e.g., ``["id", "transcription"]``.
 
         .. note::
 
@@ -81,11 +85,11 @@ class CorporaController(BaseController):
             try:
                 json_search_params = unicode(request.body, request.charset)
                 python_search_params = json.loads(json_search_params)
-                query = h.eagerload_form(
-                    self.query_builder.get_SQLA_query(python_search_params.get('query')))
+                fields = h.get_fields('Form', python_search_params.get('fields'))
+                query = self.query_builder.get_SQLA_query(python_search_params.get('query'))
                 query = query.filter(Form.corpora.contains(corpus))
-                query = h.filter_restricted_models('Form', query)
-                return h.add_pagination(query, python_search_params.get('paginator'))
+                return h.project(h.add_cached_pagination(query,
+                    python_search_params.get('paginator'), fields), fields)
             except h.JSONDecodeError:
                 response.status_int = 400
                 return h.JSONDecodeErrorResponse
@@ -491,7 +495,7 @@ def get_form_ids_from_tgrep2_output_line(line):
 def authorized_to_access_corpus_file(user, corpus_file):
     """Return True if user is authorized to access the corpus file."""
     if corpus_file.restricted and user.role != u'administrator' and \
-    user not in h.get_unrestricted_users():
+    user.id not in h.get_unrestricted_user_ids():
         return False
     return True
 
@@ -542,27 +546,11 @@ def write_to_file(corpus, format_):
 
     corpus_file_path = get_corpus_file_path(corpus, format_)
     update = os.path.exists(corpus_file_path) # If True, we are upating
-    restricted = False
 
-    # Create the corpus file on the filesystem
+    # Create the corpus file (and its gzipped copy) on the filesystem
     try:
-        writer = h.corpus_formats[format_]['writer']
-        if corpus.form_search:   # ``form_search`` value negates any content.
-            with codecs.open(corpus_file_path, 'w', 'utf8') as f:
-                for form in corpus.forms:
-                    if not restricted and "restricted" in [t.name for t in form.tags]:
-                        restricted = True
-                    f.write(writer(form))
-        else:
-            form_references = corpus.get_form_references(corpus.content)
-            forms = dict([(f.id, f) for f in corpus.forms])
-            with codecs.open(corpus_file_path, 'w', 'utf8') as f:
-                for id in form_references:
-                    form = forms[id]
-                    if not restricted and "restricted" in [t.name for t in form.tags]:
-                        restricted = True
-                    f.write(writer(form))
-        gzipped_corpus_file_path = h.compress_file(corpus_file_path)
+        gzipped_corpus_file_path = write_corpus_forms(corpus, format_, corpus_file_path)
+        restricted = corpus_contains_restricted_forms(corpus)
         create_tgrep2_corpus_file(gzipped_corpus_file_path, format_)
     except Exception, e:
         destroy_file(corpus_file_path)
@@ -591,6 +579,80 @@ def write_to_file(corpus, format_):
     Session.commit()
     return corpus
 
+def write_corpus_forms(corpus, format_, corpus_file_path, chunk_size=1000):
+    """Write the forms of a corpus to ``corpus_file_path`` and to a gzipped copy of it.
+
+    Only the columns that the format's writer needs are selected and the forms
+    are streamed from the database in chunks, so no form models are built and
+    memory use does not grow with the size of the corpus.  The plain and the
+    gzipped files are written in the same pass.
+
+    :param corpus: a corpus model.
+    :param str format_: the format of the file to be written; a key of ``h.corpus_formats``.
+    :param str corpus_file_path: absolute path to the (uncompressed) file to be written.
+    :param int chunk_size: the number of forms to retrieve from the database at a time.
+    :returns: the absolute path to the gzipped corpus file.
+
+    """
+    corpus_format = h.corpus_formats[format_]
+    writer = corpus_format['writer']
+    columns = [getattr(Form, name) for name in corpus_format['columns']]
+    gzipped_corpus_file_path = '%s.gz' % corpus_file_path
+    with open(corpus_file_path, 'wb') as f:
+        with gzip.open(gzipped_corpus_file_path, 'wb') as gz:
+            for chunk in get_corpus_form_rows(corpus, columns, chunk_size):
+                data = u''.join([writer(row) for row in chunk]).encode('utf8')
+                f.write(data)
+                gz.write(data)
+    return gzipped_corpus_file_path
+
+def get_corpus_form_rows(corpus, columns, chunk_size=1000):
+    """Generate the forms of a corpus, in corpus order, as lists of at most ``chunk_size`` rows.
+
+    :param corpus: a corpus model.
+    :param list columns: the ``Form`` attributes to retrieve; each row is a
+        named tuple with these attributes.
+    :param int chunk_size: the number of rows per list.
+
+    .. note::
+
+        A ``form_search`` value negates any content: the forms of such a corpus
+        are those in ``corpus.forms``.  Otherwise, the forms are those
+        referenced in the content, in the order (and with the repetitions) in
+        which they are referenced there.
+
+    """
+    if corpus.form_search:
+        query = Session.query(*columns).\
+            join(corpusform_table, corpusform_table.c.form_id == Form.id).\
+            filter(corpusform_table.c.corpus_id == corpus.id).\
+            order_by(corpusform_table.c.id).yield_per(chunk_size)
+        chunk = []
+        for row in query:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    else:
+        form_references = corpus.get_form_references(corpus.content)
+        columns = [Form.id] + [column for column in columns if column.key != 'id']
+        for index in xrange(0, len(form_references), chunk_size):
+            ids = form_references[index:index + chunk_size]
+            rows = dict([(row.id, row) for row in
+                Session.query(*columns).filter(Form.id.in_(set(ids)))])
+            yield [rows[id] for id in ids]
+
+def corpus_contains_restricted_forms(corpus):
+    """Return ``True`` if any form of the corpus is tagged as restricted; uses a single aggregate query."""
+    count = Session.query(func.count(corpusform_table.c.form_id)).\
+        select_from(corpusform_table.\
+            join(Form.__table__, Form.__table__.c.id == corpusform_table.c.form_id)).\
+        filter(corpusform_table.c.corpus_id == corpus.id).\
+        filter(Form.__table__.c.restricted == True).scalar()
+    return bool(count)
+
 def create_tgrep2_corpus_file(gzipped_corpus_file_path, format_):
     """Use TGrep2 to create a .t2c corpus file from the gzipped file of phrase-structure trees.
 
@@ -622,6 +684,7 @@ def backup_corpus(corpus_dict):
     """
     corpus_backup = CorpusBackup()
     corpus_backup.vivify(corpus_dict)
+    corpus_backup.compact(Session)
     Session.add(corpus_backup)
 
 
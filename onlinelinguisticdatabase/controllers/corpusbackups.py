@@ -150,9 +150,9 @@ class CorpusbackupsController(BaseController):
         """
         corpus_backup = Session.query(CorpusBackup).get(id)
         if corpus_backup:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, corpus_backup, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, corpus_backup, unrestricted_user_ids):
                 return corpus_backup
             else:
                 response.status_int = 403
@@ -66,18 +66,21 @@ class FilesController(BaseController):
         :request body: A JSON object of the form::
 
                 {"query": {"filter": [ ... ], "order_by": [ ... ]},
-                 "paginator": { ... }}
+                 "paginator": { ... }, "fields": [ ... ]}
 
-            where the ``order_by`` and ``paginator`` attributes are optional.
+            where the ``order_by``, ``paginator`` and ``fields`` attributes are
+            optional.  If present, ``fields`` is a list of the attributes of
+            the files to be returned, e.g., ``["id", "filename"]``.
 
         """
         try:
             json_search_params = unicode(request.body, request.charset)
             python_search_params = json.loads(json_search_params)
+            fields = h.get_fields('File', python_search_params.get('fields'))
             SQLAQuery = h.eagerload_file(
-                self.query_builder.get_SQLA_query(python_search_params.get('query')))
+                self.query_builder.get_SQLA_query(python_search_params.get('query')), fields)
             query = h.filter_restricted_models('File', SQLAQuery)
-            return h.add_pagination(query, python_search_params.get('paginator'))
+            return h.project(h.add_pagination(query, python_search_params.get('paginator')), fields)
         except h.JSONDecodeError:
             response.status_int = 400
             return h.JSONDecodeErrorResponse
@@ -226,9 +229,9 @@ class FilesController(BaseController):
         """
         file = h.eagerload_file(Session.query(File)).get(int(id))
         if file:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, file, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, file, unrestricted_user_ids):
                 try:
                     if getattr(file, 'parent_file', None):
                         file = update_subinterval_referencing_file(file)
@@ -300,9 +303,9 @@ class FilesController(BaseController):
         """
         file = h.eagerload_file(Session.query(File)).get(id)
         if file:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, file, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, file, unrestricted_user_ids):
                 return file
             else:
                 response.status_int = 403
@@ -341,8 +344,8 @@ class FilesController(BaseController):
         response.content_type = 'application/json'
         file = h.eagerload_file(Session.query(File)).get(id)
         if file:
-            unrestricted_users = h.get_unrestricted_users()
-            if h.user_is_authorized_to_access_model(session['user'], file, unrestricted_users):
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
+            if h.user_is_authorized_to_access_model(session['user'], file, unrestricted_user_ids):
                 return {'data': get_new_edit_file_data(request.GET), 'file': file}
             else:
                 response.status_int = 403
@@ -396,8 +399,8 @@ def serve_file(id, reduced=False):
             file_path = os.path.join(files_dir, 'reduced_files', filename)
         else:
             file_path = os.path.join(files_dir, file.filename)
-        unrestricted_users = h.get_unrestricted_users()
-        if h.user_is_authorized_to_access_model(session['user'], file, unrestricted_users):
+        unrestricted_user_ids = h.get_unrestricted_user_ids()
+        if h.user_is_authorized_to_access_model(session['user'], file, unrestricted_user_ids):
             return forward(FileApp(file_path))
         else:
             response.status_int = 403
@@ -54,6 +54,13 @@ class FormbackupsController(BaseController):
         be created directly and they should never be deleted.  This controller
         facilitates searching and getting of form backups only.
 
+    .. note::
+
+        Form backups are delta-encoded (cf. ``model.FormBackup``).  Searches
+        and orderings on the attributes that a delta backup does not store use
+        their values as reconstructed from the earlier backups of its chain, so
+        they behave as though every backup were complete.
+
     """
 
     query_builder = SQLAQueryBuilder('FormBackup', config=config)
@@ -159,9 +166,9 @@ class FormbackupsController(BaseController):
         """
         form_backup = Session.query(FormBackup).get(id)
         if form_backup:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, form_backup, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, form_backup, unrestricted_user_ids):
                 return form_backup
             else:
                 response.status_int = 403
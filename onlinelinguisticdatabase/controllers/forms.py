@@ -26,15 +26,23 @@ from uuid import uuid4
 from pylons import request, response, session, app_globals, config
 from formencode.validators import Invalid
 from sqlalchemy import bindparam
-from sqlalchemy.sql import asc, or_
+from sqlalchemy.sql import asc, or_, and_, select, func
 from sqlalchemy.orm import subqueryload
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import FormSchema, FormIdsSchema
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder, OLDSearchParseError
 from onlinelinguisticdatabase.model.meta import Session
-from onlinelinguisticdatabase.model import Form, FormBackup, Collection
-from onlinelinguisticdatabase.controllers.oldcollections import update_collection_by_deletion_of_referenced_form
+import onlinelinguisticdatabase.model as model
+from onlinelinguisticdatabase.model import Form, FormBackup, FormFile, Translation
+from onlinelinguisticdatabase.model.form import formmorphemetoken_table, formtag_table, \
+    get_indexed_morpheme_delimiters, \
+    get_morpheme_tokens, get_morpheme_token_rows
+from onlinelinguisticdatabase.model.formtrigram import formtrigram_table, \
+    trigram_index_is_built, get_form_trigram_rows, get_trigram_rows
+from onlinelinguisticdatabase.model.tag import tags_include_restricted
+from onlinelinguisticdatabase.controllers.oldcollections import update_collection_by_deletion_of_referenced_form, \
+    get_collections_referencing_this_form
 
 log = logging.getLogger(__name__)
 
@@ -62,18 +70,20 @@ class FormsController(BaseController):
         :request body: A JSON object of the form::
 
                 {"query": {"filter": [ ... ], "order_by": [ ... ]},
-                 "paginator": { ... }}
+                 "paginator": { ... }, "fields": [ ... ]}
 
-            where the ``order_by`` and ``paginator`` attributes are optional.
+            where the ``order_by``, ``paginator`` and ``fields`` attributes are
+            optional.  If present, ``fields`` is a list of the attributes of
+            the forms to be returned, e.g., ``["id", "transcription"]``.
 
         """
         try:
             json_search_params = unicode(request.body, request.charset)
             python_search_params = json.loads(json_search_params)
+            fields = h.get_fields('Form', python_search_params.get('fields'))
             SQLAQuery = self.query_builder.get_SQLA_query(python_search_params.get('query'))
-            query = h.eagerload_form(SQLAQuery)
-            query = h.filter_restricted_models('Form', SQLAQuery)
-            return h.add_pagination(query, python_search_params.get('paginator'))
+            return h.project(h.add_cached_pagination(SQLAQuery,
+                python_search_params.get('paginator'), fields), fields)
         except h.JSONDecodeError:
             response.status_int = 400
             return h.JSONDecodeErrorResponse
@@ -187,9 +197,9 @@ class FormsController(BaseController):
         """
         form = h.eagerload_form(Session.query(Form)).get(int(id))
         if form:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, form, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, form, unrestricted_user_ids):
                 try:
                     schema = FormSchema()
                     values = json.loads(unicode(request.body, request.charset))
@@ -271,9 +281,9 @@ class FormsController(BaseController):
         """
         form = h.eagerload_form(Session.query(Form)).get(id)
         if form:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, form, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, form, unrestricted_user_ids):
                 return form
             else:
                 response.status_int = 403
@@ -311,8 +321,8 @@ class FormsController(BaseController):
         """
         form = h.eagerload_form(Session.query(Form)).get(id)
         if form:
-            unrestricted_users = h.get_unrestricted_users()
-            if h.user_is_authorized_to_access_model(session['user'], form, unrestricted_users):
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
+            if h.user_is_authorized_to_access_model(session['user'], form, unrestricted_user_ids):
                 return {'data': get_new_edit_form_data(request.GET), 'form': form}
             else:
                 response.status_int = 403
@@ -330,31 +340,51 @@ class FormsController(BaseController):
         :URL: ``GET /forms/history/id``
         :param str id: a string matching the ``id`` or ``UUID`` value of the
             form whose history is requested.
+        :param str page: (optional) the page of previous versions to return.
+        :param str items_per_page: (optional) the number of previous versions per page.
         :returns: A dictionary of the form::
 
                 {"form": { ... }, "previous_versions": [ ... ]}
 
             where the value of the ``form`` key is the form whose history is
             requested and the value of the ``previous_versions`` key is a list of
-            dictionaries representing previous versions of the form.
+            dictionaries representing previous versions of the form, most recent
+            first.  If ``page`` and ``items_per_page`` are specified, the value
+            of ``previous_versions`` is a dictionary of the form
+            ``{"paginator": { ... }, "items": [ ... ]}``.
+
+        .. note::
+
+            Only the requested page of previous versions is retrieved and only
+            its backups are reconstructed from their delta-encoded chains, cf.
+            ``FormBackup.reconstruct``.
 
         """
-        form, previous_versions = h.get_model_and_previous_versions('Form', id)
-        if form or previous_versions:
-            unrestricted_users = h.get_unrestricted_users()
+        form, previous_versions = h.get_model_and_previous_versions('Form', id, as_query=True)
+        has_previous_versions = previous_versions is not None and \
+            previous_versions.first() is not None
+        if form or has_previous_versions:
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            accessible = h.user_is_authorized_to_access_model
-            unrestricted_previous_versions = [fb for fb in previous_versions
-                                    if accessible(user, fb, unrestricted_users)]
-            form_is_restricted = form and not accessible(user, form, unrestricted_users)
-            previous_versions_are_restricted = previous_versions and not \
-                unrestricted_previous_versions
+            unrestricted_previous_versions = h.filter_restricted_models(
+                'FormBackup', previous_versions, user)
+            form_is_restricted = form and not h.user_is_authorized_to_access_model(
+                user, form, unrestricted_user_ids)
+            previous_versions_are_restricted = has_previous_versions and \
+                unrestricted_previous_versions.first() is None
             if form_is_restricted or previous_versions_are_restricted :
                 response.status_int = 403
                 return h.unauthorized_msg
-            else :
-                return {'form': form,
-                        'previous_versions': unrestricted_previous_versions}
+            paginator = dict(request.GET)
+            paginator.pop('export', None)
+            try:
+                result = h.add_pagination(unrestricted_previous_versions, paginator)
+            except Invalid, e:
+                response.status_int = 400
+                return {'errors': e.unpack_errors()}
+            FormBackup.reconstruct(Session,
+                result['items'] if isinstance(result, dict) else result)
+            return {'form': form, 'previous_versions': result}
         else:
             response.status_int = 404
             return {'error': 'No forms or form backups match %s' % id}
@@ -387,10 +417,10 @@ class FormsController(BaseController):
         else:
             if forms:
                 accessible = h.user_is_authorized_to_access_model
-                unrestricted_users = h.get_unrestricted_users()
+                unrestricted_user_ids = h.get_unrestricted_user_ids()
                 user = session['user']
                 unrestricted_forms = [f for f in forms
-                                     if accessible(user, f, unrestricted_users)]
+                                     if accessible(user, f, unrestricted_user_ids)]
                 if unrestricted_forms:
                     session['user'].remembered_forms += unrestricted_forms
                     session['user'].datetime_modified = h.now()
@@ -430,7 +460,62 @@ class FormsController(BaseController):
 
         """
         forms = h.get_forms()
-        return update_morpheme_references_of_forms(h.get_forms(), h.get_morpheme_delimiters(), whole_db=forms, make_backups=False)
+        return update_morpheme_references_of_forms(forms, h.get_morpheme_delimiters(),
+                        whole_db=LexicalIndex(forms), make_backups=False)
+
+    @h.jsonify
+    @h.restrict('POST')
+    @h.authenticate
+    @h.authorize(['administrator', 'contributor'])
+    def import_forms(self):
+        """Create many form resources at once and return their ids.
+
+        :URL: ``POST /forms/import``
+        :request body: a JSON array of objects representing the forms to create
+            (cf. ``POST /forms``), a JSON object of the form ``{"forms": [ ... ]}``
+            or newline-delimited JSON, i.e., one such object per line.
+        :returns: the list of the ``id`` values of the created forms, in the
+            order of the request.
+
+        .. note::
+
+           The forms are created in a single transaction: if any of them is
+           invalid, none is created and the response is a JSON object whose
+           ``errors`` attribute maps the (0-based) indices of the invalid forms
+           to their errors.  The forms are inserted in bulk and their
+           morphological analyses are generated together using an in-memory
+           lexicon; the forms that contain any of the imported forms as
+           morphemes are then updated once.
+
+        """
+        try:
+            values_list = get_import_values(unicode(request.body, request.charset))
+        except h.JSONDecodeError:
+            response.status_int = 400
+            return h.JSONDecodeErrorResponse
+        except ValueError, e:
+            response.status_int = 400
+            return {'error': unicode(e)}
+        if not values_list:
+            response.status_int = 400
+            return {'error': u'No forms were provided.'}
+        # The referenced models must remain in the identity map during validation.
+        reference_data = preload_form_reference_data(values_list)
+        schema = FormSchema()
+        data_list = []
+        errors = {}
+        for index, values in enumerate(values_list):
+            try:
+                state = h.get_state_object(values)
+                data_list.append(schema.to_python(values, state))
+            except Invalid, e:
+                errors[index] = e.unpack_errors()
+        if errors:
+            response.status_int = 400
+            return {'errors': errors}
+        form_ids = create_new_forms(data_list)
+        Session.commit()
+        return form_ids
 
 
 def update_application_settings_if_form_is_foreign_word(form):
@@ -537,6 +622,7 @@ def backup_form(form_dict):
     """
     form_backup = FormBackup()
     form_backup.vivify(form_dict)
+    form_backup.encode(Session)
     Session.add(form_backup)
 
 
@@ -739,13 +825,18 @@ def update_morpheme_references_of_forms(forms, valid_delimiters, **kwargs):
 
     :param list forms: the form models to be updated.
     :param list valid_delimiters: morpheme delimiters as strings.
-    :param list kwargs['lexical_items']: a list of form models.
-    :param list kwargs['deleted_lexical_items']: a list of form models.
-    :param list kwargs['whole_db']: a list of all the form models in the database.
+    :param list kwargs['lexical_items']: a list of form models or a :class:`LexicalIndex` thereof.
+    :param list kwargs['deleted_lexical_items']: a list of form models or a :class:`LexicalIndex` thereof.
+    :param list kwargs['whole_db']: a list of all the form models in the database
+        or a :class:`LexicalIndex` thereof.
     :returns: a list of form ``id`` values corresponding to the forms that have
         been updated.
 
     """
+    # Build the lexical indices once for all of the forms being updated.
+    for key in ('whole_db', 'lexical_items', 'deleted_lexical_items'):
+        if kwargs.get(key) is not None:
+            kwargs[key] = get_lexical_index(kwargs[key])
     form_buffer = []
     formbackup_buffer = []
     make_backups = kwargs.get('make_backups', True)
@@ -779,6 +870,7 @@ def update_morpheme_references_of_forms(forms, valid_delimiters, **kwargs):
                     values(**dict([(k, bindparam(k)) for k in form_buffer[0] if k != 'id_']))
         Session.execute(update, form_buffer)
     if make_backups and formbackup_buffer:
+        FormBackup.encode_all(Session, formbackup_buffer)
         Session.add_all(formbackup_buffer)
         Session.commit()
     return [f['id_'] for f in form_buffer]
@@ -789,6 +881,50 @@ def utf8_encode(unistr):
     except AttributeError:
         return None
 
+class LexicalIndex(object):
+    """An in-memory index of form models by morpheme break, morpheme gloss and both.
+
+    A lexical index is used in place of a ``whole_db`` list of forms so that
+    :func:`compile_morphemic_analysis` can find the matches of each morpheme by
+    dictionary look-up rather than by scanning every form in the database.
+    Matches are returned in the order of the forms the index was built from.
+
+    """
+
+    def __init__(self, forms):
+        self.forms = forms
+        self.ids = set(form.id for form in forms)
+        self.by_break = {}
+        self.by_gloss = {}
+        self.by_break_gloss = {}
+        for form in forms:
+            morpheme_break = form.morpheme_break
+            morpheme_gloss = form.morpheme_gloss
+            self.by_break.setdefault(morpheme_break, []).append(form)
+            self.by_gloss.setdefault(morpheme_gloss, []).append(form)
+            self.by_break_gloss.setdefault((morpheme_break, morpheme_gloss), []).append(form)
+
+    def __len__(self):
+        return len(self.forms)
+
+    def __iter__(self):
+        return iter(self.forms)
+
+    def get_perfect_matches(self, morpheme, gloss):
+        """Return the forms whose morpheme break is ``morpheme`` and whose morpheme gloss is ``gloss``."""
+        return self.by_break_gloss.get((morpheme, gloss), [])[:]
+
+    def get_partial_matches(self, attribute, value):
+        """Return the forms whose ``attribute`` (i.e., 'morpheme_break' or 'morpheme_gloss') is ``value``."""
+        index = {'morpheme_break': self.by_break, 'morpheme_gloss': self.by_gloss}[attribute]
+        return index.get(value, [])[:]
+
+def get_lexical_index(whole_db):
+    """Return ``whole_db`` as a :class:`LexicalIndex`, building one if it is a list of forms."""
+    if isinstance(whole_db, LexicalIndex):
+        return whole_db
+    return LexicalIndex(whole_db)
+
 def compile_morphemic_analysis(form, morpheme_delimiters=None, **kwargs):
     """An error-handling wrapper arround :func:`compileMorphemicAnalysis_`.
 
@@ -983,8 +1119,8 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
         :param str morpheme: the transcription of the morpheme.
         :param str gloss: the gloss of the morpheme.
         :param dict matches_found: keys are morpheme 2-tuples and values are lists of matches.
-        :param list lexical_items: forms constituting the exclusive pool of potential matches.
-        :param list deleted_lexical_items: forms that must be deleted from the matches.
+        :param lexical_items: a :class:`LexicalIndex` of the forms constituting the exclusive pool of potential matches.
+        :param deleted_lexical_items: a :class:`LexicalIndex` of the forms that must be deleted from the matches.
         :returns: an ordered pair (tuple), where the second element is always
             the (potentially updated) ``matches_found`` dictionary.  In the
             normal case, the first element is the list of perfect matches for
@@ -997,7 +1133,7 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
         if (morpheme, gloss) in matches_found:
             return matches_found[(morpheme, gloss)], matches_found
         if whole_db:
-            result = [f for f in whole_db if f.morpheme_break == morpheme and f.morpheme_gloss == gloss]
+            result = whole_db.get_perfect_matches(morpheme, gloss)
         elif lexical_items or deleted_lexical_items:
             extant_morpheme_break_ids = json.loads(form.morpheme_break_ids)
             extant_morpheme_gloss_ids = json.loads(form.morpheme_gloss_ids)
@@ -1009,9 +1145,8 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
             # Make extant matches look like form objects and remove those that
             # may have been deleted or updated
             extant_perfect_matches = [get_fake_form(m) for m in extant_perfect_matches_originally
-                if m[0] not in [f.id for f in lexical_items + deleted_lexical_items]]
-            perfect_matches_in_lexical_items = [f for f in lexical_items
-                if f.morpheme_break == morpheme and f.morpheme_gloss == gloss]
+                if m[0] not in lexical_items.ids and m[0] not in deleted_lexical_items.ids]
+            perfect_matches_in_lexical_items = lexical_items.get_perfect_matches(morpheme, gloss)
             perfect_matches_now = sorted(extant_perfect_matches + perfect_matches_in_lexical_items,
                                        key=lambda f: f.id)
             # If perfect matches have been emptied by us, we return a tuple so that
@@ -1052,8 +1187,8 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
         :param dict matches_found: keys are morpheme 2-tuples and values are lists of matches.
         :param str kwargs['morpheme']: the phonemic representation of the morpheme, if present.
         :param str kwargs['gloss']: the gloss of the morpheme, if present.
-        :param list kwargs['lexical_items']: forms constituting the exclusive pool of potential matches.
-        :param list kwargs['deleted_lexical_items']: forms that must be deleted from the matches.
+        :param kwargs['lexical_items']: a :class:`LexicalIndex` of the forms constituting the exclusive pool of potential matches.
+        :param kwargs['deleted_lexical_items']: a :class:`LexicalIndex` of the forms that must be deleted from the matches.
         :param iterable kwargs['force_query']: a 2-tuple representing a morpheme or a list of perfect matches.
         :returns: an ordered pair (tuple), where the first element is the list
             of partial matches found and the second is the (potentially updated)
@@ -1071,7 +1206,7 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
         if (morpheme, gloss) in matches_found:
             return matches_found[(morpheme, gloss)], matches_found
         if whole_db:
-            result = [f for f in whole_db if getattr(f, attribute) == value]
+            result = whole_db.get_partial_matches(attribute, value)
         elif lexical_items or deleted_lexical_items:
             if value in force_query:
                 result = Session.query(Form)\
@@ -1085,9 +1220,8 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
                 # Make extant matches look like form objects and remove those that
                 # may have been deleted or updated
                 extant_partial_matches = [get_fake_form(m) for m in extant_partial_matches
-                    if m[0] not in [f.id for f in lexical_items + deleted_lexical_items]]
-                partial_matches_in_lexical_items = [f for f in lexical_items
-                                                if getattr(f, attribute) == value]
+                    if m[0] not in lexical_items.ids and m[0] not in deleted_lexical_items.ids]
+                partial_matches_in_lexical_items = lexical_items.get_partial_matches(attribute, value)
                 result = sorted(extant_partial_matches + partial_matches_in_lexical_items,
                               key=lambda f: f.id)
         else:
@@ -1096,10 +1230,12 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
         return result, matches_found
 
     bgc_delimiter = kwargs.get('bgc_delimiter', h.default_delimiter)     # The default delimiter for the break_gloss_category field
-    lexical_items = kwargs.get('lexical_items', [])
-    deleted_lexical_items = kwargs.get('deleted_lexical_items', [])
+    lexical_items = get_lexical_index(kwargs.get('lexical_items') or [])
+    deleted_lexical_items = get_lexical_index(kwargs.get('deleted_lexical_items') or [])
     matches_found = kwargs.get('cache', {})   # temporary store -- eliminates redundant queries & processing -- updated as a byproduct of get_perfect_matches and get_partial_matches
     whole_db = kwargs.get('whole_db')
+    if whole_db:
+        whole_db = get_lexical_index(whole_db)
     morpheme_break_ids = []
     morpheme_gloss_ids = []
     syntactic_category_string = []
@@ -1167,6 +1303,216 @@ def compileMorphemicAnalysis_(form, morpheme_delimiters=None, **kwargs):
 
 
 
+################################################################################
+# Form Import Functions
+################################################################################
+
+# Maps the relational attributes of a form to the models they reference.
+form_reference_models = (
+    ('elicitation_method', 'ElicitationMethod'),
+    ('syntactic_category', 'SyntacticCategory'),
+    ('speaker', 'Speaker'),
+    ('elicitor', 'User'),
+    ('verifier', 'User'),
+    ('source', 'Source'),
+    ('tags', 'Tag'),
+    ('files', 'File')
+)
+
+def get_import_values(body):
+    """Return the list of form representations in the body of an import request.
+
+    :param unicode body: a JSON array, a JSON object with a ``forms`` array or
+        newline-delimited JSON objects.
+    :returns: a list of dicts.
+    :raises: ``h.JSONDecodeError`` if the body cannot be decoded and
+        ``ValueError`` if it does not represent a list of JSON objects.
+
+    """
+    try:
+        values = json.loads(body)
+    except h.JSONDecodeError:
+        values = [json.loads(line) for line in body.splitlines() if line.strip()]
+    if isinstance(values, dict):
+        # A single line of newline-delimited JSON is a form, not a wrapper.
+        values = values['forms'] if 'forms' in values else [values]
+    if not isinstance(values, list) or not all(isinstance(v, dict) for v in values):
+        raise ValueError(u'The forms must be provided as a list of JSON objects.')
+    return values
+
+def preload_form_reference_data(values_list, chunk_size=500):
+    """Load the models referenced by the forms in ``values_list`` with one query
+    per model (and chunk) so that the ``ValidOLDModelObject`` validators of
+    ``FormSchema`` find them in the session's identity map instead of querying
+    the database for each form.
+
+    :param list values_list: dicts representing forms.
+    :returns: the list of loaded models; hold on to it until the forms are
+        validated since the identity map only references them weakly.
+
+    """
+    ids = {}
+    for values in values_list:
+        for attribute, model_name in form_reference_models:
+            value = values.get(attribute)
+            for id in (value if isinstance(value, list) else [value]):
+                try:
+                    ids.setdefault(model_name, set()).add(int(id))
+                except (TypeError, ValueError):
+                    pass
+    models = []
+    for model_name, model_ids in ids.iteritems():
+        model_ = getattr(model, model_name)
+        query = Session.query(model_)
+        if model_name == 'File':
+            query = query.options(subqueryload(model_.tags))
+        model_ids = sorted(model_ids)
+        for index in xrange(0, len(model_ids), chunk_size):
+            models += query.filter(model_.id.in_(model_ids[index:index + chunk_size])).all()
+    return models
+
+def get_import_rows(data, user_id, datetime_):
+    """Return the ``form`` table row of a validated form to be imported, cf.
+    :func:`create_new_form`.
+
+    :param dict data: the validated form.
+    :param int user_id: the id of the enterer (and modifier) of the form.
+    :param datetime_: the value of ``datetime_entered`` and ``datetime_modified``.
+    :returns: a triple: the row (a dict), the tags of the form and its files.
+
+    """
+    files = [f for f in data['files'] if f]
+    tags = [t for t in data['tags'] if t]
+    # Restrict the entire form if it is associated to restricted files.
+    restricted_tags = [tag for f in files for tag in f.tags if tag.name == u'restricted']
+    if restricted_tags and restricted_tags[0] not in tags:
+        tags.append(restricted_tags[0])
+    row = {
+        'UUID': unicode(uuid4()),
+        'transcription': h.to_single_space(h.normalize(data['transcription'])),
+        'phonetic_transcription': h.to_single_space(h.normalize(data['phonetic_transcription'])),
+        'narrow_phonetic_transcription': h.to_single_space(h.normalize(
+            data['narrow_phonetic_transcription'])),
+        'morpheme_break': h.to_single_space(h.normalize(data['morpheme_break'])),
+        'morpheme_gloss': h.to_single_space(h.normalize(data['morpheme_gloss'])),
+        'comments': h.normalize(data['comments']),
+        'speaker_comments': h.normalize(data['speaker_comments']),
+        'syntax': h.normalize(data['syntax']),
+        'semantics': h.normalize(data['semantics']),
+        'grammaticality': data['grammaticality'],
+        'status': data['status'],
+        'date_elicited': data['date_elicited'],
+        'elicitationmethod_id': getattr(data['elicitation_method'], 'id', None),
+        'syntacticcategory_id': getattr(data['syntactic_category'], 'id', None),
+        'source_id': getattr(data['source'], 'id', None),
+        'elicitor_id': getattr(data['elicitor'], 'id', None),
+        'verifier_id': getattr(data['verifier'], 'id', None),
+        'speaker_id': getattr(data['speaker'], 'id', None),
+        'enterer_id': user_id,
+        'modifier_id': user_id,
+        'datetime_entered': datetime_,
+        'datetime_modified': datetime_,
+        'restricted': tags_include_restricted(tags)
+    }
+    return row, tags, files
+
+def create_new_forms(data_list, chunk_size=500):
+    """Create forms in bulk.
+
+    The forms, their translations and their tag and file associations are
+    inserted with one ``executemany`` per table and the morpheme token and
+    trigram indices are extended accordingly.  The morphological analyses of
+    the new forms are then generated using an in-memory lexicon of all the
+    forms that could match their morphemes and, finally, the lexical changes
+    are percolated once to the forms that contain the new forms as morphemes.
+    Nothing is committed.
+
+    :param list data_list: validated form dicts, cf. ``FormSchema``.
+    :returns: the list of the ``id`` values of the new forms.
+
+    """
+    morpheme_delimiters = h.get_morpheme_delimiters()
+    user = session['user'] = Session.merge(session['user'])
+    datetime_ = h.now()
+    rows = [get_import_rows(data, user.id, datetime_) for data in data_list]
+    form_table = Form.__table__
+    if h.get_RDBMS_name(config=config) == 'mysql':
+        Session.execute('set names utf8;')
+    max_id = Session.execute(select([func.max(form_table.c.id)])).scalar() or 0
+    form_rows = [row for row, tags, files in rows]
+    for index in xrange(0, len(form_rows), chunk_size):
+        Session.execute(form_table.insert(), form_rows[index:index + chunk_size])
+    # Retrieve the ids of the new forms via their UUIDs.
+    ids = dict((UUID, id) for id, UUID in Session.execute(select(
+        [form_table.c.id, form_table.c.UUID]).where(form_table.c.id > max_id)))
+    form_ids = [ids[row['UUID']] for row, tags, files in rows]
+
+    translation_rows = []
+    tag_rows = []
+    file_rows = []
+    trigram_rows = []
+    token_rows = []
+    indexed_morpheme_delimiters = get_indexed_morpheme_delimiters(Session)
+    index_tokens = indexed_morpheme_delimiters is not None
+    indexed_morpheme_delimiters = indexed_morpheme_delimiters and \
+        indexed_morpheme_delimiters.split(u',') or []
+    index_trigrams = trigram_index_is_built(Session)
+    for form_id, data, (row, tags, files) in zip(form_ids, data_list, rows):
+        translations = data['translations']
+        translation_rows += [{'form_id': form_id, 'transcription': t.transcription,
+            'grammaticality': t.grammaticality} for t in translations]
+        tag_rows += [{'form_id': form_id, 'tag_id': tag.id} for tag in tags]
+        file_rows += [{'form_id': form_id, 'file_id': file.id} for file in files]
+        if index_tokens:
+            token_rows += get_morpheme_token_rows(form_id, row['morpheme_break'],
+                row['morpheme_gloss'], indexed_morpheme_delimiters)
+        if index_trigrams:
+            trigram_rows += get_form_trigram_rows(form_id, row['transcription'],
+                row['morpheme_break'], row['morpheme_gloss'])
+            trigram_rows += get_trigram_rows(form_id, u'translation',
+                [t.transcription for t in translations])
+    for table, table_rows in ((Translation.__table__, translation_rows),
+                              (formtag_table, tag_rows),
+                              (FormFile.__table__, file_rows),
+                              (formmorphemetoken_table, token_rows),
+                              (formtrigram_table, trigram_rows)):
+        for index in xrange(0, len(table_rows), chunk_size):
+            Session.execute(table.insert(), table_rows[index:index + chunk_size])
+
+    forms = []
+    for index in xrange(0, len(form_ids), chunk_size):
+        forms += Session.query(Form).options(subqueryload(Form.syntactic_category)).\
+            filter(Form.id.in_(form_ids[index:index + chunk_size])).order_by(asc(Form.id)).all()
+    update_morpheme_references_of_forms(forms, morpheme_delimiters,
+        whole_db=get_import_lexicon(forms, morpheme_delimiters, chunk_size), make_backups=False)
+    for form in forms:
+        if h.form_is_foreign_word(form):
+            update_application_settings_if_form_is_foreign_word(form)
+            break
+    update_forms_containing_these_forms_as_morphemes(forms, excluded_form_ids=form_ids)
+    return form_ids
+
+def get_import_lexicon(forms, morpheme_delimiters, chunk_size=500):
+    """Return a :class:`LexicalIndex` of the forms that may match a morpheme of
+    one of ``forms``, i.e., of the forms whose morpheme break is one of their
+    morphemes or whose morpheme gloss is one of their glosses.  The analyses
+    it yields are those that the whole database would yield.
+
+    """
+    lexicon = {}
+    for attribute in ('morpheme_break', 'morpheme_gloss'):
+        tokens = set()
+        for form in forms:
+            tokens |= get_morpheme_tokens(getattr(form, attribute), morpheme_delimiters)
+        tokens = list(tokens)
+        column = getattr(Form, attribute)
+        for index in xrange(0, len(tokens), chunk_size):
+            for form in Session.query(Form).options(subqueryload(Form.syntactic_category)).\
+                    filter(column.in_(tokens[index:index + chunk_size])).all():
+                lexicon[form.id] = form
+    return LexicalIndex([lexicon[id] for id in sorted(lexicon)])
+
+
 ################################################################################
 # Form -> Morpheme updating functionality
 ################################################################################
@@ -1191,30 +1537,18 @@ def update_forms_containing_this_form_as_morpheme(form, change='create', previou
     """
 
     if h.is_lexical(form):
-        # Here we construct the query to get all forms that may have been affected
-        # by the change to the lexical item (i.e., form).
+        # Here we look up, in the morpheme token index, all forms that may have
+        # been affected by the change to the lexical item (i.e., form).
         morpheme_delimiters = h.get_morpheme_delimiters()
-        escaped_morpheme_delimiters = [h.esc_RE_meta_chars(d) for d in morpheme_delimiters]
-        start_patt = '(%s)' % '|'.join(escaped_morpheme_delimiters + [u' ', '^'])
-        end_patt = '(%s)' % '|'.join(escaped_morpheme_delimiters + [u' ', '$'])
-        morpheme_patt = '%s%s%s' % (start_patt, form.morpheme_break, end_patt)
-        gloss_patt = '%s%s%s' % (start_patt, form.morpheme_gloss, end_patt)
-        disjunctive_conditions = [Form.morpheme_break.op('regexp')(morpheme_patt),
-                                 Form.morpheme_gloss.op('regexp')(gloss_patt)]
-        matches_query = Session.query(Form).options(subqueryload(Form.syntactic_category))
+        morpheme_breaks = set([form.morpheme_break])
+        morpheme_glosses = set([form.morpheme_gloss])
 
         # Updates entail a wider range of possibly affected forms
         if previous_version and h.is_lexical(previous_version):
-            if previous_version['morpheme_break'] != form.morpheme_break:
-                morpheme_patt_PV = '%s%s%s' % (start_patt, previous_version['morpheme_break'], end_patt)
-                disjunctive_conditions.append(Form.morpheme_break.op('regexp')(morpheme_patt_PV))
-            if previous_version['morpheme_gloss'] != form.morpheme_gloss:
-                gloss_patt_PV = '%s%s%s' % (start_patt, previous_version['morpheme_gloss'], end_patt)
-                disjunctive_conditions.append(Form.morpheme_gloss.op('regexp')(gloss_patt_PV))
+            morpheme_breaks.add(previous_version['morpheme_break'])
+            morpheme_glosses.add(previous_version['morpheme_gloss'])
 
-        matches_query = matches_query.filter(or_(*disjunctive_conditions))
-        #matches = [f for f in matches_query.all() if f.id != form.id]
-        matches = matches_query.all()
+        matches = get_forms_containing_morphemes(morpheme_breaks, morpheme_glosses)
 
         if change == 'delete':
             updated_form_ids = update_morpheme_references_of_forms(matches,
@@ -1223,6 +1557,58 @@ def update_forms_containing_this_form_as_morpheme(form, change='create', previou
             updated_form_ids = update_morpheme_references_of_forms(matches,
                                 morpheme_delimiters, lexical_items=[form])
 
+def update_forms_containing_these_forms_as_morphemes(forms, excluded_form_ids=None):
+    """Update the morphological analysis-related attributes of every form containing any of the input forms as morpheme.
+
+    This is the bulk analogue of :func:`update_forms_containing_this_form_as_morpheme`
+    for created/updated forms: the forms that may be affected by any of the
+    lexical items in ``forms`` are retrieved together and each of them is
+    re-analyzed exactly once (with all of the lexical items as the pool of
+    changed matches) and its updates and backups are written in bulk.
+
+    :param list forms: form models; those that are not lexical are ignored.
+    :param iterable excluded_form_ids: ids of forms not to update, e.g., those
+        of forms whose analyses already take ``forms`` into account.
+    :returns: a list of the ``id`` values of the updated forms.
+
+    """
+    lexical_items = [form for form in forms if h.is_lexical(form)]
+    if not lexical_items:
+        return []
+    morpheme_delimiters = h.get_morpheme_delimiters()
+    matches = get_forms_containing_morphemes(
+        set([form.morpheme_break for form in lexical_items]),
+        set([form.morpheme_gloss for form in lexical_items]))
+    if excluded_form_ids:
+        excluded_form_ids = set(excluded_form_ids)
+        matches = [form for form in matches if form.id not in excluded_form_ids]
+    return update_morpheme_references_of_forms(matches, morpheme_delimiters,
+                                               lexical_items=lexical_items)
+
+def get_forms_containing_morphemes(morpheme_breaks, morpheme_glosses, chunk_size=500):
+    """Return the forms that contain any of the morphemes or glosses, according to the morpheme token index.
+
+    :param iterable morpheme_breaks: morphemes (phonemic forms).
+    :param iterable morpheme_glosses: morpheme glosses.
+    :param int chunk_size: the maximum number of values per ``IN`` clause.
+    :returns: a list of form models (with their syntactic categories loaded), sorted by id.
+
+    """
+    table = formmorphemetoken_table
+    form_ids = set()
+    for attribute, tokens in ((u'morpheme_break', list(morpheme_breaks)),
+                              (u'morpheme_gloss', list(morpheme_glosses))):
+        for index in xrange(0, len(tokens), chunk_size):
+            form_ids.update([form_id for (form_id,) in Session.execute(
+                select([table.c.form_id]).where(and_(table.c.attribute == attribute,
+                    table.c.token.in_(tokens[index:index + chunk_size]))))])
+    form_ids = sorted(form_ids)
+    forms = []
+    for index in xrange(0, len(form_ids), chunk_size):
+        forms += Session.query(Form).options(subqueryload(Form.syntactic_category)).\
+            filter(Form.id.in_(form_ids[index:index + chunk_size])).order_by(asc(Form.id)).all()
+    return forms
+
 def update_has_changed_the_analysis(form, form_dict):
     """Return ``True`` if the update from form_dict to form has changed the morphological analysis of the form."""
     try:
@@ -1255,8 +1641,6 @@ def update_collections_referencing_this_form(form):
        form -- in short, this will result in redundant updates and backups.
 
     """
-    pattern = unicode(h.form_reference_pattern.pattern.replace('[0-9]+', str(form.id)))
-    collections_referencing_this_form = Session.query(Collection).\
-        filter(Collection.contents.op('regexp')(pattern)).all()
+    collections_referencing_this_form = get_collections_referencing_this_form(form)
     for collection in collections_referencing_this_form:
         update_collection_by_deletion_of_referenced_form(collection, form)
@@ -0,0 +1,118 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Contains the :class:`JobsController`.
+
+.. module:: jobs
+   :synopsis: Contains the jobs controller.
+
+"""
+
+import logging
+from pylons import request, response, config
+from formencode.validators import Invalid
+from onlinelinguisticdatabase.lib.base import BaseController
+import onlinelinguisticdatabase.lib.helpers as h
+from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
+from onlinelinguisticdatabase.model.meta import Session
+from onlinelinguisticdatabase.model import Job
+
+log = logging.getLogger(__name__)
+
+class JobsController(BaseController):
+    """Generate responses to requests on job resources.
+
+    REST Controller styled on the Atom Publishing Protocol.
+
+    .. note::
+
+       The ``h.jsonify`` decorator converts the return value of the methods to
+       JSON.
+
+    .. note::
+
+        Jobs are created when long-running tasks such as FST compilation or
+        language model estimation are requested (cf.
+        :mod:`onlinelinguisticdatabase.lib.foma_worker`); they cannot be created
+        directly.  This controller facilitates retrieval of the status and
+        progress of jobs only.
+
+    """
+
+    query_builder = SQLAQueryBuilder('Job', config=config)
+
+    @h.jsonify
+    @h.restrict('GET')
+    @h.authenticate
+    def index(self):
+        """Get all job resources.
+
+        :URL: ``GET /jobs`` with optional query string parameters for
+            ordering and pagination and ``status`` and ``resource`` parameters
+            for filtering, e.g., ``GET /jobs?resource=Morphology%201``.
+        :returns: a list of all job resources.
+
+        """
+        try:
+            query = Session.query(Job)
+            for attribute in ('status', 'resource'):
+                if request.GET.get(attribute):
+                    query = query.filter(getattr(Job, attribute) == request.GET[attribute])
+            query = h.add_order_by(query, dict(request.GET), self.query_builder)
+            return h.add_pagination(query, dict(request.GET))
+        except Invalid, e:
+            response.status_int = 400
+            return {'errors': e.unpack_errors()}
+
+    @h.jsonify
+    def create(self):
+        response.status_int = 404
+        return {'error': 'This resource is read-only.'}
+
+    @h.jsonify
+    def new(self, format='html'):
+        response.status_int = 404
+        return {'error': 'This resource is read-only.'}
+
+    @h.jsonify
+    def update(self, id):
+        response.status_int = 404
+        return {'error': 'This resource is read-only.'}
+
+    @h.jsonify
+    def delete(self, id):
+        response.status_int = 404
+        return {'error': 'This resource is read-only.'}
+
+    @h.jsonify
+    @h.restrict('GET')
+    @h.authenticate
+    def show(self, id):
+        """Return a job.
+
+        :URL: ``GET /jobs/id``
+        :param str id: the ``id`` value of the job to be returned.
+        :returns: a job model object.
+
+        """
+        job = Session.query(Job).get(id)
+        if job:
+            return job
+        else:
+            response.status_int = 404
+            return {'error': 'There is no job with id %s' % id}
+
+    @h.jsonify
+    def edit(self, id, format='html'):
+        response.status_int = 404
+        return {'error': 'This resource is read-only.'}
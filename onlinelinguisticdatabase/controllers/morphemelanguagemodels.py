@@ -28,7 +28,7 @@ import os
 from uuid import uuid4
 from paste.fileapp import FileApp
 from pylons.controllers.util import forward
-from pylons import request, response, session, config
+from pylons import request, response, session, config, url
 from formencode.validators import Invalid
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import MorphemeLanguageModelSchema, MorphemeSequencesSchema
@@ -36,7 +36,7 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import MorphemeLanguageModel, MorphemeLanguageModelBackup
-from onlinelinguisticdatabase.lib.foma_worker import foma_worker_q
+from onlinelinguisticdatabase.lib.foma_worker import enqueue_job
 
 log = logging.getLogger(__name__)
 
@@ -263,7 +263,7 @@ class MorphemelanguagemodelsController(BaseController):
     @h.authenticate
     @h.authorize(['administrator', 'contributor'])
     def generate(self, id):
-        """Generate the files that constitute the morpheme language model, crucially the file that holds the pickled LM trie.
+        """Generate the files that constitute the morpheme language model, crucially the file that holds the compact LM trie.
 
         :URL: ``PUT /morpheme_language_model/id/generate``
         :param str id: the ``id`` value of the morpheme language model whose files will be generated.
@@ -280,11 +280,9 @@ class MorphemelanguagemodelsController(BaseController):
             'user_id': session['user'].id,
             'timeout': h.morpheme_language_model_generate_timeout
         }
-        foma_worker_q.put({
-            'id': h.generate_salt(),
-            'func': 'generate_language_model',
-            'args': args
-        })
+        job = enqueue_job('generate_language_model', args,
+            resource=u'MorphemeLanguageModel %s' % lm.id, user_id=session['user'].id)
+        response.headers['Location'] = url('job', id=job.id)
         return lm
 
     @h.jsonify
@@ -338,11 +336,9 @@ class MorphemelanguagemodelsController(BaseController):
             'user_id': session['user'].id,
             'timeout': h.morpheme_language_model_generate_timeout
         }
-        foma_worker_q.put({
-            'id': h.generate_salt(),
-            'func': 'compute_perplexity',
-            'args': args
-        })
+        job = enqueue_job('compute_perplexity', args,
+            resource=u'MorphemeLanguageModel %s' % lm.id, user_id=session['user'].id)
+        response.headers['Location'] = url('job', id=job.id)
         return lm
 
     @h.restrict('GET')
@@ -375,7 +371,7 @@ class MorphemelanguagemodelsController(BaseController):
 def authorized_to_access_arpa_file(user, morpheme_language_model):
     """Return True if user is authorized to access the ARPA file of the morpheme LM."""
     if (morpheme_language_model.restricted and user.role != u'administrator' and
-    user not in h.get_unrestricted_users()):
+    user.id not in h.get_unrestricted_user_ids()):
         return False
     return True
 
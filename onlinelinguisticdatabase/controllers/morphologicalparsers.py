@@ -28,7 +28,7 @@ import codecs
 import cPickle
 from paste.fileapp import FileApp
 from pylons.controllers.util import forward
-from pylons import request, response, session, config
+from pylons import request, response, session, config, url
 from formencode.validators import Invalid
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import MorphologicalParserSchema, TranscriptionsSchema, MorphemeSequencesSchema
@@ -36,7 +36,7 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import MorphologicalParser, MorphologicalParserBackup
-from onlinelinguisticdatabase.lib.foma_worker import foma_worker_q
+from onlinelinguisticdatabase.lib.foma_worker import enqueue_job
 
 log = logging.getLogger(__name__)
 
@@ -287,7 +287,7 @@ class MorphologicalparsersController(BaseController):
 
         .. note::
 
-            The script is compiled asynchronously in a worker thread.  See
+            The script is compiled asynchronously in a worker process.  See
             :mod:`onlinelinguisticdatabase.lib.foma_worker`.
 
         """
@@ -522,7 +522,7 @@ class MorphologicalparsersController(BaseController):
             #zip_file.write_directory(parser.directory)
             for file_name in os.listdir(directory):
                 if (os.path.splitext(file_name)[1] not in ('.log', '.sh', '.script', '.zip') and
-                    file_name != 'morpheme_language_model.pickle'):
+                    file_name != 'morpheme_language_model.trie'):
                     zip_file.write_file(os.path.join(directory, file_name))
             zip_file.write_directory(os.path.join(lib_path, 'simplelm'), keep_dir=True)
             zip_file.write_file(os.path.join(lib_path, 'parser.py'))
@@ -621,15 +621,13 @@ def generate_and_compile_morphological_parser(morphological_parser_id, compile_=
     if compile_ and not h.foma_installed():
         response.status_int = 400
         return {'error': 'Foma and flookup are not installed.'}
-    foma_worker_q.put({
-        'id': h.generate_salt(),
-        'func': 'generate_and_compile_parser',
-        'args': {
+    job = enqueue_job('generate_and_compile_parser', {
             'morphological_parser_id': morphological_parser.id,
             'compile': compile_,
             'user_id': session['user'].id,
             'timeout': h.morphological_parser_compile_timeout
-        }
-    })
+        }, resource=u'MorphologicalParser %s' % morphological_parser.id,
+        user_id=session['user'].id)
+    response.headers['Location'] = url('job', id=job.id)
     return morphological_parser
 
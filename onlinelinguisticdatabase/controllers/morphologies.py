@@ -27,7 +27,7 @@ from uuid import uuid4
 import codecs
 from paste.fileapp import FileApp
 from pylons.controllers.util import forward
-from pylons import request, response, session, config
+from pylons import request, response, session, config, url
 from formencode.validators import Invalid
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import MorphologySchema, MorphemeSequencesSchema
@@ -35,7 +35,7 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import Morphology, MorphologyBackup
-from onlinelinguisticdatabase.lib.foma_worker import foma_worker_q
+from onlinelinguisticdatabase.lib.foma_worker import enqueue_job
 
 log = logging.getLogger(__name__)
 
@@ -297,7 +297,7 @@ class MorphologiesController(BaseController):
 
         .. note::
 
-            The script is compiled asynchronously in a worker thread.  See
+            The script is compiled asynchronously in a worker process.  See
             :mod:`onlinelinguisticdatabase.lib.foma_worker`.
 
         """
@@ -508,15 +508,12 @@ def generate_and_compile_morphology(morphology_id, compile_=True):
     if compile_ and not h.foma_installed():
         response.status_int = 400
         return {'error': 'Foma and flookup are not installed.'}
-    foma_worker_q.put({
-        'id': h.generate_salt(),
-        'func': 'generate_and_compile_morphology',
-        'args': {
+    job = enqueue_job('generate_and_compile_morphology', {
             'morphology_id': morphology.id,
             'compile': compile_,
             'user_id': session['user'].id,
             'timeout': h.morphology_compile_timeout
-        }
-    })
+        }, resource=u'Morphology %s' % morphology.id, user_id=session['user'].id)
+    response.headers['Location'] = url('job', id=job.id)
     return morphology
 
@@ -32,6 +32,8 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder, OLDSearchParseError
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import Collection, CollectionBackup, Form
+from onlinelinguisticdatabase.model.collection import collectionreference_table
+from sqlalchemy.sql import select
 
 log = logging.getLogger(__name__)
 
@@ -78,9 +80,11 @@ class OldcollectionsController(BaseController):
         :request body: A JSON object of the form::
 
                 {"query": {"filter": [ ... ], "order_by": [ ... ]},
-                 "paginator": { ... }}
+                 "paginator": { ... }, "fields": [ ... ]}
 
-            where the ``order_by`` and ``paginator`` attributes are optional.
+            where the ``order_by``, ``paginator`` and ``fields`` attributes are
+            optional.  If present, ``fields`` is a list of the attributes of
+            the collections to be returned, e.g., ``["id", "title"]``.
 
         .. note::
         
@@ -92,10 +96,12 @@ class OldcollectionsController(BaseController):
         try:
             json_search_params = unicode(request.body, request.charset)
             python_search_params = json.loads(json_search_params)
+            fields = h.get_fields('Collection', python_search_params.get('fields'))
             SQLAQuery = h.eagerload_collection(
-                self.query_builder.get_SQLA_query(python_search_params.get('query')))
+                self.query_builder.get_SQLA_query(python_search_params.get('query')),
+                fields=fields)
             query = h.filter_restricted_models('Collection', SQLAQuery)
-            return h.add_pagination(query, python_search_params.get('paginator'))
+            return h.project(h.add_pagination(query, python_search_params.get('paginator')), fields)
         except h.JSONDecodeError:
             response.status_int = 400
             return h.JSONDecodeErrorResponse
@@ -163,14 +169,16 @@ class OldcollectionsController(BaseController):
 
         """
         try:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
             schema = CollectionSchema()
             values = json.loads(unicode(request.body, request.charset))
             collections_referenced = get_collections_referenced(values['contents'],
-                                                        user, unrestricted_users)
+                                                        user, unrestricted_user_ids)
             values = add_contents_unpacked_to_values(values, collections_referenced)
             values = add_form_ids_list_to_values(values)
+            # Load the referenced forms in one query so that the schema finds them in the session.
+            forms_referenced = get_forms_referenced(values['contents_unpacked'])
             state = h.get_state_object(values)
             data = schema.to_python(values, state)
             collection = create_new_collection(data, collections_referenced)
@@ -225,25 +233,27 @@ class OldcollectionsController(BaseController):
         collection = h.eagerload_collection(Session.query(Collection),
                                            eagerload_forms=True).get(int(id))
         if collection:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, collection, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, collection, unrestricted_user_ids):
                 try:
                     schema = CollectionSchema()
                     values = json.loads(unicode(request.body, request.charset))
                     collections_referenced = get_collections_referenced(
-                                values['contents'], user, unrestricted_users, id)
+                                values['contents'], user, unrestricted_user_ids, id)
                     values = add_contents_unpacked_to_values(values, collections_referenced)
                     values = add_form_ids_list_to_values(values)
+                    # Load the referenced forms in one query so that the schema finds them in the session.
+                    forms_referenced = get_forms_referenced(values['contents_unpacked'])
                     state = h.get_state_object(values)
                     data = schema.to_python(values, state)
-                    collection_dict = collection.get_full_dict()
+                    collection_dict = collection.get_backup_dict()
                     collection, restricted, contents_changed = update_collection(
                         collection, data, collections_referenced)
                     # collection will be False if there are no changes (cf. update_collection).
                     if collection:
                         backup_collection(collection_dict)
-                        update_collections_that_reference_this_collection(collection, self.query_builder,
+                        update_collections_that_reference_this_collection(collection,
                                             restricted=restricted, contents_changed=contents_changed)
                         Session.add(collection)
                         Session.commit()
@@ -258,7 +268,7 @@ class OldcollectionsController(BaseController):
                 except CircularCollectionReferenceError, e:
                     response.status_int = 400
                     return {'error':
-                        u'Circular collection reference error: collection %d references collection %d.' % (id, e.args[0])}
+                        u'Circular collection reference error: collection %d references collection %d.' % (int(id), e.args[0])}
                 except InvalidCollectionReferenceError, e:
                     response.status_int = 400
                     return {'error': u'Invalid collection reference error: there is no collection with id %d' % e.args[0]}
@@ -299,9 +309,8 @@ class OldcollectionsController(BaseController):
                 session['user'] = Session.merge(session['user'])
                 collection.modifier = session['user']
                 collection_dict = collection.get_full_dict()
-                backup_collection(collection_dict)
-                update_collections_that_reference_this_collection(collection,
-                                                self.query_builder, deleted=True)
+                backup_collection(collection.get_backup_dict())
+                update_collections_that_reference_this_collection(collection, deleted=True)
                 Session.delete(collection)
                 Session.commit()
                 return collection_dict
@@ -331,9 +340,9 @@ class OldcollectionsController(BaseController):
         collection = h.eagerload_collection(Session.query(Collection),
                                            eagerload_forms=True).get(id)
         if collection:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
-            if h.user_is_authorized_to_access_model(user, collection, unrestricted_users):
+            if h.user_is_authorized_to_access_model(user, collection, unrestricted_user_ids):
                 return collection.get_full_dict()
             else:
                 response.status_int = 403
@@ -373,9 +382,9 @@ class OldcollectionsController(BaseController):
         """
         collection = h.eagerload_collection(Session.query(Collection)).get(id)
         if collection:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             if h.user_is_authorized_to_access_model(
-                                session['user'], collection, unrestricted_users):
+                                session['user'], collection, unrestricted_user_ids):
                 data = get_new_edit_collection_data(request.GET)
                 return {'data': data, 'collection': collection}
             else:
@@ -406,12 +415,12 @@ class OldcollectionsController(BaseController):
         """
         collection, previous_versions = h.get_model_and_previous_versions('Collection', id)
         if collection or previous_versions:
-            unrestricted_users = h.get_unrestricted_users()
+            unrestricted_user_ids = h.get_unrestricted_user_ids()
             user = session['user']
             accessible = h.user_is_authorized_to_access_model
             unrestricted_previous_versions = [cb for cb in previous_versions
-                                    if accessible(user, cb, unrestricted_users)]
-            collection_is_restricted = collection and not accessible(user, collection, unrestricted_users)
+                                    if accessible(user, cb, unrestricted_user_ids)]
+            collection_is_restricted = collection and not accessible(user, collection, unrestricted_user_ids)
             previous_versions_are_restricted = previous_versions and not unrestricted_previous_versions
             if collection_is_restricted or previous_versions_are_restricted :
                 response.status_int = 403
@@ -431,12 +440,14 @@ class OldcollectionsController(BaseController):
 def backup_collection(collection_dict):
     """Backup a collection.
 
-    :param dict form_dict: a representation of a collection model.
+    :param dict collection_dict: a representation of a collection model, cf.
+        ``Collection.get_backup_dict``.
     :returns: ``None``
 
     """
     collection_backup = CollectionBackup()
     collection_backup.vivify(collection_dict)
+    collection_backup.compact(Session)
     Session.add(collection_backup)
 
 
@@ -453,33 +464,57 @@ def backup_collection(collection_dict):
 # collection objects, which dict is used by add_contents_unpacked_to_values, the
 # output of the latter being used to generate the list of referenced forms.
 
-def get_collections_referenced(contents, user=None, unrestricted_users=None,
-                             collection_id=None, patt=None):
+def get_collections_referenced(contents, user=None, unrestricted_user_ids=None,
+                             collection_id=None):
     """Return the collections (recursively) referenced by the input ``contents`` value.
     
     That is, return all of the collections referenced in the input ``contents``
     value, plus all of the collections referenced in those collections, etc.
+    The collections are retrieved one level of the reference graph at a time,
+    i.e., with one ``IN`` query per level.
 
     :param unicode contents: the value of the ``contents`` attribute of a collection.
     :param user: the user model who made the request.
-    :param list unrestricted_users: the unrestricted user models of the application.
+    :param set unrestricted_user_ids: the ids of the unrestricted users of the application.
     :param int collection_id: the ``id`` value of a collection.
-    :param patt: a compiled regular expression object.
     :returns: a dictionary whose keys are collection ``id`` values and whose
         values are collection models.
 
     """
-    patt = patt or re.compile(h.collection_reference_pattern)
-    collections_referenced = dict([(int(id), get_collection(int(id), user, unrestricted_users))
-                                  for id in patt.findall(contents)])
-    temp = collections_referenced.copy()
-    if collection_id in collections_referenced:
-        raise CircularCollectionReferenceError(collection_id)
-    [collections_referenced.update(get_collections_referenced(
-        collections_referenced[id].contents, user, unrestricted_users, collection_id, patt))
-     for id in temp]
+    collection_id = collection_id and int(collection_id)
+    collections_referenced = {}
+    ids = get_ids_of_collections_referenced(contents)
+    while ids:
+        if collection_id in ids:
+            raise CircularCollectionReferenceError(collection_id)
+        collections = dict([(c.id, c) for c in
+            Session.query(Collection).filter(Collection.id.in_(ids)).all()])
+        for id in ids:
+            collections_referenced[id] = check_collection(collections.get(id), id,
+                                                          user, unrestricted_user_ids)
+        ids = [id for c in collections.values()
+               for id in get_ids_of_collections_referenced(c.contents)
+               if id not in collections_referenced]
+        ids = sorted(set(ids))
     return collections_referenced
 
+def get_ids_of_collections_referenced(contents):
+    """Return the ids of the collections referenced in ``contents``, in order of first reference."""
+    ids = []
+    for id in h.collection_reference_pattern.findall(contents or u''):
+        id = int(id)
+        if id not in ids:
+            ids.append(id)
+    return ids
+
+def get_forms_referenced(contents_unpacked):
+    """Return the forms referenced in ``contents_unpacked`` (in order), retrieved with a single query."""
+    ids = h.get_ids_of_forms_referenced(contents_unpacked or u'')
+    if not ids:
+        return []
+    forms = dict([(f.id, f) for f in Session.query(Form).filter(Form.id.in_(set(ids))).all()])
+    return [forms[id] for id in ids if id in forms]
+
 def add_form_ids_list_to_values(values):
     """Add a list of referenced form ids to values.
     
@@ -488,7 +523,7 @@ def add_form_ids_list_to_values(values):
 
     """
     contents_unpacked = get_unicode('contents_unpacked', values)
-    values['forms'] = [int(id) for id in h.form_reference_pattern.findall(contents_unpacked)]
+    values['forms'] = h.get_ids_of_forms_referenced(contents_unpacked)
     return values
 
 def add_contents_unpacked_to_values(values, collections_referenced):
@@ -517,11 +552,10 @@ def get_collections_referenced_in_contents(collection, collections_referenced):
     return [collections_referenced[int(id)]
             for id in h.collection_reference_pattern.findall(collection.contents)]
 
-def update_collections_that_reference_this_collection(collection, query_builder, **kwargs):
+def update_collections_that_reference_this_collection(collection, **kwargs):
     """Update all collections that reference the input collection.
     
     :param collection: a collection model.
-    :param query_builder: an :class:`SQLAQueryBuilder` instance.
     :param bool kwargs['contents_changed']: indicates whether the input
         collection's ``contents`` value has changed.
     :param bool kwargs['deleted']: indicates whether the input collection has
@@ -562,8 +596,7 @@ def update_collections_that_reference_this_collection(collection, query_builder,
                                     collection.contents, collections_referenced)
         collection.html = h.get_HTML_from_contents(collection.contents_unpacked,
                                                   collection.markup_language)
-        collection.forms = [Session.query(Form).get(int(id)) for id in
-                    h.form_reference_pattern.findall(collection.contents_unpacked)]
+        collection.forms = get_forms_referenced(collection.contents_unpacked)
     def update_modification_values(collection, now):
         collection.datetime_modified = now
         session['user'] = Session.merge(session['user'])
@@ -573,8 +606,8 @@ def update_collections_that_reference_this_collection(collection, query_builder,
     deleted = kwargs.get('deleted', False)
     if restricted or contents_changed or deleted:
         collections_referencing_this_collection = get_collections_referencing_this_collection(
-            collection, query_builder)
-        collections_referencing_this_collection_dicts = [c.get_full_dict() for c in
+            collection)
+        collections_referencing_this_collection_dicts = [c.get_backup_dict() for c in
                                         collections_referencing_this_collection]
         now = h.now()
         if restricted:
@@ -590,24 +623,44 @@ def update_collections_that_reference_this_collection(collection, query_builder,
         Session.add_all(collections_referencing_this_collection)
         Session.commit()
 
-def get_collections_referencing_this_collection(collection, query_builder):
+def get_collections_referencing_this_collection(collection):
     """Return all collections that recursively reference ``collection``.
     
     That is, return all collections that reference ``collection`` plus all
-    collections that reference those referencing collections, etc.
+    collections that reference those referencing collections, etc.  The
+    references are looked up in the ``collectionreference`` table, one level
+    of the reference graph at a time.
     
     :param collection: a collection model object.
-    :param query_builder: an :class:`SQLAQueryBuilder` instance.
+    :returns: a list of collection models, nearest referers first.
+
+    """
+    table = collectionreference_table
+    result = []
+    ids = [collection.id]
+    seen = set(ids)
+    while ids:
+        ids = [id for (id,) in Session.execute(select([table.c.collection_id]).where(
+            table.c.referenced_collection_id.in_(ids))).fetchall() if id not in seen]
+        ids = sorted(set(ids))
+        seen.update(ids)
+        result += ids
+    if not result:
+        return []
+    collections = dict([(c.id, c) for c in
+        Session.query(Collection).filter(Collection.id.in_(result)).all()])
+    return [collections[id] for id in result if id in collections]
+
+def get_collections_referencing_this_form(form):
+    """Return the collections whose ``contents`` value directly references ``form``.
+
+    :param form: a form model object.
     :returns: a list of collection models.
 
     """
-    patt = h.collection_reference_pattern.pattern.replace(
-        '\d+', str(collection.id)).replace('\\', '')
-    query = {'filter': ['Collection', 'contents', 'regex', patt]}
-    result = query_builder.get_SQLA_query(query).all()
-    for c in result[:]:
-        result += get_collections_referencing_this_collection(c, query_builder)
-    return result
+    table = collectionreference_table
+    return Session.query(Collection).filter(Collection.id.in_(
+        select([table.c.collection_id]).where(table.c.referenced_form_id == form.id))).all()
 
 
 def update_collection_by_deletion_of_referenced_form(collection, referenced_form):
@@ -623,7 +676,7 @@ def update_collection_by_deletion_of_referenced_form(collection, referenced_form
     :returns: ``None``.
 
     """
-    collection_dict = collection.get_full_dict()
+    collection_dict = collection.get_backup_dict()
     collection.contents = remove_references_to_this_form(collection.contents, referenced_form.id)
     collections_referenced = get_collections_referenced(collection.contents)
     collection.contents_unpacked = generate_contents_unpacked(
@@ -632,8 +685,7 @@ def update_collection_by_deletion_of_referenced_form(collection, referenced_form
                                               collection.markup_language)
     collection.datetime_modified = datetime.datetime.utcnow()
     backup_collection(collection_dict)
-    update_collections_that_reference_this_collection(
-        collection, OldcollectionsController.query_builder, contents_changed=True)
+    update_collections_that_reference_this_collection(collection, contents_changed=True)
     Session.add(collection)
     Session.commit()
 
@@ -684,29 +736,50 @@ def get_contents(collection_id, collections_referenced):
                    u'contents',
                    u'Collection %d has no contents.' % collection_id)
 
-def generate_contents_unpacked(contents, collections_referenced, patt=None):
+def generate_contents_unpacked(contents, collections_referenced):
     """Generate the ``contents_unpacked`` value of a collection.
     
     :param unicode contents: the value of the ``contents`` attribute of a collection
     :param dict collections_referenced: the collection models referenced by a
         collection; keys are collection ``id`` values.
-    :param patt: a compiled regexp pattern object that matches collection references.
     :returns: a unicode object as a value for the ``contents_unpacked`` attribute
         of a collection model.
 
+    The referenced collections are unpacked iteratively (depth-first) and the
+    unpacked contents of each are computed only once, however many times it is
+    referenced.
+
     .. note::
     
-        Circular, invalid and unauthorized reference chains are caught in the
-        generation of ``collections_referenced``.
+        Invalid and unauthorized reference chains are caught in the generation
+        of ``collections_referenced``, as are circular references to the
+        collection being updated.  Other circular references raise a
+        :class:`CircularCollectionReferenceError` here.
 
     """
-    patt = patt or re.compile(h.collection_reference_pattern)
-    return patt.sub(
-        lambda m: generate_contents_unpacked(
-            get_contents(int(m.group(1)), collections_referenced),
-            collections_referenced, patt),
-        contents
-    )
+    patt = h.collection_reference_pattern
+    substitute = lambda m: unpacked[int(m.group(1))]
+    unpacked = {}   # collection id => unpacked contents
+    in_progress = set() # the collections on the path being unpacked
+    stack = get_ids_of_collections_referenced(contents)
+    while stack:
+        id = stack[-1]
+        if id in unpacked:
+            stack.pop()
+            continue
+        collection_contents = get_contents(id, collections_referenced)
+        pending = [i for i in get_ids_of_collections_referenced(collection_contents)
+                   if i not in unpacked]
+        if pending:
+            if id in in_progress or [i for i in pending if i in in_progress]:
+                raise CircularCollectionReferenceError(id)
+            in_progress.add(id)
+            stack += pending
+        else:
+            unpacked[id] = patt.sub(substitute, collection_contents)
+            in_progress.discard(id)
+            stack.pop()
+    return patt.sub(substitute, contents)
 
 # Three custom error classes to raise when collection.contents are invalid
 class CircularCollectionReferenceError(Exception):
@@ -718,28 +791,27 @@ class InvalidCollectionReferenceError(Exception):
 class UnauthorizedCollectionReferenceError(Exception):
     pass
 
-def get_collection(collection_id, user, unrestricted_users):
-    """Return the collection such that ``collection.id==collection_id``.
+def check_collection(collection, collection_id, user, unrestricted_user_ids):
+    """Return ``collection``, i.e., the collection such that ``collection.id==collection_id``.
 
-    If the collection does not exist or if ``user`` is not authorized to access
-    it, raise an appropriate error.
+    If the collection does not exist (i.e., ``collection`` is ``None``) or if
+    ``user`` is not authorized to access it, raise an appropriate error.
 
+    :param collection: a collection model object or ``None``.
     :param int collection_id: the ``id`` value of a collection.
     :param user: a user model of the logged in user.
-    :param list unrestricted_users: the unrestricted users of the system.
+    :param set unrestricted_user_ids: the ids of the unrestricted users of the system.
     :return: a collection model object.
 
     """
-    collection = Session.query(Collection).get(collection_id)
     if collection:
-        if user is None or unrestricted_users is None or \
-        h.user_is_authorized_to_access_model(user, collection, unrestricted_users):
+        if user is None or unrestricted_user_ids is None or \
+        h.user_is_authorized_to_access_model(user, collection, unrestricted_user_ids):
             return collection
         else:
             raise UnauthorizedCollectionReferenceError(collection_id)
     raise InvalidCollectionReferenceError(collection_id)
 
-
 ################################################################################
 # Get data for requests to /collections/new and /collections/{id}/edit requests
 ################################################################################
@@ -25,7 +25,7 @@ import os
 from uuid import uuid4
 from paste.fileapp import FileApp
 from pylons.controllers.util import forward
-from pylons import request, response, session, config
+from pylons import request, response, session, config, url
 from formencode.validators import Invalid
 from onlinelinguisticdatabase.lib.base import BaseController
 from onlinelinguisticdatabase.lib.schemata import PhonologySchema, MorphophonemicTranscriptionsSchema
@@ -33,7 +33,7 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import Phonology, PhonologyBackup
-from onlinelinguisticdatabase.lib.foma_worker import foma_worker_q
+from onlinelinguisticdatabase.lib.foma_worker import enqueue_job
 
 log = logging.getLogger(__name__)
 
@@ -269,22 +269,19 @@ class PhonologiesController(BaseController):
 
         .. note::
 
-            The script is compiled asynchronously in a worker thread.  See 
+            The script is compiled asynchronously in a worker process.  See 
             :mod:`onlinelinguisticdatabase.lib.foma_worker`.
 
         """
         phonology = Session.query(Phonology).get(id)
         if phonology:
             if h.foma_installed():
-                foma_worker_q.put({
-                    'id': h.generate_salt(),
-                    'func': 'compile_phonology',
-                    'args': {
+                job = enqueue_job('compile_phonology', {
                         'phonology_id': phonology.id,
                         'user_id': session['user'].id,
                         'timeout': h.phonology_compile_timeout
-                    }
-                })
+                    }, resource=u'Phonology %s' % phonology.id, user_id=session['user'].id)
+                response.headers['Location'] = url('job', id=job.id)
                 return phonology
             else:
                 response.status_int = 400
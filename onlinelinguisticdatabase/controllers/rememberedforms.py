@@ -129,9 +129,9 @@ class RememberedformsController(BaseController):
                 data = schema.to_python(values)
                 forms = [f for f in data['forms'] if f]
                 accessible = h.user_is_authorized_to_access_model
-                unrestricted_users = h.get_unrestricted_users()
+                unrestricted_user_ids = h.get_unrestricted_user_ids()
                 unrestricted_forms = [f for f in forms
-                                     if accessible(user, f, unrestricted_users)]
+                                     if accessible(user, f, unrestricted_user_ids)]
                 if set(user.remembered_forms) != set(unrestricted_forms):
                     user.remembered_forms = unrestricted_forms
                     user.datetime_modified = h.now()
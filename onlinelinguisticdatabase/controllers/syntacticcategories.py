@@ -30,7 +30,7 @@ import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.model.meta import Session
 from onlinelinguisticdatabase.model import SyntacticCategory
-from forms import update_forms_containing_this_form_as_morpheme
+from forms import update_forms_containing_these_forms_as_morphemes
 
 log = logging.getLogger(__name__)
 
@@ -276,9 +276,8 @@ def update_forms_referencing_this_category(syntactic_category):
     .. note::
     
         This function is only called when a syntactic category is deleted or
-        when its name is changed.
+        when its name is changed.  All of the category's forms are percolated
+        in a single bulk pass.
 
     """
-    forms_of_this_category = syntactic_category.forms
-    for form in forms_of_this_category:
-        update_forms_containing_this_form_as_morpheme(form)
+    update_forms_containing_these_forms_as_morphemes(syntactic_category.forms)
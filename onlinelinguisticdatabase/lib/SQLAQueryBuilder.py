@@ -117,7 +117,9 @@ return all forms whose enterer has remembered a form with a transcription like '
 
 import logging
 import datetime
-from sqlalchemy.sql import or_, and_, not_, asc, desc
+import threading
+from collections import OrderedDict
+from sqlalchemy.sql import or_, and_, not_, asc, desc, bindparam
 from sqlalchemy.exc import OperationalError, InvalidRequestError
 from sqlalchemy.sql.expression import collate
 from sqlalchemy.orm import aliased
@@ -135,6 +137,9 @@ except ImportError:
 try:
     import onlinelinguisticdatabase.model as old_model
     from onlinelinguisticdatabase.model.meta import Session
+    from onlinelinguisticdatabase.model.formtrigram import trigram_index_is_enabled, \
+        trigram_index_is_built, get_trigram_indexed_attribute, get_pattern_trigrams, \
+        get_trigram_filter_expression
 except ImportError:
     pass
 
@@ -181,6 +186,67 @@ class OLDSearchParseError(Exception):
         return self.errors
 
 
+class CompiledQueryCache(object):
+    """A least-recently-used cache of the SQLAlchemy constructs built from
+    search queries by :class:`SQLAQueryBuilder`.
+
+    Entries are keyed by the structure of a query, i.e., the query with the
+    values of its filter expressions replaced by their types.  Each entry holds
+    the filter expression (whose values are bind parameters), the order by
+    expression, the joins and a description of each value ("slot") needed to
+    bind new values to the expression.
+
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+compiled_query_cache = CompiledQueryCache()
+
+
+class ParseState(threading.local):
+    """The state of the query being built by an :class:`SQLAQueryBuilder`.
+    Builders are shared by the threads serving requests (e.g., they are class
+    attributes of the controllers), so each thread has its own state.
+
+    """
+
+    def __init__(self):
+        self.errors = {}
+        self.joins = []
+        self.slots = None   # Describes the values of the filter expression being built, cf. _lift_value
+        self.negations = 0  # The number of 'not' expressions enclosing the filter expression being built
+        self.trigram_index_ready = False    # Whether like and regexp searches can use the trigram index
+
+
+def parse_state_property(name):
+    """Return a property that gets and sets the ``name`` attribute of the
+    thread's :class:`ParseState` of a builder.
+
+    """
+    return property(lambda self: getattr(self.parse_state, name),
+                    lambda self, value: setattr(self.parse_state, name, value))
+
+
 class SQLAQueryBuilder(object):
     """Generate an SQLAlchemy query object from a Python dictionary.
     
@@ -202,18 +268,40 @@ class SQLAQueryBuilder(object):
 
     """
 
+    errors = parse_state_property('errors')
+    joins = parse_state_property('joins')
+    slots = parse_state_property('slots')
+    negations = parse_state_property('negations')
+    trigram_index_ready = parse_state_property('trigram_index_ready')
+
     def __init__(self, model_name='Form', primary_key='id', **kwargs):
-        self.errors = {}
-        self.joins = []
+        self.parse_state = ParseState()   # The errors, joins, etc. of the query being built by each thread
         self.model_name = model_name  # The name of the target model, i.e., the one we are querying, e.g., 'Form'
         self.primary_key = primary_key    # Some models have a primary key other than 'id' ...
         self.RDBMSName = get_RDBMS_name(**kwargs) # i.e., mysql or sqlite
 
     def get_SQLA_query(self, python):
         self.clear_errors()
-        filter_expression = self.get_SQLA_filter(python.get('filter'))
-        order_by_expression = self._get_SQLA_order_by(python.get('order_by'), self.primary_key)
+        self.joins = []
+        self.trigram_index_ready = self._trigram_index_is_ready()
+        leaves = self._get_leaves(python.get('filter'))
+        key = self._get_cache_key(python, leaves)
+        query = self._get_cached_SQLA_query(key, leaves)
+        if query is not None:
+            self.trigram_index_ready = False
+            return query
+        self.slots = key and []
+        try:
+            filter_expression = self.get_SQLA_filter(python.get('filter'))
+            order_by_expression = self._get_SQLA_order_by(python.get('order_by'), self.primary_key)
+            slots = self.slots
+        finally:
+            self.slots = None
+            self.trigram_index_ready = False
         self._raise_search_parse_error_if_necessary()
+        if key and len(slots) == len(leaves):
+            compiled_query_cache.set(key, (filter_expression, order_by_expression,
+                                           tuple(self.joins), tuple(slots)))
         query = self._get_base_query()
         query = query.filter(filter_expression)
         query = query.order_by(order_by_expression)
@@ -245,7 +333,7 @@ class SQLAQueryBuilder(object):
             model_name = self._get_model_name(order_by[0])
             attribute_name = self._get_attribute_name(order_by[1], model_name)
             model = self._get_model(model_name)
-            attribute = getattr(model, attribute_name)
+            attribute = getattr(model, self._get_search_attribute_name(attribute_name, model_name))
             if self.RDBMSName == 'sqlite' and attribute is not None and \
             isinstance(attribute.property.columns[0].type, self.SQLAlchemyStringTypes):
                 attribute = collate(attribute, 'NOCASE')    # Force SQLite to order case-insensitively
@@ -276,6 +364,179 @@ class SQLAQueryBuilder(object):
         self.joins = []
         return query
 
+    ############################################################################
+    # Compiled query cache
+    ############################################################################
+    # Repeated searches (including saved form searches and the searches that
+    # define corpora) do not need to be re-parsed: the filter expression built
+    # for a query is cached under a key that encodes the query's structure and
+    # the values of its filter expressions are lifted into bind parameters so
+    # that the cached expression can be reused with other values.
+
+    def _get_leaves(self, python):
+        """Return the list of simple filter expressions (e.g., ['Form', 'id', '=', 1])
+        of a filter expression, in the order in which _python2sqla visits them,
+        or ``None`` if the filter expression is malformed.
+
+        """
+        leaves = []
+        def visit(python):
+            if python[0] in ('and', 'or'):
+                for x in python[1]:
+                    visit(x)
+            elif python[0] == 'not':
+                visit(python[1])
+            else:
+                if not isinstance(python, list) or len(python) not in (4, 5):
+                    raise TypeError
+                leaves.append(python)
+        try:
+            visit(python)
+        except Exception:
+            return None
+        return leaves
+
+    def _get_value_signature(self, value):
+        if isinstance(value, list):
+            return ['list'] + [self._get_value_signature(v) for v in value]
+        if value is None or isinstance(value, (bool, int, long, float, basestring)):
+            return type(value).__name__
+        return repr(value)
+
+    def _get_cache_key(self, python, leaves):
+        """Return a string that identifies the structure of ``python``, i.e.,
+        ``python`` with the values of its simple filter expressions replaced by
+        their types, or ``None`` if the query cannot be cached.
+
+        """
+        if leaves is None:
+            return None
+        try:
+            skeleton = self._replace_values(python.get('filter'), iter(range(len(leaves))))
+            return json.dumps([self.model_name, self.primary_key, self.RDBMSName, skeleton,
+                python.get('order_by'), [self._get_value_signature(leaf[-1]) for leaf in leaves],
+                self.trigram_index_ready and [self._has_pattern_trigrams(leaf) for leaf in leaves]],
+                sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+    def _has_pattern_trigrams(self, leaf):
+        """Return whether the value of ``leaf`` may be a pattern whose trigrams
+        restrict the search (cf. _get_trigram_filter), in which case it is not
+        lifted into a bind parameter.
+
+        """
+        relation_name = {'regex': 'regexp'}.get(leaf[-2], leaf[-2])
+        return bool(get_pattern_trigrams(self._normalize(leaf[-1]), relation_name))
+
+    def _replace_values(self, python, slot_indices):
+        """Return a copy of the filter expression ``python`` whose values are replaced by slot indices."""
+        if python[0] in ('and', 'or'):
+            return [python[0], [self._replace_values(x, slot_indices) for x in python[1]]]
+        elif python[0] == 'not':
+            return [python[0], self._replace_values(python[1], slot_indices)]
+        return python[:-1] + [{'slot': slot_indices.next()}]
+
+    def _get_cached_SQLA_query(self, key, leaves):
+        """Return a query built from the cached constructs for ``key`` with the
+        values of ``leaves`` bound to them, or ``None`` if there are no such
+        constructs or if a value is invalid (in which case the query is parsed
+        so that the usual errors are generated).
+
+        """
+        entry = key and compiled_query_cache.get(key)
+        if not entry:
+            return None
+        filter_expression, order_by_expression, joins, slots = entry
+        params = {}
+        for index, (leaf, slot) in enumerate(zip(leaves, slots)):
+            raw_value = leaf[-1]
+            if slot[0] == 'literal':
+                if raw_value != slot[1]:
+                    return None
+                continue
+            value = self._get_value(raw_value, *slot[1])
+            if slot[0] == 'list':
+                params.update([(self._get_bind_name(index, i), v) for i, v in enumerate(value)])
+            else:
+                params[self._get_bind_name(index)] = value
+        if self.errors:
+            self.clear_errors()
+            return None
+        query = self._get_base_query()
+        query = query.filter(filter_expression)
+        query = query.order_by(order_by_expression)
+        for join in joins:
+            query = query.outerjoin(join[0], join[1])
+        return query.params(**params)
+
+    def _get_bind_name(self, slot_index, list_index=None):
+        if list_index is None:
+            return 'search_value_%d' % slot_index
+        return 'search_value_%d_%d' % (slot_index, list_index)
+
+    lifted_value_types = (basestring, int, long, float, datetime.date)
+
+    def _lift_value(self, value, raw_value, value_args, attribute_dict, liftable=True):
+        """Return ``value`` as a bind parameter (or a list of them, for ``in_``
+        relations) and record how to re-compute it from ``raw_value`` in
+        ``self.slots``.  Values of relational attributes, values of unexpected
+        types (e.g., ``None``) and values that are not ``liftable`` (e.g.,
+        patterns whose trigrams restrict the search) remain literals, i.e.,
+        they are part of the cached entry and must match exactly for it to be
+        reused.
+
+        """
+        if self.slots is None:
+            return value
+        index = len(self.slots)
+        relation_name = value_args[2]
+        is_column = liftable and attribute_dict is not None and not attribute_dict.get('foreign_model')
+        if is_column and relation_name == 'in_' and isinstance(value, list) and \
+            not [v for v in value if not isinstance(v, self.lifted_value_types) or isinstance(v, bool)]:
+            self.slots.append(('list', value_args))
+            return [bindparam(self._get_bind_name(index, i), v) for i, v in enumerate(value)]
+        if is_column and relation_name != 'in_' and isinstance(value, self.lifted_value_types) and \
+            not isinstance(value, bool):
+            self.slots.append(('scalar', value_args))
+            return bindparam(self._get_bind_name(index), value)
+        self.slots.append(('literal', raw_value))
+        return value
+
+    ############################################################################
+    # Trigram index
+    ############################################################################
+    # Like and regexp searches on the attributes covered by the trigram index
+    # (cf. model/formtrigram.py) are restricted to the forms that contain the
+    # trigrams of their patterns; the original predicate verifies them.  The
+    # restriction is not applied within 'not' expressions, where it would not
+    # reduce the rows scanned (and would change how NULL values are treated).
+
+    def _trigram_index_is_ready(self):
+        return self.model_name == 'Form' and trigram_index_is_enabled() and \
+            trigram_index_is_built(Session)
+
+    def _get_trigram_filter(self, value, model_name, attribute_name, relation_name):
+        """Return an expression restricting the forms searched to those that
+        contain the trigrams of the like or regexp pattern ``value``, or
+        ``None`` if the trigram index cannot be used.
+
+        """
+        if not self.trigram_index_ready or self.negations or relation_name not in ('like', 'regexp'):
+            return None
+        indexed_attribute = get_trigram_indexed_attribute(model_name, attribute_name)
+        if indexed_attribute is None:
+            return None
+        trigrams = get_pattern_trigrams(value, relation_name)
+        if not trigrams:
+            return None
+        return get_trigram_filter_expression(old_model.Form.id, indexed_attribute, trigrams)
+
+    def _add_trigram_filter(self, trigram_filter, filter_expression):
+        if trigram_filter is None or filter_expression is None:
+            return filter_expression
+        return and_(trigram_filter, filter_expression)
+
     def _python2sqla(self, python):
         """This is the function that is called recursively (if necessary) to
         build the SQLAlchemy filter expression.
@@ -285,7 +546,11 @@ class SQLAQueryBuilder(object):
                 return {'and': and_, 'or': or_}[python[0]](
                     *[self._python2sqla(x) for x in python[1]])
             elif python[0] == 'not':
-                return not_(self._python2sqla(python[1]))
+                self.negations += 1
+                try:
+                    return not_(self._python2sqla(python[1]))
+                finally:
+                    self.negations -= 1
             else:
                 return self._get_simple_filter_expression(*python)
         except TypeError, e:
@@ -495,28 +760,28 @@ class SQLAQueryBuilder(object):
             'narrow_phonetic_transcription': {},
             'morpheme_break': {},
             'morpheme_gloss': {},
-            'comments': {},
-            'speaker_comments': {},
+            'comments': {'search_attribute': 'reconstructed_comments'},
+            'speaker_comments': {'search_attribute': 'reconstructed_speaker_comments'},
             'grammaticality': {},
             'date_elicited': {'value_converter': '_get_date_value'},
             'datetime_entered': {'value_converter': '_get_datetime_value'},
             'datetime_modified': {'value_converter': '_get_datetime_value'},
             'syntactic_category_string': {},
-            'morpheme_break_ids': {},
-            'morpheme_gloss_ids': {},
+            'morpheme_break_ids': {'search_attribute': 'reconstructed_morpheme_break_ids'},
+            'morpheme_gloss_ids': {'search_attribute': 'reconstructed_morpheme_gloss_ids'},
             'break_gloss_category': {},
             'syntax': {},
             'semantics': {},
-            'elicitor': {},
+            'elicitor': {'search_attribute': 'reconstructed_elicitor'},
             'enterer': {},
-            'verifier': {},
-            'speaker': {},
-            'elicitation_method': {},
-            'syntactic_category': {},
-            'source': {},
-            'translations': {},
-            'tags': {},
-            'files': {},
+            'verifier': {'search_attribute': 'reconstructed_verifier'},
+            'speaker': {'search_attribute': 'reconstructed_speaker'},
+            'elicitation_method': {'search_attribute': 'reconstructed_elicitation_method'},
+            'syntactic_category': {'search_attribute': 'reconstructed_syntactic_category'},
+            'source': {'search_attribute': 'reconstructed_source'},
+            'translations': {'search_attribute': 'reconstructed_translations'},
+            'tags': {'search_attribute': 'reconstructed_tags'},
+            'files': {'search_attribute': 'reconstructed_files'},
             'collections': {}
         },
         'FormSearch': {
@@ -556,6 +821,20 @@ class SQLAQueryBuilder(object):
             'grammaticality': {},
             'datetime_modified': {'value_converter': '_get_datetime_value'}
         },
+        'Job': {
+            'id': {},
+            'func': {},
+            'resource': {},
+            'status': {},
+            'progress': {},
+            'message': {},
+            'worker': {},
+            'enterer': {'foreign_model': 'User', 'type': 'scalar'},
+            'datetime_entered': {'value_converter': '_get_datetime_value'},
+            'datetime_started': {'value_converter': '_get_datetime_value'},
+            'datetime_finished': {'value_converter': '_get_datetime_value'},
+            'datetime_modified': {'value_converter': '_get_datetime_value'}
+        },
         'Language': {
             'Id': {},
             'Part2B': {},
@@ -898,9 +1177,18 @@ class SQLAQueryBuilder(object):
                 u'Searching on %s.%s is not permitted' % (model_name, attribute_name))
         return attribute_dict
 
+    def _get_search_attribute_name(self, attribute_name, model_name):
+        """Return the name of the mapped attribute that searches on
+        attribute_name use, i.e., that of its ``search_attribute``, if any (cf.
+        the delta attributes of FormBackup).
+        """
+        attribute_dict = self._get_attribute_dict(attribute_name, model_name) or {}
+        return attribute_dict.get('search_attribute', attribute_name)
+
     def _get_attribute(self, attribute_name, model, model_name):
         try:
-            attribute = self._collate_attribute(getattr(model, attribute_name))
+            attribute = self._collate_attribute(getattr(model,
+                self._get_search_attribute_name(attribute_name, model_name)))
         except AttributeError:  # model can be None
             attribute = None
             self._add_to_errors('%s.%s' % (model_name, attribute_name),
@@ -1114,18 +1402,29 @@ class SQLAQueryBuilder(object):
             model = self._get_model(model_name)
             relation_name = self._get_relation_name(args[2], model_name, attribute_name)
             value = self._get_value(args[3], model_name, attribute_name, relation_name)
+            trigram_filter = self._get_trigram_filter(value, model_name, attribute_name, relation_name)
+            value = self._lift_value(value, args[3], (model_name, attribute_name, relation_name),
+                                     self._get_attribute_dict(attribute_name, model_name),
+                                     trigram_filter is None)
             attribute = self._get_attribute(attribute_name, model, model_name)
             relation = self._get_relation(relation_name, attribute, attribute_name, model_name)
-            return self._get_filter_expression(relation, value, model_name, attribute_name, relation_name)
+            return self._add_trigram_filter(trigram_filter, self._get_filter_expression(
+                relation, value, model_name, attribute_name, relation_name))
         else:
             attribute_model_name = self._get_attribute_model_name(attribute_name, model_name)
             attribute_model_attribute_name = self._get_attribute_name(args[2], attribute_model_name)
             relation_name = self._get_relation_name(args[3], attribute_model_name, attribute_model_attribute_name)
             value = self._get_value(args[4], attribute_model_name, attribute_model_attribute_name, relation_name)
+            trigram_filter = self._get_trigram_filter(value, attribute_model_name,
+                                                      attribute_model_attribute_name, relation_name)
+            value = self._lift_value(value, args[4], (attribute_model_name, attribute_model_attribute_name, relation_name),
+                                     self._get_attribute_dict(attribute_model_attribute_name, attribute_model_name),
+                                     trigram_filter is None)
             model = self._get_model(model_name, False)
             attribute = self._get_attribute(attribute_name, model, model_name)
             attribute_model = self._get_model(attribute_model_name, False)
             attribute_model_attribute = self._get_attribute(attribute_model_attribute_name, attribute_model, attribute_model_name)
             relation = self._get_relation(relation_name, attribute_model_attribute, attribute_model_attribute_name, attribute_model_name)
-            return self._get_filter_expression(relation, value, model_name, attribute_name, relation_name,
-                                             attribute, attribute_model_name, attribute_model_attribute_name)
+            return self._add_trigram_filter(trigram_filter, self._get_filter_expression(
+                relation, value, model_name, attribute_name, relation_name,
+                attribute, attribute_model_name, attribute_model_attribute_name))
@@ -35,9 +35,12 @@ class BaseController(WSGIController):
         # the request is routed to. This routing information is
         # available in environ['pylons.routes_dict']
         # environ['paste.content_type'] = 'application/json'
+        # Check the application settings snapshot against the db at most once per request.
+        h.application_settings_cache.begin_request()
         try:
             return WSGIController.__call__(self, environ, start_response)
         finally:
+            h.application_settings_cache.end_request()
             Session.remove()
 
 
@@ -12,37 +12,47 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-"""This module contains some multithreading worker and queue logic plus the functionality -- related
-to foma compilation ang LM estimation -- that the worther thread initiates.
+"""This module contains the job queue and worker logic plus the functionality -- related
+to foma compilation and LM estimation -- that the workers run.
 
-The the foma worker compiles foma FST phonology, morphology and morphophonology scripts
-and estimates morpheme language models.  Having a worker perform these tasks in a separate
-thread from that processing the HTTP request allows us to immediately respond to the user.
+The workers compile foma FST phonology, morphology and morphophonology scripts and
+estimate and evaluate morpheme language models.  Having workers perform these tasks
+in separate processes allows us to immediately respond to the user and to run several
+such tasks at once.
 
-The foma worker can only run a callable that is a global in
+A task is requested by creating a :class:`Job` model via ``enqueue_job``.  Jobs are
+stored in the database, so queued jobs survive a restart of the application.  A
+dispatcher thread (started in :mod:`onlinelinguisticdatabase.config.environment.py`)
+runs each queued job in its own worker process, with at most ``job_workers`` (a
+config setting) running at any one time.  Jobs with the same ``resource`` value are
+run one at a time and in the order in which they were requested, so that, e.g., two
+compile requests on the same parser never race.  The status and progress of a job
+can be retrieved via ``GET /jobs/id``.  While a job runs, its dispatcher updates its
+``datetime_modified`` value every poll; a running job whose value is older than
+``job_stale_timeout`` seconds (a config setting) is requeued by any dispatcher,
+so that the jobs of a host that went down do not block their resources forever.
+
+A job can only run a callable that is a global in
 :mod:`onlinelinguisticdatabase.lib.foma_worker` and which takes keyword arguments.
 Example usage::
 
-    from onlinelinguisticdatabase.lib.foma_worker import foma_worker_q
-    foma_worker_q.put({
-        'id': h.generate_salt(),
-        'func': 'compile_foma_script',
-        'args': {'model_name': u'Phonology', 'model_id': phonology.id,
-            'script_dir_path': phonology_dir_path, 'user_id': session['user'].id,
-            'verification_string': u'defined phonology: ', 'timeout': h.phonology_compile_timeout}
-    })
-
-Cf. http://www.chrismoos.com/2009/03/04/pylons-worker-threads.
-
-For an introduction to Python threading, see
-http://www.ibm.com/developerworks/aix/library/au-threadingpython/.
+    from onlinelinguisticdatabase.lib.foma_worker import enqueue_job
+    job = enqueue_job('compile_phonology',
+        {'phonology_id': phonology.id, 'user_id': session['user'].id,
+            'timeout': h.phonology_compile_timeout},
+        resource=u'Phonology %s' % phonology.id, user_id=session['user'].id)
 
 """
 
-import Queue
+import os
+import socket
+import datetime
 import threading
+import multiprocessing
 import logging
+import simplejson as json
 from uuid import uuid4
+from sqlalchemy.sql import and_, or_, select, exists
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.model as model
@@ -50,29 +60,267 @@ import onlinelinguisticdatabase.model as model
 log = logging.getLogger(__name__)
 
 ################################################################################
-# WORKER THREAD & QUEUE
+# JOB QUEUE & WORKER PROCESSES
 ################################################################################
 
-foma_worker_q = Queue.Queue(1)
+def enqueue_job(func, args, resource=None, user_id=None):
+    """Create a queued job that will run ``func(**args)`` in a worker process.
+
+    If an identical job (same function, arguments and resource) is already
+    queued, that job is returned instead of a new one.
+
+    :param str func: the name of a global function of this module.
+    :param dict args: the keyword arguments of ``func``; must be JSON-serializable.
+    :param unicode resource: identifies the resource the job operates on; jobs
+        on the same resource are run serially.
+    :param int user_id: the ``id`` value of the user requesting the job.
+    :returns: the :class:`Job` model.
 
-class FomaWorkerThread(threading.Thread):
-    """Define the foma worker.
     """
+    args = unicode(json.dumps(args, sort_keys=True))
+    job = Session.query(model.Job).filter(and_(
+        model.Job.status == u'queued', model.Job.func == func,
+        model.Job.resource == resource, model.Job.args == args)).first()
+    if job is None:
+        job = model.Job()
+        job.func = unicode(func)
+        job.args = args
+        job.resource = resource
+        job.status = u'queued'
+        job.progress = 0
+        job.enterer_id = user_id
+        job.datetime_entered = job.datetime_modified = h.now()
+        Session.add(job)
+        Session.commit()
+    if job_dispatcher is not None:
+        job_dispatcher.wakeup.set()
+    return job
+
+def get_worker_name(pid=None):
+    return u'%s:%s' % (socket.gethostname(), pid or os.getpid())
+
+def pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+job_table = model.Job.__table__
+current_job_id = None
+
+def set_job_progress(progress, message=None):
+    """Record the progress (percent complete) of the job being run by this worker process.
+
+    The update is made on its own connection so that it does not commit the
+    changes the job has made in the session.
+
+    """
+    if current_job_id is None:
+        return
+    values = {'progress': progress, 'datetime_modified': h.now()}
+    if message is not None:
+        values['message'] = message
+    try:
+        job_dispatcher.engine.execute(
+            job_table.update().where(job_table.c.id == current_job_id).values(**values))
+    except Exception, e:
+        log.warn('Unable to record the progress of job %s: %s' % (current_job_id, e))
+
+def run_job(job_id, engine):
+    """Run a job; this is the target of each worker process."""
+    global current_job_id
+    # Connections inherited from the parent process must not be used (or closed) here.
+    engine.pool = engine.pool.recreate()
+    if Session.registry.has():
+        Session.registry.clear()
+    current_job_id = job_id
+    job = Session.query(model.Job).get(job_id)
+    func, args = job.func, json.loads(job.args)
+    Session.remove()
+    try:
+        globals()[func](**args)
+    except Exception, e:
+        log.warn('Unable to process job %s (%s): %s' % (job_id, func, e))
+        Session.rollback()
+        status, message = u'failed', unicode(e)
+    else:
+        status, message = u'succeeded', None
+    values = {'status': status, 'datetime_finished': h.now(), 'datetime_modified': h.now()}
+    if status == u'succeeded':
+        values['progress'] = 100
+    if message is not None:
+        values['message'] = message
+    # The job may have been requeued (and claimed by another worker) if this
+    # worker's dispatcher failed to record its heartbeat, cf. JobDispatcher.recover.
+    engine.execute(job_table.update().where(and_(
+        job_table.c.id == job_id, job_table.c.status == u'running',
+        job_table.c.worker.in_([get_worker_name(), get_worker_name(os.getppid())]))).values(**values))
+    Session.remove()
+
+class JobDispatcher(threading.Thread):
+    """Start a worker process for each queued job, respecting the worker limit
+    and the one-job-per-resource constraint, and record the fate of workers
+    that die without reporting back.
+
+    """
+
+    def __init__(self, engine, max_workers=4, poll_interval=5, stale_timeout=300):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.engine = engine
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.stale_timeout = max(stale_timeout, 2 * poll_interval)
+        self.wakeup = threading.Event()
+        self.processes = {}     # job id => multiprocessing.Process
+
     def run(self):
         while True:
-            msg = foma_worker_q.get()
             try:
-                globals()[msg.get('func')](**msg.get('args'))
+                self.recover()
             except Exception, e:
-                log.warn('Unable to process in worker thread: %s' % e)
-            foma_worker_q.task_done()
+                log.warn('Unable to recover interrupted jobs: %s' % e)
+                Session.rollback()
+            try:
+                self.heartbeat()
+                self.reap()
+                self.dispatch()
+            except Exception, e:
+                log.warn('Error in job dispatcher: %s' % e)
+                Session.rollback()
+            finally:
+                Session.remove()
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def recover(self):
+        """Requeue the running jobs whose worker processes no longer exist: those
+        of this host whose processes are gone (e.g., because the application was
+        restarted while they were running) and those of any host whose
+        ``datetime_modified`` value is more than ``stale_timeout`` seconds old
+        (e.g., because their host went down).  Requeued jobs keep their ids and
+        so are the first of their resources to be run again, cf.
+        ``get_resource_is_free_condition``.  The clocks of the hosts are assumed
+        to differ by much less than ``stale_timeout`` seconds.
+
+        """
+        hostname = socket.gethostname()
+        dead = []
+        for job_id, worker in Session.query(model.Job.id, model.Job.worker).filter(
+                model.Job.status == u'running').all():
+            host, _, pid = (worker or u'').rpartition(u':')
+            if job_id not in self.processes and host == hostname and pid.isdigit() and \
+                not pid_is_alive(int(pid)):
+                dead.append(job_id)
+        Session.commit()
+        requeue = job_table.update().values(status=u'queued', progress=0, worker=None,
+                                            datetime_modified=h.now())
+        if dead:
+            self.engine.execute(requeue.where(and_(
+                job_table.c.id.in_(dead), job_table.c.status == u'running')))
+        cutoff = h.now() - datetime.timedelta(seconds=self.stale_timeout)
+        self.engine.execute(requeue.where(and_(
+            job_table.c.status == u'running', job_table.c.datetime_modified < cutoff)))
+
+    def get_worker_names(self, job_id):
+        """Return the names the worker of a job claimed by this dispatcher may have, cf. ``dispatch``."""
+        names = [get_worker_name()]
+        process = self.processes.get(job_id)
+        if process is not None and process.pid is not None:
+            names.append(get_worker_name(process.pid))
+        return names
+
+    def heartbeat(self):
+        """Update the ``datetime_modified`` values of the jobs run by this
+        dispatcher's worker processes, so that other dispatchers do not take
+        them to be orphaned, cf. ``recover``.
+
+        """
+        for job_id, process in self.processes.items():
+            if process.is_alive():
+                self.engine.execute(job_table.update().where(and_(
+                    job_table.c.id == job_id, job_table.c.status == u'running',
+                    job_table.c.worker.in_(self.get_worker_names(job_id)))).values(
+                    datetime_modified=h.now()))
+
+    def reap(self):
+        """Join finished worker processes and fail the jobs of those that exited without reporting."""
+        for job_id, process in self.processes.items():
+            if process.is_alive():
+                continue
+            process.join()
+            worker_names = self.get_worker_names(job_id)
+            del self.processes[job_id]
+            self.engine.execute(job_table.update().where(and_(
+                job_table.c.id == job_id, job_table.c.status == u'running',
+                job_table.c.worker.in_(worker_names))).values(
+                status=u'failed', datetime_finished=h.now(), datetime_modified=h.now(),
+                message=u'The worker process exited unexpectedly (exit code %s).' % process.exitcode))
+
+    def dispatch(self):
+        """Claim and start queued jobs while worker slots are free."""
+        free = self.max_workers - len(self.processes)
+        if free <= 0:
+            return
+        busy_resources = set(r for (r,) in Session.query(model.Job.resource).filter(
+            model.Job.status == u'running').all())
+        queued = Session.query(model.Job.id, model.Job.resource).filter(
+            model.Job.status == u'queued').order_by(model.Job.id).all()
+        Session.commit()
+        for job_id, resource in queued:
+            if free <= 0:
+                break
+            if resource is not None:
+                if resource in busy_resources:
+                    continue
+                busy_resources.add(resource)
+            # The status condition makes the claim atomic across application
+            # processes and the resource condition serializes the jobs of a
+            # resource across them, cf. get_resource_is_free_condition.
+            condition = and_(job_table.c.id == job_id, job_table.c.status == u'queued')
+            if resource is not None:
+                condition = and_(condition, get_resource_is_free_condition(job_id, resource))
+            claimed = self.engine.execute(job_table.update().where(condition).values(
+                status=u'running', worker=get_worker_name(), datetime_started=h.now(),
+                datetime_modified=h.now())).rowcount
+            if not claimed:
+                continue
+            process = multiprocessing.Process(target=run_job, args=(job_id, self.engine))
+            process.daemon = False
+            process.start()
+            self.engine.execute(job_table.update().where(job_table.c.id == job_id).values(
+                worker=get_worker_name(process.pid)))
+            self.processes[job_id] = process
+            free -= 1
+
+def get_resource_is_free_condition(job_id, resource):
+    """Return a condition that holds if no other job of ``resource`` is running
+    or was queued before the job with id ``job_id``.  Since the earliest
+    unfinished job of a resource is either queued or running in any snapshot of
+    the table, two processes can never both claim jobs of the same resource.
+    The other jobs are selected from a (limited) derived table because MySQL
+    does not let the subquery of an UPDATE read the updated table directly.
+
+    """
+    other = job_table.alias()
+    blocking = select([other.c.id]).where(and_(
+        other.c.resource == resource, other.c.id != job_id,
+        or_(other.c.status == u'running',
+            and_(other.c.status == u'queued', other.c.id < job_id)))).limit(1).alias()
+    return ~exists(select([blocking.c.id]))
+
+job_dispatcher = None
 
-def start_foma_worker():
-    """Called in :mod:`onlinelinguisticdatabase.config.environment.py`.
+def start_foma_worker(engine, max_workers=None, poll_interval=None, stale_timeout=None):
+    """Start the job dispatcher.  Called in :mod:`onlinelinguisticdatabase.config.environment.py`.
     """
-    foma_worker = FomaWorkerThread()
-    foma_worker.setDaemon(True)
-    foma_worker.start()
+    global job_dispatcher
+    if job_dispatcher is None:
+        job_dispatcher = JobDispatcher(engine, int(max_workers or 4), float(poll_interval or 5),
+                                       float(stale_timeout or 300))
+        job_dispatcher.start()
+    return job_dispatcher
 
 ################################################################################
 # PHONOLOGY
@@ -82,6 +330,7 @@ def compile_phonology(**kwargs):
     """Compile the foma script of a phonology and save it to the db with values that indicating compilation success.
     """
     phonology = Session.query(model.Phonology).get(kwargs['phonology_id'])
+    set_job_progress(10, u'Compiling the phonology.')
     phonology.compile(kwargs['timeout'])
     phonology.datetime_modified = h.now()
     phonology.modifier_id = kwargs['user_id']
@@ -102,12 +351,14 @@ def generate_and_compile_morphology(**kwargs):
     """
     morphology = Session.query(model.Morphology).get(kwargs['morphology_id'])
     unknown_category = h.unknown_category
+    set_job_progress(10, u'Writing the morphology script.')
     try:
         morphology.write(unknown_category)
     except Exception, e:
         log.warn(e)
         pass
     if kwargs.get('compile', True):
+        set_job_progress(50, u'Compiling the morphology.')
         try:
             morphology.compile(kwargs['timeout'])
         except Exception, e:
@@ -136,18 +387,22 @@ def generate_language_model(**kwargs):
     trie_path = lm.get_file_path('trie')
     trie_mod_time = lm.get_modification_time(trie_path)
     lm.generate_succeeded = False
+    set_job_progress(10, u'Writing the corpus file.')
     try:
         lm.write_corpus()
     except Exception:
         lm.generate_message = u'Error writing the corpus file.'
+    set_job_progress(30, u'Writing the vocabulary file.')
     try:
         lm.write_vocabulary()
     except Exception:
         lm.generate_message = u'Error writing the vocabulary file.'
+    set_job_progress(40, u'Writing the ARPA file.')
     try:
         lm.write_arpa(kwargs['timeout'])
     except Exception:
         lm.generate_message = u'Error writing the ARPA file.'
+    set_job_progress(80, u'Generating the trie.')
     try:
         lm.generate_trie()
     except Exception, e:
@@ -169,6 +424,7 @@ def compute_perplexity(**kwargs):
     lm = Session.query(model.MorphemeLanguageModel).get(kwargs['morpheme_language_model_id'])
     timeout = kwargs['timeout']
     iterations = 5
+    set_job_progress(10, u'Computing the perplexity.')
     try:
         lm.perplexity = lm.compute_perplexity(timeout, iterations)
     except Exception:
@@ -193,8 +449,10 @@ def generate_and_compile_parser(**kwargs):
     """
     parser = Session.query(model.MorphologicalParser).get(kwargs['morphological_parser_id'])
     parser.changed = False
+    set_job_progress(10, u'Writing the morphophonology script.')
     parser.write()
     if kwargs.get('compile', True):
+        set_job_progress(50, u'Compiling the morphophonology.')
         parser.compile(kwargs['timeout'])
     parser.modifier_id = kwargs['user_id']
     parser.datetime_modified = h.now()
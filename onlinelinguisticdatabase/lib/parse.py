@@ -23,7 +23,7 @@ Usage:
 This script is intended to be included in the .zip archive returned by an OLD application
 when GET /morphologicalparsers/id/export is requested on the fully generated and 
 compiled morphological parser with id ``id``.  It expects all requisite files for the parser
-and its sub-objects (e.g., the compiled morphophonology foma script, the pickled LM Trie, the
+and its sub-objects (e.g., the compiled morphophonology foma script, the compact LM trie, the
 lexicon and dictionary pickle files, if needed, etc.) as well as a configuration pickle file
 (i.e., config.pickle) to be present in the current working directory.
 
@@ -45,6 +45,8 @@ from uuid import uuid4
 from subprocess import Popen, PIPE
 from itertools import product
 import threading
+import time
+import atexit
 from signal import SIGKILL
 import simplelm
 
@@ -286,6 +288,195 @@ class Command(object):
             if os.path.isfile(path):
                 copyfile(path, os.path.join(dst, name))
 
+
+class FlookupProcess(object):
+    """A long-lived ``flookup`` process that applies a compiled foma binary in one direction.
+
+    Inputs are written newline-delimited to the process's stdin and outputs are read from its
+    stdout.  flookup responds to each input line with one or more tab-delimited i/o lines followed
+    by an empty line, which is how the end of the response to a given input is recognized.  The
+    ``-b`` option makes flookup flush its output after each input.
+
+    """
+
+    def __init__(self, binary_path, direction):
+        self.binary_path = binary_path
+        self.direction = direction
+        self.mtime = os.path.getmtime(binary_path)
+        cmd = ['flookup', '-b']
+        if direction != 'up':
+            cmd.append('-i')
+        cmd.append(binary_path)
+        self.devnull = open(os.devnull, 'w')
+        self.process = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=self.devnull,
+                             close_fds=True)
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def is_stale(self):
+        """Return ``True`` if the binary has been recompiled (or removed) since the process started."""
+        try:
+            return os.path.getmtime(self.binary_path) != self.mtime
+        except OSError:
+            return True
+
+    def apply(self, inputs):
+        """Send ``inputs`` to flookup and return the output lines as a list of unicode strings.
+
+        The inputs are written from a separate thread so that neither process blocks on a full
+        pipe buffer when a large number of inputs is sent at once.
+
+        :param list inputs: unicode strings, none of which may contain a newline.
+        :returns: list of unicode ``input\\toutput`` lines.
+
+        """
+        stdin = self.process.stdin
+        stdout = self.process.stdout
+        def writer():
+            try:
+                for input_ in inputs:
+                    stdin.write(input_.encode('utf8') + '\n')
+                stdin.flush()
+            except (IOError, ValueError):
+                pass
+        thread = threading.Thread(target=writer)
+        thread.daemon = True
+        thread.start()
+        lines = []
+        remaining = len(inputs)
+        while remaining:
+            line = stdout.readline()
+            if not line:
+                thread.join()
+                raise IOError('flookup process for %s terminated unexpectedly' % self.binary_path)
+            line = line.rstrip('\n')
+            if line:
+                lines.append(line.decode('utf8'))
+            else:
+                remaining -= 1
+        thread.join()
+        self.last_used = time.time()
+        return lines
+
+    def terminate(self):
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            if self.is_alive():
+                self.process.kill()
+            self.process.wait()
+        except Exception:
+            pass
+        self.devnull.close()
+
+
+class FlookupPool(object):
+    """A pool of long-lived flookup processes, one per compiled binary and direction.
+
+    Starting flookup and loading a large binary is far more expensive than the transduction
+    itself, so :func:`FomaFST.apply` borrows a warm process from this pool instead of spawning
+    a new one for each request.  Processes are restarted when the modification time of their
+    binary changes (i.e., after recompilation), are evicted after ``idle_timeout`` seconds
+    without use and at most ``max_processes`` processes run at any given time.
+
+    Usage:
+
+        lines = flookup_pool.apply('/path/to/morphology.foma', 'up', [u'chiens'])
+
+    """
+
+    def __init__(self, max_processes=8, idle_timeout=300):
+        self.max_processes = max_processes
+        self.idle_timeout = idle_timeout
+        self.processes = {}     # (binary_path, direction) -> FlookupProcess
+        self.busy = set()
+        self.condition = threading.Condition()
+
+    def configure(self, max_processes=None, idle_timeout=None):
+        with self.condition:
+            if max_processes is not None:
+                self.max_processes = max(1, int(max_processes))
+            if idle_timeout is not None:
+                self.idle_timeout = float(idle_timeout)
+
+    def apply(self, binary_path, direction, inputs):
+        """Apply the binary at ``binary_path`` to ``inputs`` in ``direction`` using a pooled process.
+
+        :returns: list of unicode ``input\\toutput`` lines as returned by flookup.
+
+        """
+        key = (binary_path, direction)
+        process = self.acquire(key)
+        try:
+            with process.lock:
+                result = process.apply(inputs)
+        except Exception:
+            self.release(key, process, discard=True)
+            raise
+        self.release(key, process)
+        return result
+
+    def acquire(self, key):
+        """Return a live, up-to-date process for ``key``, waiting if the pool is at capacity."""
+        with self.condition:
+            while True:
+                self.evict_idle()
+                process = self.processes.get(key)
+                if process and key not in self.busy:
+                    if process.is_alive() and not process.is_stale():
+                        self.busy.add(key)
+                        return process
+                    self._discard(key)
+                    process = None
+                if not process:
+                    if len(self.processes) >= self.max_processes:
+                        self.evict_least_recently_used()
+                    if len(self.processes) < self.max_processes:
+                        process = FlookupProcess(*key)
+                        self.processes[key] = process
+                        self.busy.add(key)
+                        return process
+                self.condition.wait(1)
+
+    def release(self, key, process, discard=False):
+        with self.condition:
+            self.busy.discard(key)
+            if discard and self.processes.get(key) is process:
+                self._discard(key)
+            self.condition.notify_all()
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        for key, process in self.processes.items():
+            if key not in self.busy and process.last_used < cutoff:
+                self._discard(key)
+
+    def evict_least_recently_used(self):
+        idle = [(p.last_used, k) for k, p in self.processes.iteritems() if k not in self.busy]
+        if idle:
+            self._discard(min(idle)[1])
+
+    def clear(self):
+        """Terminate all idle processes, e.g., on application shutdown."""
+        with self.condition:
+            for key in self.processes.keys():
+                if key not in self.busy:
+                    self._discard(key)
+
+    def _discard(self, key):
+        process = self.processes.pop(key, None)
+        if process:
+            process.terminate()
+
+flookup_pool = FlookupPool()
+atexit.register(flookup_pool.clear)
+
+
 class FomaFST(Command):
     """Represents a foma finite-state transducer.
 
@@ -348,11 +539,10 @@ class FomaFST(Command):
     def apply(self, direction, input_, boundaries=None):
         """Foma-apply the inputs in the direction of ``direction``.
 
-        The method used is to write two files -- inputs.txt containing a newline-delimited
-        list thereof and apply.sh which is a shell script that invokes flookup on inputs.txt
-        to create outputs.txt -- and then parse the foma/flookup-generated outputs.txt file
-        and then delete the three temporary files.  A more efficient implementation might be
-        possible.
+        The inputs are sent to a long-lived flookup process borrowed from ``flookup_pool`` (cf.
+        :class:`FlookupPool`) so that neither a process nor the binary need be loaded anew for
+        each request.  If the pooled process cannot be used (e.g., there is no compiled binary),
+        we fall back to :func:`apply_via_files`.
 
         :param str direction: 'up' or 'down', i.e., the direction in which to use the transducer
         :param basestring/list input_: a transcription string or list thereof.
@@ -368,6 +558,28 @@ class FomaFST(Command):
             inputs = list(input_)
         else:
             return None
+        if boundaries:
+            inputs = [i.join([self.word_boundary_symbol, self.word_boundary_symbol]) for i in inputs]
+        binary_path = self.get_file_path('binary')
+        if (inputs and os.path.isfile(binary_path) and
+            not [i for i in inputs if not i or u'\n' in i]):
+            try:
+                lines = flookup_pool.apply(binary_path, direction, inputs)
+                return self.foma_output_file2dict(lines, remove_word_boundaries=boundaries)
+            except Exception, e:
+                log.warn('Pooled flookup apply failed for %s (%s); falling back to files.' % (
+                    binary_path, e))
+        return self.apply_via_files(direction, inputs, boundaries)
+
+    def apply_via_files(self, direction, inputs, boundaries):
+        """Foma-apply the (already word-boundary-wrapped) ``inputs`` using temporary files.
+
+        The method used is to write two files -- inputs.txt containing a newline-delimited
+        list thereof and apply.sh which is a shell script that invokes flookup on inputs.txt
+        to create outputs.txt -- and then parse the foma/flookup-generated outputs.txt file
+        and then delete the three temporary files.
+
+        """
         directory = self.directory
         random_string = self.generate_salt()
         inputs_file_path = os.path.join(directory, 'inputs_%s.txt' % random_string)
@@ -376,11 +588,7 @@ class FomaFST(Command):
         binary_path = self.get_file_path('binary')
         # Write the inputs to an '\n'-delimited file
         with codecs.open(inputs_file_path, 'w', 'utf8') as f:
-            if boundaries:
-                f.write(u'\n'.join(input_.join([self.word_boundary_symbol, self.word_boundary_symbol])
-                        for input_ in inputs))
-            else:
-                f.write(u'\n'.join(inputs))
+            f.write(u'\n'.join(inputs))
         # Write the shell script that pipes the input file into flookup
         with codecs.open(apply_file_path, 'w', 'utf8') as f:
             f.write('#!/bin/sh\ncat %s | flookup %s%s' % (
@@ -404,7 +612,7 @@ class FomaFST(Command):
     def foma_output_file2dict(self, file_, remove_word_boundaries=True):
         """Return the output file of a flookup apply request into a dictionary.
 
-        :param file file_: utf8-encoded file object with tab-delimited i/o pairs.
+        :param file file_: utf8-encoded file object (or list of unicode lines) with tab-delimited i/o pairs.
         :param bool remove_word_boundaries: toggles whether word boundaries are removed in the output
         :returns: dictionary of the form ``{i1: [01, 02, ...], i2: [...], ...}``.
 
@@ -667,7 +875,7 @@ class LanguageModel(Command):
             self._file_type2extension.update({
                 'corpus': '.txt',
                 'arpa': '.lm',
-                'trie': '.pickle',
+                'trie': '.trie',
                 'vocabulary': '.vocab'
             })
             return self._file_type2extension
@@ -689,19 +897,17 @@ class LanguageModel(Command):
         else:
             return None
         splitter = self.space_splitter
-        morpheme_sequences = [(morpheme_sequence,
-            [self.start_symbol] + splitter.split(morpheme_sequence) + [self.end_symbol])
+        morpheme_sequence_lists = [
+            [self.start_symbol] + splitter.split(morpheme_sequence) + [self.end_symbol]
             for morpheme_sequence in morpheme_sequences]
-        trie = self.trie
-        return dict((morpheme_sequence, self.get_probability_one(morpheme_sequence_list, trie))
-                    for morpheme_sequence, morpheme_sequence_list in morpheme_sequences)
+        return dict(zip(morpheme_sequences, self.get_probability_many(morpheme_sequence_lists)))
 
     def get_probability_one(self, morpheme_sequence_list, trie=None):
         """Return the log probability of the input list of morphemes.
 
         :param list morpheme_sequence_list: a list of strings/unicode obejcts, each
             representing a morpheme.
-        :param instance trie: a simplelm.LMTree instance encoding the LM.
+        :param instance trie: a simplelm.CompactLM (or simplelm.LMTree) instance encoding the LM.
         :returns: the log prob of the morpheme sequence.
 
         """
@@ -709,6 +915,22 @@ class LanguageModel(Command):
             trie = self.trie
         return simplelm.compute_sentence_prob(trie, morpheme_sequence_list)
 
+    def get_probability_many(self, morpheme_sequence_lists, trie=None):
+        """Return the log probabilities of the input lists of morphemes.
+
+        Cf. ``simplelm.compute_sentence_probs``: shared prefixes are scored only once and
+        the input lists are not modified.
+
+        :param list morpheme_sequence_lists: a list of lists of strings/unicode objects, each
+            representing a morpheme.
+        :param instance trie: a simplelm.CompactLM (or simplelm.LMTree) instance encoding the LM.
+        :returns: a list of log probs, one for each morpheme sequence.
+
+        """
+        if not trie:
+            trie = self.trie
+        return simplelm.compute_sentence_probs(trie, morpheme_sequence_lists)
+
     def write_arpa(self, timeout):
         """Write ARPA-formatted LM file to disk.
 
@@ -755,27 +977,31 @@ class LanguageModel(Command):
             return True
         return False
 
+    # Set to ``True`` to memory-map the compact LM file rather than read it into memory.
+    trie_mmap = False
+
     def generate_trie(self):
-        """Load the contents of an ARPA-formatted LM file into a ``simplelm.LMTree`` instance and pickle it.
+        """Load the contents of an ARPA-formatted LM file into a ``simplelm.CompactLM`` instance and save it.
 
-        :returns: None; if successful, ``self.get_file_path('trie')`` points to a pickled
-            ``simplelm.LMTree`` instance.
+        :returns: None; if successful, ``self.get_file_path('trie')`` points to a binary
+            ``simplelm.CompactLM`` file.
 
         """
-        self._trie = simplelm.load_arpa(self.get_file_path('arpa'), 'utf8')
-        cPickle.dump(self._trie, open(self.get_file_path('trie'), 'wb'))
+        self._trie = simplelm.CompactLM.from_arpa(self.get_file_path('arpa'), 'utf8')
+        self._trie.save(self.get_file_path('trie'))
 
     @property
     def trie(self):
-        """Return the ``simplelm.LMTree`` instance representing a trie interface to the LM
+        """Return the ``simplelm.CompactLM`` instance representing a trie interface to the LM
         if one is available or can be generated.
 
         """
-        if isinstance(getattr(self, '_trie', None), simplelm.LMTree):
+        if isinstance(getattr(self, '_trie', None), (simplelm.CompactLM, simplelm.LMTree)):
             return self._trie
         else:
             try:
-                self._trie = cPickle.load(open(self.get_file_path('trie'), 'rb'))
+                self._trie = simplelm.CompactLM.load(self.get_file_path('trie'),
+                                                     use_mmap=self.trie_mmap)
                 return self._trie
             except Exception:
                 try:
@@ -795,6 +1021,7 @@ class Cache(object):
     - ``__setitem__(k, v)``
     - ``__getitem__(k)``
     - ``get(k, default)``
+    - ``get_many(keys)``
     - ``persist()``
 
     """
@@ -822,6 +1049,11 @@ class Cache(object):
     def get(self, k, default=None):
         return self._store.get(k, default)
 
+    def get_many(self, keys):
+        """Return a dictionary from those keys in ``keys`` that are cached to their values."""
+        store = self._store
+        return dict((k, store[k]) for k in keys if k in store)
+
     def update(self, dict_, **kwargs):
         old_keys = self._store.keys()
         self._store.update(dict_, **kwargs)
@@ -911,13 +1143,46 @@ class MorphologicalParser(FomaFST):
 
         """
         if isinstance(input_, basestring):
-            result = {input_: self.parse_one(input_)}
+            result = self.parse_many([input_])
         else:
-            result = dict((t, self.parse_one(t)) for t in input_)
+            result = self.parse_many(input_)
         if self.persist_cache:
             self.cache.persist()
         return result
 
+    def parse_many(self, transcriptions):
+        """Return the most probable parses for all of the input transcriptions.
+
+        Parses are first sought in the cache using a single ``get_many`` call.  All of the
+        cache misses are then sent to the morphophonology FST in a single ``applyup`` call and
+        the resulting candidates are disambiguated and ranked individually.  The parses returned are identical to those
+        that would be returned by calling :func:`parse_one` on each transcription.
+
+        :param list transcriptions: surface forms of words.
+        :returns: a dictionary with input transcriptions as keys and parses as values.
+
+        """
+        transcriptions = list(transcriptions)
+        result = {}
+        misses = []
+        cache = self.cache
+        cached = cache.get_many(transcriptions)
+        for transcription in transcriptions:
+            if transcription in result:
+                continue
+            if transcription in cached:
+                result[transcription] = cached[transcription]
+            else:
+                result[transcription] = None
+                misses.append(transcription)
+        if misses:
+            candidates = self.get_candidates_many(misses)
+            for transcription in misses:
+                parse = self.get_most_probable(candidates.get(transcription, []))
+                cache[transcription] = parse
+                result[transcription] = parse
+        return result
+
     def parse_one(self, transcription):
         """Return the most probable parse for the input transcription.
 
@@ -943,15 +1208,16 @@ class MorphologicalParser(FomaFST):
         """
         if not candidates:
             return None
-        temp = []
+        language_model = self.my_language_model
+        rare_delimiter = self.my_morphology.rare_delimiter
+        lm_inputs = []
         for candidate in candidates:
             lm_input = self.morpheme_splitter(candidate)[::2]
-            if self.my_language_model.categorial:
-                lm_input = [morpheme.split(self.my_morphology.rare_delimiter)[2]
-                    for morpheme in lm_input]
-            lm_input = ([self.my_language_model.start_symbol] + lm_input +
-                        [self.my_language_model.end_symbol])
-            temp.append((candidate, self.my_language_model.get_probability_one(lm_input)))
+            if language_model.categorial:
+                lm_input = [morpheme.split(rare_delimiter)[2] for morpheme in lm_input]
+            lm_inputs.append([language_model.start_symbol] + lm_input +
+                             [language_model.end_symbol])
+        temp = zip(candidates, language_model.get_probability_many(lm_inputs))
         return sorted(temp, key=lambda x: x[1])[-1][0]
 
     def get_candidates(self, transcription):
@@ -967,7 +1233,49 @@ class MorphologicalParser(FomaFST):
             candidate_parses = self.disambiguate(candidate_parses)
         return candidate_parses
 
-    def disambiguate(self, candidates):
+    def get_candidates_many(self, transcriptions):
+        """Returns the morphophonologically valid parses of each of the input transcriptions.
+
+        The morphophonology FST is applied to all of the transcriptions at once and the
+        morphology's dictionary (if needed) is loaded only once.
+
+        :param list transcriptions: surface transcriptions of words.
+        :returns: a dictionary from transcriptions to lists of candidate parses in
+            'form|gloss|category' format.
+
+        """
+        candidate_parses = self.applyup(transcriptions) or {}
+        if self.my_morphology.rich_morphemes:
+            return candidate_parses
+        dictionary = self.load_dictionary()
+        return dict((transcription, self.disambiguate(candidates, dictionary))
+                    for transcription, candidates in candidate_parses.iteritems())
+
+    def load_dictionary(self):
+        """Return the morphology's pickled dictionary from morpheme forms to (gloss, category) pairs.
+
+        The dictionary is remembered until its file changes.  So is a failure to load it, in which
+        case an empty dictionary is returned, so that :func:`disambiguate` does not attempt to load
+        it again for each transcription.
+
+        :returns: a dictionary, empty if it cannot be loaded.
+
+        """
+        path = self.my_morphology.get_file_path('dictionary')
+        key = (path, self.get_modification_time(path))
+        loaded = getattr(self, '_loaded_dictionary', None)
+        if loaded and loaded[0] == key:
+            return loaded[1]
+        try:
+            dictionary = cPickle.load(open(path, 'rb'))
+        except Exception, e:
+            log.warn('unable to load the dictionary of the morphology of parser %s: %s' % (
+                getattr(self, 'id', None), e))
+            dictionary = {}
+        self._loaded_dictionary = (key, dictionary)
+        return dictionary
+
+    def disambiguate(self, candidates, dictionary=None):
         """Return parse candidates with rich representations, i.e., disambiguated.
 
         Note that this is only necessary when ``self.my_morphology.rich_morphemes==False``.
@@ -975,6 +1283,7 @@ class MorphologicalParser(FomaFST):
         :param list candidates: a list of strings representing morphological parses.  Since
             they are being disambiguated, we should expect them to be morpheme forms
             delimited by the language's delimiters.
+        :param dict dictionary: the morphology's dictionary; it is loaded from disk if not supplied.
         :returns: a list of richly represented morphological parses, i.e., in f|g|c format.
 
         This converts something like 'chien-s' to 'chien|dog|N-s|PL|Phi'.
@@ -990,9 +1299,10 @@ class MorphologicalParser(FomaFST):
                 return self.my_morphology.rare_delimiter.join(morpheme)
             return morpheme
         rules = self.my_morphology.rules_generated.split()
-        dictionary_path = self.my_morphology.get_file_path('dictionary')
         try:
-            dictionary = cPickle.load(open(dictionary_path, 'rb'))
+            if dictionary is None:
+                dictionary = cPickle.load(open(
+                    self.my_morphology.get_file_path('dictionary'), 'rb'))
             new_candidates = set()
             for candidate in candidates:
                 temp = []
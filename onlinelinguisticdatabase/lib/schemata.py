@@ -275,8 +275,8 @@ class ValidOLDModelObject(FancyValidator):
             else:
                 if self.model_name in ('Form', 'File', 'Collection') and \
                 getattr(state, 'user', None):
-                    unrestricted_users = h.get_unrestricted_users()
-                    if h.user_is_authorized_to_access_model(state.user, model_object, unrestricted_users):
+                    unrestricted_user_ids = h.get_unrestricted_user_ids()
+                    if h.user_is_authorized_to_access_model(state.user, model_object, unrestricted_user_ids):
                         return model_object
                     else:
                         raise Invalid(self.message("restricted_model", state, id=id,
@@ -472,8 +472,8 @@ class ValidAudioVideoFile(FancyValidator):
             else:
                 if h.is_audio_video_file(file_object):
                     if file_object.parent_file is None:
-                        unrestricted_users = h.get_unrestricted_users()
-                        if h.user_is_authorized_to_access_model(state.user, file_object, unrestricted_users):
+                        unrestricted_user_ids = h.get_unrestricted_user_ids()
+                        if h.user_is_authorized_to_access_model(state.user, file_object, unrestricted_user_ids):
                             return file_object
                         else:
                             raise Invalid(self.message("restricted_file", state, id=id),
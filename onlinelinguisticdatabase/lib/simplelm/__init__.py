@@ -28,6 +28,8 @@
 # NOTE: this __init__ module was created in order to make an importable
 # Python package out of Novak's SimpleLM project. 
 
-from evaluatelm import load_arpa, compute_sentence_prob, LMTree
+from evaluatelm import load_arpa, compute_sentence_prob, compute_sentence_probs, LMTree
+from compactlm import CompactLM
 
-__all__ = ['load_arpa', 'compute_sentence_prob', 'LMTree']
+__all__ = ['load_arpa', 'compute_sentence_prob', 'compute_sentence_probs', 'LMTree',
+           'CompactLM']
@@ -0,0 +1,276 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compact, array-backed n-gram language model.
+
+``CompactLM`` is a drop-in replacement for ``LMTree`` (cf. evaluatelm.py): its ``get_ngram_p``
+method has exactly the same semantics, so it can be passed to ``compute_sentence_prob``.  Instead
+of one Python object (with a ``children`` dict) per n-gram, the model is stored as a handful of
+flat arrays per order:
+
+    * words:        the (interned) vocabulary id of the last word of each n-gram
+    * probs:        the log10 probability of each n-gram
+    * bows:         the backoff weight of each n-gram
+    * first_child:  the index into the next order's arrays of each n-gram's first extension
+
+The n-grams of each order are sorted by their word id sequences, so the extensions of an n-gram
+are contiguous and sorted by word id and can be found by binary search.  Order 0 contains only
+the root (the empty n-gram).
+
+The binary file format written by ``save`` is (all values little-endian, every section padded to
+a multiple of 8 bytes so that it can be memory-mapped):
+
+    header:         'SLMC', version, max_order, vocabulary size, n-gram count of orders 0..max_order
+    vocabulary:     int32 byte offsets (vocabulary size + 1) into a UTF-8 blob of the words
+    orders 0..N:    int32 words, float64 probs, float64 bows, int32 first_child (count + 1)
+
+Usage:
+
+    lm = CompactLM.from_arpa('lm.arpa', 'utf8')
+    lm.save('lm.trie')
+    lm = CompactLM.load('lm.trie')              # or CompactLM.load('lm.trie', use_mmap=True)
+    compute_sentence_prob(lm, [u'<s>', u'chien', u's', u'</s>'])
+
+"""
+
+import re
+import sys
+import mmap
+import codecs
+import struct
+from array import array
+from bisect import bisect_left
+
+MAGIC = 'SLMC'
+VERSION = 1
+
+swap_bytes = sys.byteorder != 'little'
+
+
+def pad(length):
+    """Return the number of padding bytes needed to align ``length`` to 8 bytes."""
+    return (8 - length % 8) % 8
+
+
+class MappedArray(object):
+    """Read-only sequence of fixed-width little-endian numbers in a memory-mapped buffer.
+
+    It supports ``len`` and integer indexing, which is all that ``bisect`` and ``CompactLM``
+    require.
+
+    """
+
+    def __init__(self, buffer_, offset, typecode, length):
+        self.buffer = buffer_
+        self.offset = offset
+        self.format = '<%s' % typecode
+        self.itemsize = struct.calcsize(self.format)
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('MappedArray index out of range')
+        return struct.unpack_from(self.format, self.buffer, self.offset + index * self.itemsize)[0]
+
+
+class CompactLM(object):
+    """An n-gram language model stored as sorted id arrays with parallel prob/backoff arrays."""
+
+    def __init__(self, vocabulary, words, probs, bows, first_child, max_order):
+        self.vocabulary = vocabulary
+        self.word2id = dict((word, id_) for id_, word in enumerate(vocabulary))
+        self.words = words
+        self.probs = probs
+        self.bows = bows
+        self.first_child = first_child
+        self.max_order = max_order
+
+    def get_ngram_p(self, ngram, i=0):
+        """Return the probability of ``ngram[i:]`` if it is in the model; otherwise return the
+        backoff weight of its longest prefix in the model.  The second member of the returned
+        2-tuple indicates whether the first is a probability.  Cf. ``LMTree.get_ngram_p``.
+
+        """
+        word2id = self.word2id
+        words = self.words
+        first_child = self.first_child
+        max_order = self.max_order
+        node = 0
+        order = 0
+        for word in ngram[i:]:
+            if order == max_order:
+                return self.bows[order][node], False
+            id_ = word2id.get(word)
+            if id_ is None:
+                return self.bows[order][node], False
+            lo = first_child[order][node]
+            hi = first_child[order][node + 1]
+            next_words = words[order + 1]
+            index = bisect_left(next_words, id_, lo, hi)
+            if index == hi or next_words[index] != id_:
+                return self.bows[order][node], False
+            node = index
+            order += 1
+        return self.probs[order][node], True
+
+    @classmethod
+    def from_arpa(cls, arpa_file, encoding=None):
+        """Build a ``CompactLM`` from an ARPA-formatted LM file.
+
+        The file is read exactly as ``load_arpa`` reads it: the first occurrence of an n-gram
+        wins, the backoff weights of the highest order are ignored and an n-gram whose prefix is
+        not listed causes that prefix to be added with a probability and backoff of 0.0.
+
+        """
+        word2id = {}
+        vocabulary = []
+        ngrams = [{(): (0.0, 0.0)}]
+        order = max_order = 0
+        for line in codecs.open(arpa_file, encoding=encoding):
+            line = line.strip()
+            if line.startswith('ngram'):
+                max_order = int(re.sub(r'^ngram\s+(\d+)=.*$', r'\1', line))
+            if order > 0 and not line.startswith('\\') and not line == '':
+                parts = line.split('\t')
+                ids = []
+                for word in parts[1].split(' '):
+                    id_ = word2id.get(word)
+                    if id_ is None:
+                        id_ = word2id[word] = len(vocabulary)
+                        vocabulary.append(word)
+                    ids.append(id_)
+                ids = tuple(ids)
+                if order < max_order and len(parts) == 3:
+                    value = (float(parts[0]), float(parts[-1]))
+                else:
+                    value = (float(parts[0]), 0.0)
+                while len(ngrams) <= len(ids):
+                    ngrams.append({})
+                for length in xrange(1, len(ids)):
+                    ngrams[length].setdefault(ids[:length], (0.0, 0.0))
+                ngrams[len(ids)].setdefault(ids, value)
+            if re.match(r'^\\\d+', line):
+                order = int(re.sub(r'^\\(\d+).*$', r'\1', line))
+        while len(ngrams) <= max_order:
+            ngrams.append({})
+        max_order = len(ngrams) - 1
+        words = []
+        probs = []
+        bows = []
+        first_child = []
+        previous_index = None
+        for order, level in enumerate(ngrams):
+            keys = sorted(level)
+            words.append(array('i', [key[-1] if key else -1 for key in keys]))
+            probs.append(array('d', [level[key][0] for key in keys]))
+            bows.append(array('d', [level[key][1] for key in keys]))
+            if previous_index is not None:
+                # keys are sorted, so the extensions of each n-gram of the previous order
+                # are contiguous and in the same order as their prefixes.
+                counts = [0] * len(previous_index)
+                for key in keys:
+                    counts[previous_index[key[:-1]]] += 1
+                offsets = array('i', [0])
+                for count in counts:
+                    offsets.append(offsets[-1] + count)
+                first_child.append(offsets)
+            previous_index = dict((key, index) for index, key in enumerate(keys))
+        # n-grams of the highest order have no extensions.
+        first_child.append(array('i', [0] * (len(words[-1]) + 1)))
+        return cls(vocabulary, words, probs, bows, first_child, max_order)
+
+    def save(self, path):
+        """Write the model to ``path`` in the binary format described in the module docstring."""
+        counts = [len(w) for w in self.words]
+        blob = ''.join(word.encode('utf8') for word in self.vocabulary)
+        offsets = array('i', [0])
+        for word in self.vocabulary:
+            offsets.append(offsets[-1] + len(word.encode('utf8')))
+        with open(path, 'wb') as f:
+            header = struct.pack('<4sIII%dI' % len(counts), MAGIC, VERSION, self.max_order,
+                                 len(self.vocabulary), *counts)
+            f.write(header + '\0' * pad(len(header)))
+            self._write_array(f, offsets)
+            f.write(blob + '\0' * pad(len(blob)))
+            for order in xrange(self.max_order + 1):
+                self._write_array(f, array('i', self.words[order]))
+                self._write_array(f, array('d', self.probs[order]))
+                self._write_array(f, array('d', self.bows[order]))
+                self._write_array(f, array('i', self.first_child[order]))
+
+    def _write_array(self, f, array_):
+        if swap_bytes:
+            array_ = array(array_.typecode, array_)
+            array_.byteswap()
+        data = array_.tostring()
+        f.write(data + '\0' * pad(len(data)))
+
+    @classmethod
+    def load(cls, path, use_mmap=False):
+        """Load a model written by ``save``.
+
+        :param str path: path to the binary model file.
+        :param bool use_mmap: if ``True``, the arrays are read directly from a memory map of the
+            file instead of being copied into memory; this makes loading nearly instantaneous and
+            lets processes share the model's pages at the cost of somewhat slower look-ups.
+        :returns: a ``CompactLM`` instance.
+
+        """
+        with open(path, 'rb') as f:
+            if use_mmap:
+                buffer_ = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer_ = f.read()
+        magic, version, max_order, vocabulary_size = struct.unpack_from('<4sIII', buffer_, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a compact language model file' % path)
+        counts = struct.unpack_from('<%dI' % (max_order + 1), buffer_, 16)
+        position = 16 + 4 * (max_order + 1)
+        position += pad(position)
+        def read_array(position, typecode, length):
+            size = length * struct.calcsize(typecode)
+            if use_mmap:
+                result = MappedArray(buffer_, position, typecode, length)
+            else:
+                result = array(typecode)
+                result.fromstring(buffer_[position:position + size])
+                if swap_bytes:
+                    result.byteswap()
+            return result, position + size + pad(size)
+        offsets, position = read_array(position, 'i', vocabulary_size + 1)
+        blob_size = offsets[vocabulary_size]
+        blob = buffer_[position:position + blob_size]
+        vocabulary = [blob[offsets[i]:offsets[i + 1]].decode('utf8')
+                      for i in xrange(vocabulary_size)]
+        position += blob_size + pad(blob_size)
+        words = []
+        probs = []
+        bows = []
+        first_child = []
+        for order in xrange(max_order + 1):
+            count = counts[order]
+            array_, position = read_array(position, 'i', count)
+            words.append(array_)
+            array_, position = read_array(position, 'd', count)
+            probs.append(array_)
+            array_, position = read_array(position, 'd', count)
+            bows.append(array_)
+            array_, position = read_array(position, 'i', count + 1)
+            first_child.append(array_)
+        return cls(vocabulary, words, probs, bows, first_child, max_order)
@@ -33,6 +33,7 @@
 #  * some minor code formatting
 #  * load_arpa now has an encoding parameter to allow for UTF-8-encoded
 #    ARPA files.
+#  * compute_sentence_probs scores a batch of sentences.
 
 import re
 import codecs
@@ -172,6 +173,60 @@ def compute_sentence_prob(arpalm, sentence):
     # Return the total log_10 probability of the input sentence
     return total
 
+def compute_sentence_probs(arpalm, sentences):
+    """Compute the probabilities of all of the input sentences.
+
+    Returns a list of the same log_10 probabilities that ``compute_sentence_prob``
+    would return for each sentence, but does less work:
+
+        * the sentences are not modified (no popping from the front of lists);
+        * the history is trimmed to max_order - 1 words before each look-up.  This
+          is equivalent because, after each step, the history is an ngram in the
+          model and the (ignored) backoff weights of max_order ngrams are 0.0;
+        * the sentences are scored in sorted order so that the running total and
+          history of a prefix shared with the previous sentence are reused.
+
+    """
+
+    max_order = getattr(arpalm, 'max_order', None) or 0
+    get_ngram_p = arpalm.get_ngram_p
+    results = [0.0] * len(sentences)
+    # states[k] is the (total, history) pair after the first k + 1 words of
+    # the previously scored sentence.
+    states = []
+    previous = []
+    for index in sorted(range(len(sentences)), key=lambda i: sentences[i]):
+        sentence = sentences[index]
+        if not sentence:
+            continue
+        shared = 0
+        limit = min(len(sentence), len(previous))
+        while shared < limit and sentence[shared] == previous[shared]:
+            shared += 1
+        del states[shared:]
+        if not states:
+            states.append((0.0, (sentence[0],)))
+        total, history = states[-1]
+        for word in sentence[len(states):]:
+            if max_order > 1:
+                ngram = list(history[1 - max_order:])
+            elif max_order == 1:
+                ngram = []
+            else:
+                ngram = list(history)
+            ngram.append(word)
+            p, is_prob = get_ngram_p(ngram)
+            total += p
+            while is_prob == False:
+                del ngram[0]
+                p, is_prob = get_ngram_p(ngram)
+                total += p
+            history = tuple(ngram)
+            states.append((total, history))
+        results[index] = total
+        previous = sentence
+    return results
+
 def retrieve_ngram_prob(arpalm, sentence):
     """Retrieve an individual ngram probability.
     """
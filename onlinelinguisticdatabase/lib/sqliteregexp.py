@@ -0,0 +1,142 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""The REGEXP function that the OLD provides for SQLite.
+
+SQLite has a REGEXP operator but no implementation of it: ``x REGEXP y`` calls
+the user-defined function ``regexp(y, x)`` once per row.  The function defined
+here does not call re.compile for each row: compiled patterns are kept in
+an LRU cache keyed by expression and each connection's function remembers the
+last pattern it used.  Patterns that are literal strings, or that are anchored
+at the start of the string, are matched with string methods instead of the
+``re`` module where possible.
+
+Searches are case-sensitive, as they are in MySQL with the COLLATE expressions
+that SQLAQueryBuilder inserts into queries.  Non-string values (e.g., integers)
+are matched against their string representations and NULL values yield NULL.
+
+Usage::
+
+    dbapi_connection.create_function('regexp', 2, get_regexp_function())
+
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+metacharacters = set(u'.^$*+?{}[]\\|()')
+
+quantifiers = set(u'*?{')
+
+def get_literal_prefix(expr):
+    """Return ``(prefix, rest)`` where ``prefix`` is the longest string of
+    literal characters that every match of ``expr`` begins with and ``rest`` is
+    the remainder of ``expr``.  Characters made optional by a following
+    quantifier are not part of the prefix.
+
+    """
+    for i, char in enumerate(expr):
+        if char in metacharacters:
+            if char in quantifiers and i:
+                i -= 1
+            return expr[:i], expr[i:]
+    return expr, u''
+
+def get_matcher(expr):
+    """Return a function that takes a string and returns ``True`` if
+    ``expr`` matches it (i.e., searches it successfully) and ``False`` otherwise.
+
+    The following patterns are matched without the ``re`` module:
+
+    - ``abc``: a substring test;
+    - ``^abc``: a prefix test;
+    - ``^abc$``: an equality test (``$`` also matches before a final newline).
+
+    Other patterns whose matches must begin at the start of the string (e.g.,
+    ``^abc[de]+``) are only searched if the string has the literal prefix.
+
+    """
+    if u'|' in expr or u'(?' in expr:
+        # With alternation, anchors and prefixes apply to a single alternative;
+        # inline flags (e.g., ``(?i)``) may change how literals match.
+        search = re.compile(expr).search
+        return lambda item: search(item) is not None
+    if not expr.startswith(u'^'):
+        prefix, rest = get_literal_prefix(expr)
+        if not rest:
+            return lambda item: prefix in item
+        search = re.compile(expr).search
+        return lambda item: search(item) is not None
+    prefix, rest = get_literal_prefix(expr[1:])
+    if not rest:
+        return lambda item: item.startswith(prefix)
+    if rest == u'$':
+        prefix_newline = prefix + u'\n'
+        return lambda item: item == prefix or item == prefix_newline
+    match = re.compile(expr[1:]).match
+    if not prefix:
+        return lambda item: match(item) is not None
+    return lambda item: item.startswith(prefix) and match(item) is not None
+
+class PatternCache(object):
+    """An LRU cache of the matchers (cf. ``get_matcher``) of regular expressions.
+
+    The cache is shared by the connections of all threads.  Invalid regular
+    expressions are not cached: ``re.error`` is raised every time.
+
+    """
+
+    def __init__(self, max_size=500):
+        self.max_size = max_size
+        self.matchers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, expr):
+        with self.lock:
+            matcher = self.matchers.pop(expr, None)
+            if matcher is not None:
+                self.matchers[expr] = matcher
+                return matcher
+        matcher = get_matcher(expr)
+        with self.lock:
+            self.matchers[expr] = matcher
+            while len(self.matchers) > self.max_size:
+                self.matchers.popitem(last=False)
+        return matcher
+
+    def clear(self):
+        with self.lock:
+            self.matchers.clear()
+
+pattern_cache = PatternCache()
+
+def get_regexp_function(cache=pattern_cache):
+    """Return a ``regexp(expr, item)`` function suitable for registration with
+    a SQLite connection.  The function remembers the matcher of the last
+    expression it was called with, so a REGEXP filter over many rows only
+    consults the cache once.
+
+    """
+    last = [None, None]     # the last expression and its matcher
+    def regexp(expr, item):
+        if item is None:
+            return None
+        if expr != last[0]:
+            last[1] = cache.get(expr)
+            last[0] = expr
+        if type(item) is not unicode and not isinstance(item, str):
+            item = str(item)
+        return last[1](item)
+    return regexp
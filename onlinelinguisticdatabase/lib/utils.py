@@ -29,9 +29,16 @@ import unicodedata
 import string
 import smtplib
 import gzip
+import zlib
 import zipfile
 import codecs
+import base64
+import operator
+import threading
+import time
 import ConfigParser
+from collections import OrderedDict
+from hashlib import md5
 from random import choice, shuffle
 from shutil import rmtree
 from passlib.hash import pbkdf2_sha512
@@ -39,14 +46,25 @@ from uuid import uuid4, UUID
 from mimetypes import guess_type
 import simplejson as json
 from simplejson.decoder import JSONDecodeError
-from sqlalchemy.sql import or_, not_, desc, asc
-from sqlalchemy.orm import subqueryload, joinedload
+from sqlalchemy import event
+from sqlalchemy.sql import or_, and_, not_, desc, asc, operators
+from sqlalchemy.orm import subqueryload, subqueryload_all, defer, ColumnProperty, RelationshipProperty
+from sqlalchemy.orm.session import Session as SessionClass
+from sqlalchemy.sql.expression import UpdateBase
+from sqlalchemy.sql.util import find_tables
 import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model import Form, File, Collection
 from onlinelinguisticdatabase.model.meta import Session, Model, Base
+from onlinelinguisticdatabase.model.formtrigram import ensure_trigram_index
+from onlinelinguisticdatabase.model.form import ensure_morpheme_token_index, update_morpheme_token_index
+from onlinelinguisticdatabase.model.dataversion import dataversion_table, \
+    increment_data_versions, get_data_versions
+from onlinelinguisticdatabase.model.collection import form_reference_pattern, \
+    collection_reference_pattern, ensure_collection_references
 from paste.deploy import appconfig
 from pylons import app_globals, session, url
 from formencode.schema import Schema
+from formencode import Invalid
 from formencode.validators import Int, UnicodeString, OneOf
 from markdown import Markdown
 from docutils.core import publish_parts
@@ -163,6 +181,35 @@ def jsonify(func, *args, **kwargs):
     pylons = get_pylons(args)
     pylons.response.headers['Content-Type'] = 'application/json'
     data = func(*args, **kwargs)
+    if isinstance(data, ExportStream):
+        pylons.response.headers['Content-Type'] = data.content_type
+        pylons.response.headers['Content-Disposition'] = 'attachment; filename=%s' % data.filename
+        return data
+    return dumps_with_cached_forms(data)
+
+
+def is_form_list(data):
+    return isinstance(data, list) and bool(data) and \
+        not [x for x in data if not isinstance(x, Form)]
+
+
+def dumps_with_cached_forms(data):
+    """Return ``data`` as a JSON string.  Forms, lists of forms and paginated
+    results containing forms are assembled from the cached JSON documents of the
+    forms (cf. ``FormJSONCache``) instead of being re-encoded.
+
+    """
+    if isinstance(data, Form):
+        form_json_cache.check_versions()
+        return form_json_cache.get_json(data)
+    if is_form_list(data):
+        form_json_cache.check_versions()
+        return '[%s]' % ', '.join([form_json_cache.get_json(form) for form in data])
+    if isinstance(data, dict) and set(data.keys()) == set(['paginator', 'items']) and \
+        is_form_list(data['items']):
+        return '{"paginator": %s, "items": %s}' % (
+            json.dumps(data['paginator'], cls=JSONOLDEncoder),
+            dumps_with_cached_forms(data['items']))
     return json.dumps(data, cls=JSONOLDEncoder)
 
 
@@ -262,7 +309,7 @@ def get_model_file_path(model_object, model_directory_path, file_type=None):
         'dictionary': '_dictionary.pickle',
         'lm_corpus': '.txt',
         'arpa': '.lm',
-        'lm_trie': '.pickle',
+        'lm_trie': '.trie',
         'vocabulary': '.vocab'
     }
     tablename = model_object.__tablename__
@@ -545,6 +592,110 @@ class ApplicationSettings(object):
                 self.application_settings.phonemic_inventory.split(','))
 
 
+class ApplicationSettingsSnapshot(object):
+    """An immutable, session-independent copy of an application settings model.
+
+    It holds the column values of the model plus data structures derived from
+    them, so that the many calls that need, e.g., the morpheme delimiters in
+    the course of a single request neither query the database nor rebuild
+    these structures.  Cf. :class:`ApplicationSettingsCache`.
+
+    """
+
+    def __init__(self, application_settings, version):
+        set_ = lambda name, value: object.__setattr__(self, name, value)
+        set_('version', version)
+        for column in model.ApplicationSettings.__table__.columns:
+            set_(column.key, getattr(application_settings, column.key))
+        morpheme_delimiters = self.morpheme_delimiters and \
+            tuple(self.morpheme_delimiters.split(u',')) or ()
+        set_('morpheme_delimiters_list', morpheme_delimiters)
+        set_('lexical_delimiters_set', frozenset(morpheme_delimiters + (u' ',)))
+        morpheme_splitter = morpheme_delimiters and u'[%s]' % ''.join(
+            [esc_RE_meta_chars(d) for d in morpheme_delimiters]) or u''
+        set_('morpheme_splitter', morpheme_splitter)
+        set_('morpheme_splitter_regex', re.compile(morpheme_splitter))
+        set_('morpheme_and_delimiter_splitter_regex', re.compile(u'(%s)' % morpheme_splitter))
+        set_('grammaticalities_list', self.grammaticalities and
+            tuple(self.grammaticalities.replace(u' ', u'').split(u',')) or ())
+        for name in ('narrow_phonetic_inventory', 'broad_phonetic_inventory',
+                     'phonemic_inventory', 'metalanguage_inventory'):
+            value = getattr(self, name)
+            set_('%s_list' % name, value and tuple(value.split(u',')) or ())
+        set_('punctuation_list', tuple(self.punctuation or u''))
+        set_('unrestricted_user_ids',
+             frozenset([user.id for user in application_settings.unrestricted_users]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ApplicationSettingsSnapshot objects are immutable.')
+
+    __delattr__ = __setattr__
+
+
+class ApplicationSettingsCache(object):
+    """A process-wide cache of a snapshot of the active application settings.
+
+    The snapshot is checked against a cheap version stamp -- the ``id`` and
+    ``datetime_modified`` values of the most recent application settings row
+    plus a local generation counter -- so that changes made by other processes
+    are seen.  The stamp is checked at most once per request (cf.
+    ``begin_request``, called by :class:`BaseController`) and on every call
+    outside of requests.  Any change to an application settings model made in
+    this process (e.g., by ``ApplicationsettingsController``) bumps the
+    generation, which forces the snapshot to be rebuilt.
+
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.cached = None      # (version, snapshot or None)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def begin_request(self):
+        self.local.checked_generation = None
+
+    def end_request(self):
+        self.local.__dict__.pop('checked_generation', None)
+
+    def invalidate(self, *args):
+        with self.lock:
+            self.generation += 1
+
+    def get_version(self):
+        stamp = Session.query(model.ApplicationSettings.id,
+            model.ApplicationSettings.datetime_modified).order_by(
+            desc(model.ApplicationSettings.id)).first()
+        return (tuple(stamp) if stamp else None, self.generation)
+
+    def get(self):
+        """Return the snapshot of the active application settings or ``None`` if there are none."""
+        cached = self.cached
+        generation = self.generation
+        if cached is not None and cached[0][1] == generation and \
+            getattr(self.local, 'checked_generation', None) == generation:
+            return cached[1]
+        version = self.get_version()
+        if cached is None or cached[0] != version:
+            application_settings = get_application_settings()
+            snapshot = application_settings and \
+                ApplicationSettingsSnapshot(application_settings, version) or None
+            cached = self.cached = (version, snapshot)
+        if hasattr(self.local, 'checked_generation'):
+            self.local.checked_generation = version[1]
+        return cached[1]
+
+application_settings_cache = ApplicationSettingsCache()
+
+# Changes to the morpheme delimiters also rebuild the morpheme token index.
+for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(model.ApplicationSettings, event_name, application_settings_cache.invalidate)
+    event.listen(model.ApplicationSettings, event_name, update_morpheme_token_index)
+
+def get_application_settings_snapshot():
+    return application_settings_cache.get()
+
+
 ################################################################################
 # Inventory
 ################################################################################
@@ -705,11 +856,7 @@ def get_foreign_word_tag_id():
 ################################################################################
 
 def get_grammaticalities():
-    try:
-        return get_application_settings().grammaticalities.replace(
-                                                            ' ', '').split(',')
-    except AttributeError:
-        return []
+    return list(getattr(get_application_settings_snapshot(), 'grammaticalities_list', []))
 
 def get_morpheme_delimiters_DEPRECATED():
     """Return the morpheme delimiters from app settings as a list."""
@@ -725,13 +872,10 @@ def get_morpheme_delimiters_DEPRECATED():
 
 def get_morpheme_delimiters(type_='list'):
     """Return the morpheme delimiters from app settings as an object of type ``type_``."""
-    application_settings = get_application_settings()
-    morpheme_delimiters = getattr(application_settings, 'morpheme_delimiters', u'')
+    application_settings = get_application_settings_snapshot()
     if type_ != 'list':
-        return morpheme_delimiters
-    if morpheme_delimiters:
-        return morpheme_delimiters.split(u',')
-    return []
+        return getattr(application_settings, 'morpheme_delimiters', u'')
+    return list(getattr(application_settings, 'morpheme_delimiters_list', []))
 
 def is_lexical(form):
     """Return True if the input form is lexical, i.e, if neither its morpheme
@@ -739,15 +883,16 @@ def is_lexical(form):
     morpheme delimiters.  Note: designed to work on dict representations of forms
     also.
     """
-    delimiters = get_morpheme_delimiters() + [' ']
+    delimiters = getattr(get_application_settings_snapshot(), 'lexical_delimiters_set',
+                         frozenset([u' ']))
     try:
         return bool(form.morpheme_break) and bool(form.morpheme_gloss) and not (
-                    set(delimiters) & set(form.morpheme_break) and
-                    set(delimiters) & set(form.morpheme_gloss))
+                    delimiters & set(form.morpheme_break) and
+                    delimiters & set(form.morpheme_gloss))
     except AttributeError:
         return bool(form['morpheme_break']) and bool(form['morpheme_gloss']) and not (
-                    set(delimiters) & set(form['morpheme_break']) and
-                    set(delimiters) & set(form['morpheme_gloss']))
+                    delimiters & set(form['morpheme_break']) and
+                    delimiters & set(form['morpheme_gloss']))
     except:
         return False
 
@@ -782,8 +927,8 @@ def get_start_and_end_from_paginator(paginator):
 
 def filter_restricted_models(model_name, query, user=None):
     user = user or session['user']
-    unrestricted_users = get_unrestricted_users()
-    userIsUnrestricted_ = user_is_unrestricted(user, unrestricted_users)
+    unrestricted_user_ids = get_unrestricted_user_ids()
+    userIsUnrestricted_ = user_is_unrestricted(user, unrestricted_user_ids)
     if userIsUnrestricted_:
         return query
     else:
@@ -791,12 +936,13 @@ def filter_restricted_models(model_name, query, user=None):
 
 def filter_restricted_models_from_query(model_name, query, user):
     model_ = getattr(model, model_name)
-    if model_name in (u'FormBackup', u'CollectionBackup'):
+    if model_name == u'FormBackup':
+        enterer_condition = model_.enterer_id == user.id
+    elif model_name == u'CollectionBackup':
         enterer_condition = model_.enterer.like(u'%' + u'"id": %d' % user.id + u'%')
-        unrestricted_condition = not_(model_.tags.like(u'%"name": "restricted"%'))
     else:
         enterer_condition = model_.enterer == user
-        unrestricted_condition = not_(model_.tags.any(model.Tag.name==u'restricted'))
+    unrestricted_condition = model_.restricted == False
     return query.filter(or_(enterer_condition, unrestricted_condition))
 
 def get_forms_user_can_access(user, paginator=None):
@@ -821,15 +967,22 @@ def get_model_by_UUID(model_name, UUID):
     return get_eagerloader(model_name)(Session.query(getattr(model, model_name)))\
         .filter(getattr(model, model_name).UUID==UUID).first()
 
-def get_backups_by_UUID(model_name, UUID):
-    """Return all backup models of the model with ``model_name`` using the ``UUID`` value."""
+def get_backups_by_UUID(model_name, UUID, as_query=False):
+    """Return all backup models of the model with ``model_name`` using the ``UUID`` value.
+    If ``as_query`` is ``True``, return the query for them instead.
+
+    """
     backup_model = getattr(model, model_name + 'Backup')
-    return Session.query(backup_model).\
+    query = Session.query(backup_model).\
             filter(backup_model.UUID==UUID).\
-            order_by(desc(backup_model.id)).all()
+            order_by(desc(backup_model.id))
+    if as_query:
+        return query
+    return query.all()
 
-def get_backups_by_model_id(model_name, model_id):
+def get_backups_by_model_id(model_name, model_id, as_query=False):
     """Return all backup models of the model with ``model_name`` using the ``id`` value of the model.
+    If ``as_query`` is ``True``, return the query for them instead.
 
     .. warning::
     
@@ -838,36 +991,41 @@ def get_backups_by_model_id(model_name, model_id):
 
     """
     backup_model = getattr(model, model_name + 'Backup')
-    return Session.query(backup_model).\
+    query = Session.query(backup_model).\
         filter(getattr(backup_model, model_name.lower() + '_id')==model_id).\
-        order_by(desc(backup_model.id)).all()
+        order_by(desc(backup_model.id))
+    if as_query:
+        return query
+    return query.all()
 
-def get_model_and_previous_versions(model_name, id):
+def get_model_and_previous_versions(model_name, id, as_query=False):
     """Return a model and its previous versions.
 
     :param str model_name: a model name, e.g., 'Form'
     :param str id: the ``id`` or ``UUID`` value of the model whose history
         is requested.
+    :param bool as_query: if ``True``, the second element of the returned tuple
+        is the query for the backup models (``None`` if ``id`` is invalid).
     :returns: a tuple whose first element is the model and whose second element
         is a list of the model's backup models.
 
     """
     model_ = None
-    previous_versions = []
+    previous_versions = None if as_query else []
     try:
         id = int(id)
         # add eagerload function ...
         model_ = get_eagerloader(model_name)(
             Session.query(getattr(model, model_name))).get(id)
         if model_:
-            previous_versions = get_backups_by_UUID(model_name, model_.UUID)
+            previous_versions = get_backups_by_UUID(model_name, model_.UUID, as_query)
         else:
-            previous_versions = get_backups_by_model_id(model_name, id)
+            previous_versions = get_backups_by_model_id(model_name, id, as_query)
     except ValueError:
         try:
             model_UUID = unicode(UUID(id))
             model_ = get_model_by_UUID(model_name, model_UUID)
-            previous_versions = get_backups_by_UUID(model_name, model_UUID)
+            previous_versions = get_backups_by_UUID(model_name, model_UUID, as_query)
         except (AttributeError, ValueError):
             pass    # id is neither an integer nor a UUID
     return model_, previous_versions
@@ -935,23 +1093,500 @@ def clear_all_models(retain=['Language']):
 def clear_all_tables(retain=[]):
     """Like ``clear_all_models`` above, except **much** faster."""
     for table in reversed(Base.metadata.sorted_tables):
-        if table.name not in retain:
+        if table.name not in retain and table is not dataversion_table:
             Session.execute(table.delete())
             Session.commit()
+    form_json_cache.clear()
+    ensure_trigram_index(Session)
+    ensure_collection_references(Session)
+    ensure_morpheme_token_index(Session)
+    Session.commit()
 
 def get_all_models():
     return dict([(mn, get_models_by_name(mn)) for mn in get_model_names()])
 
+class CountCache(object):
+    """A short-lived cache of the counts of paginated queries.
+
+    Counts are keyed by a fingerprint of the query (its SQL and parameters) and
+    expire after ``ttl`` seconds.  The whole cache is cleared whenever this
+    process flushes changes to the database (cf. the ``after_flush`` listener
+    below); writes made by other processes are reflected once counts expire.
+    A ``ttl`` of 0 disables the cache.
+
+    """
+
+    def __init__(self, ttl=30, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.counts = {}    # fingerprint => (count, expiry time)
+        self.lock = threading.Lock()
+
+    def configure(self, ttl=None, max_size=None):
+        if ttl is not None:
+            self.ttl = float(ttl)
+        if max_size is not None:
+            self.max_size = int(max_size)
+        self.clear()
+
+    def get(self, fingerprint):
+        with self.lock:
+            count, expiry = self.counts.get(fingerprint, (None, 0))
+            if expiry > time.time():
+                return count
+            return None
+
+    def set(self, fingerprint, count):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            if len(self.counts) >= self.max_size:
+                now_ = time.time()
+                self.counts = dict((k, v) for k, v in self.counts.iteritems() if v[1] > now_)
+                if len(self.counts) >= self.max_size:
+                    self.counts.clear()
+            self.counts[fingerprint] = (count, time.time() + self.ttl)
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+
+paginator_count_cache = CountCache()
+
+def clear_paginator_count_cache(session_, flush_context):
+    if session_.new or session_.dirty or session_.deleted:
+        paginator_count_cache.clear()
+
+event.listen(SessionClass, 'after_flush', clear_paginator_count_cache)
+
+
+class FormJSONCache(object):
+    """A least-recently-used cache of the JSON documents of forms, i.e., of
+    their ``get_dict`` representations encoded by ``JSONOLDEncoder``.
+
+    Documents are keyed by form id and valid only for the ``datetime_modified``
+    value of the form they were built from.  Updates and deletions of forms
+    made by this process discard their documents and updates or deletions of
+    the models whose mini-dicts are embedded in form documents (users,
+    speakers, tags, etc.) clear the cache (cf. the listeners below).  Since the
+    latter may also be made by other processes, ``check_versions`` (called
+    once per response, cf. ``dumps_with_cached_forms``) clears the cache when
+    the versions of the tables of these models (cf. ``DataVersions``) have
+    changed.  Documents also expire after ``ttl`` seconds.  A ``max_size`` of
+    0 disables the cache.
+
+    """
+
+    # The tables of the models whose mini-dicts are embedded in form documents.
+    related_tables = ('user', 'speaker', 'elicitationmethod', 'syntacticcategory',
+                      'source', 'tag', 'file')
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.documents = OrderedDict()    # form id => (datetime_modified, expiry time, JSON)
+        self.versions = None    # the versions of related_tables when last checked
+        self.lock = threading.Lock()
+
+    def check_versions(self):
+        """Clear the cache if the related tables have been written to since the last check."""
+        if self.max_size <= 0:
+            return
+        versions = data_versions.get(self.related_tables)
+        with self.lock:
+            if versions != self.versions:
+                self.documents.clear()
+                self.versions = versions
+
+    def configure(self, max_size=None, ttl=None):
+        if max_size is not None:
+            self.max_size = int(max_size)
+        if ttl is not None:
+            self.ttl = float(ttl)
+        self.clear()
+
+    def get_json(self, form):
+        """Return the JSON document of ``form``, from the cache if possible."""
+        with self.lock:
+            document = self.documents.pop(form.id, None)
+            if document and document[0] == form.datetime_modified and document[1] > time.time():
+                self.documents[form.id] = document
+                return document[2]
+        JSON = json.dumps(form.get_dict(), cls=JSONOLDEncoder)
+        if self.max_size > 0 and form.id is not None:
+            with self.lock:
+                self.documents[form.id] = (form.datetime_modified, time.time() + self.ttl, JSON)
+                while len(self.documents) > self.max_size:
+                    self.documents.popitem(last=False)
+        return JSON
+
+    def discard(self, form_id):
+        with self.lock:
+            self.documents.pop(form_id, None)
+
+    def clear(self, *args):
+        with self.lock:
+            self.documents.clear()
+
+form_json_cache = FormJSONCache()
+
+def discard_form_json(mapper, connection, target):
+    form_json_cache.discard(target.id)
+
+def discard_translation_form_json(mapper, connection, target):
+    form_json_cache.discard(target.form_id)
+
+for event_name in ('after_update', 'after_delete'):
+    event.listen(model.Form, event_name, discard_form_json)
+    event.listen(model.Translation, event_name, discard_translation_form_json)
+    for model_name in ('User', 'Speaker', 'ElicitationMethod', 'SyntacticCategory',
+                       'Source', 'Tag', 'File'):
+        event.listen(getattr(model, model_name), event_name, form_json_cache.clear)
+
+for event_name in ('after_bulk_update', 'after_bulk_delete'):
+    event.listen(SessionClass, event_name, form_json_cache.clear)
+
+class DataVersions(object):
+    """Versions of the tables of the database, incremented by writes.
+
+    Each table has a local version, counting the writes (inserts, updates and
+    deletes) made by this process, and, if ``shared`` is set, a shared version
+    stored in the ``dataversion`` table (cf. model/dataversion.py), counting
+    the committed transactions of all processes that have written to it.  The
+    local version is incremented when a write is executed and again when its
+    transaction ends, so that results read in between are not taken to be
+    current.  The shared versions are incremented inside the transaction of
+    the writes, just before it is committed, so that writes made by other
+    processes are noticed as soon as they are visible.
+
+    """
+
+    def __init__(self):
+        self.versions = {}    # table name => local version
+        self.shared = False
+        self.lock = threading.Lock()
+
+    def listen(self, engine):
+        event.listen(engine, 'after_execute', self.after_execute)
+        event.listen(engine, 'commit', self.commit)
+        event.listen(engine, 'rollback', self.rollback)
+
+    def configure(self, shared=None):
+        if shared is not None:
+            self.shared = bool(shared)
+
+    def get(self, table_names):
+        """Return the versions of the tables in ``table_names`` as a tuple of
+        ``(name, local version, shared version)`` triples.  The shared versions
+        are read with one query in the transaction of ``Session``.
+
+        """
+        table_names = sorted(table_names)
+        if self.shared:
+            shared = get_data_versions(Session.connection(), table_names)
+        else:
+            shared = {}
+        with self.lock:
+            return tuple([(name, self.versions.get(name, 0), shared.get(name, 0))
+                          for name in table_names])
+
+    def increment(self, table_names):
+        with self.lock:
+            for name in table_names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+    def after_execute(self, connection, clauseelement, multiparams, params, result):
+        if isinstance(clauseelement, UpdateBase):
+            name = clauseelement.table.name
+            if name == dataversion_table.name:
+                return
+            self.increment([name])
+            connection.info.setdefault('written_tables', set()).add(name)
+
+    def commit(self, connection):
+        written_tables = connection.info.pop('written_tables', ())
+        if written_tables and self.shared:
+            increment_data_versions(connection, written_tables)
+        self.increment(written_tables)
+
+    def rollback(self, connection):
+        self.increment(connection.info.pop('written_tables', ()))
+
+data_versions = DataVersions()
+
+def get_query_table_names(query):
+    """Return the names of the tables that ``query`` reads, including those of
+    its subqueries.
+
+    """
+    names = set([query.column_descriptions[0]['type'].__table__.name])
+    for table in find_tables(query.statement, check_columns=True, include_aliases=True):
+        name = getattr(getattr(table, 'original', table), 'name', None)
+        if name:
+            names.add(name)
+    return names
+
+
+class SearchResultCache(object):
+    """A least-recently-used cache of the results of searches, i.e., of the
+    ordered ``(id, restricted, enterer_id)`` rows of the models they match.
+
+    Results are keyed by the fingerprint of the search query (cf.
+    ``get_query_fingerprint``) and by the versions of the tables it reads (cf.
+    ``DataVersions``), read before the query is run, so that any write to
+    those tables invalidates them.  If the versions are not shared (i.e., the
+    ``dataversion`` table has not been created), writes made by other
+    processes go unnoticed until results expire after ``ttl`` seconds.
+    Results of more than ``max_rows`` rows are not cached and a ``max_size`` of 0 disables the cache.  Since the
+    rows include the ``restricted`` and ``enterer_id`` values of the models,
+    one cached result serves every user, cf. ``add_cached_pagination``.
+
+    """
+
+    def __init__(self, max_size=100, ttl=300, max_rows=100000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.results = OrderedDict()    # (fingerprint, versions) => (expiry time, rows)
+        self.lock = threading.Lock()
+
+    def configure(self, max_size=None, ttl=None, max_rows=None):
+        if max_size is not None:
+            self.max_size = int(max_size)
+        if ttl is not None:
+            self.ttl = float(ttl)
+        if max_rows is not None:
+            self.max_rows = int(max_rows)
+        self.clear()
+
+    def get_rows(self, query):
+        """Return the ``(id, restricted, enterer_id)`` rows of the models
+        matched by ``query``, in order.  Unlike those of a query for models,
+        the rows of a query for columns are not made unique, so the repetitions
+        produced by joins to to-many relations (e.g., translations or tags) are
+        removed here.
+
+        """
+        model_ = query.column_descriptions[0]['type']
+        key = (get_query_fingerprint(query), data_versions.get(get_query_table_names(query)))
+        with self.lock:
+            result = self.results.pop(key, None)
+            if result and result[0] > time.time():
+                self.results[key] = result
+                return result[1]
+        rows = []
+        ids = set()
+        for row in query.with_entities(model_.id, model_.restricted, model_.enterer_id):
+            if row[0] not in ids:
+                ids.add(row[0])
+                rows.append(tuple(row))
+        if self.max_size > 0 and len(rows) <= self.max_rows:
+            with self.lock:
+                self.results[key] = (time.time() + self.ttl, rows)
+                while len(self.results) > self.max_size:
+                    self.results.popitem(last=False)
+        return rows
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+search_result_cache = SearchResultCache()
+
+def add_cached_pagination(query, paginator, fields=None, user=None):
+    """Return the forms matched by the form search ``query`` as
+    ``add_pagination`` would after ``filter_restricted_models`` and
+    ``eagerload_form``.  The ordered ids of the matches are retrieved from
+    ``search_result_cache`` (or cached there) and restricted forms are removed
+    from them for restricted users; only the forms of the requested page are
+    then retrieved, with one ``IN`` query.
+
+    As with ``get_paginated_query_results``, the paginator of a query ordered
+    by a single column of the model contains a ``cursor`` value; passing it
+    back with the next page makes that page start after the last form of this
+    one, even if forms were added or removed before it in the meantime.
+    Exports are not cached (cf. ``add_pagination``).
+
+    """
+    if search_result_cache.max_size <= 0 or (paginator and paginator.get('export') is not None):
+        query = filter_restricted_models('Form', eagerload_form(query, fields), user)
+        return add_pagination(query, paginator)
+    user = user or session['user']
+    rows = search_result_cache.get_rows(query)
+    if user_is_unrestricted(user, get_unrestricted_user_ids()):
+        ids = [id for id, restricted, enterer_id in rows]
+    else:
+        ids = [id for id, restricted, enterer_id in rows
+               if restricted == False or enterer_id == user.id]
+    if (paginator and paginator.get('page') is not None and
+        paginator.get('items_per_page') is not None):
+        paginator = PaginatorSchema.to_python(paginator)    # raises formencode.Invalid if paginator is invalid
+        paginator['count'] = len(ids)
+        fingerprint = get_query_fingerprint(query)
+        start, end = get_start_and_end_from_paginator(paginator)
+        cursor = paginator.pop('cursor', None)
+        cursor = cursor and decode_paginator_cursor(cursor)
+        if cursor and cursor[0] == paginator['page'] - 1 and cursor[3] == fingerprint and \
+            cursor[2] in ids:
+            start = ids.index(cursor[2]) + 1
+            end = start + paginator['items_per_page']
+        items = get_forms_by_ids(ids[start:end], fields)
+        keyset = get_keyset_order_by(query)
+        if keyset and items:
+            paginator['cursor'] = encode_paginator_cursor(paginator['page'],
+                getattr(items[-1], keyset[1]), items[-1].id, fingerprint)
+        return {'paginator': paginator, 'items': items}
+    return get_forms_by_ids(ids, fields)
+
+def get_forms_by_ids(ids, fields=None, chunk_size=500):
+    """Return the (eagerloaded) forms with the ids in ``ids``, in the order of ``ids``."""
+    forms = {}
+    for index in xrange(0, len(ids), chunk_size):
+        for form in eagerload_form(Session.query(Form), fields).filter(
+                Form.id.in_(ids[index:index + chunk_size])):
+            forms[form.id] = form
+    return [forms[id] for id in ids if id in forms]
+
+def get_query_fingerprint(query):
+    """Return a string that identifies the SQL and the parameters of ``query``."""
+    compiled = query.statement.compile()
+    params = sorted((k, repr(v)) for k, v in compiled.params.iteritems())
+    return md5('%s|%s' % (unicode(compiled).encode('utf8'), repr(params))).hexdigest()
+
+def get_keyset_order_by(query):
+    """Return a ``(model, attribute name, expression, direction)`` tuple
+    describing the single ORDER BY clause of ``query`` if that clause orders by
+    a column of the queried model; otherwise return ``None``.
+
+    Queries built by ``add_order_by`` and ``SQLAQueryBuilder`` (possibly with
+    SQLite's ``COLLATE NOCASE``) have this form.
+
+    """
+    order_by = getattr(query, '_order_by', None)
+    if not order_by or len(order_by) != 1:
+        return None
+    try:
+        model_ = query.column_descriptions[0]['type']
+        table = model_.__table__
+    except (AttributeError, IndexError, KeyError):
+        return None
+    clause = order_by[0]
+    direction = {operators.asc_op: 'asc', operators.desc_op: 'desc'}.get(
+        getattr(clause, 'modifier', None))
+    if direction is None:
+        return None
+    expression = clause.element
+    column = getattr(expression, 'left', expression)    # e.g., collate(column, 'NOCASE')
+    column_table = getattr(column, 'table', None)
+    if column_table is None or getattr(column_table, 'name', None) != table.name or \
+        getattr(column, 'key', None) not in table.c or 'id' not in table.c:
+        return None
+    attribute = model_.__mapper__.get_property_by_column(table.c[column.key]).key
+    return model_, attribute, expression, direction
+
+def encode_cursor_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'date': value.isoformat()}
+    return value
+
+def decode_cursor_value(value):
+    if isinstance(value, dict):
+        if 'datetime' in value:
+            try:
+                return datetime.datetime.strptime(value['datetime'], '%Y-%m-%dT%H:%M:%S.%f')
+            except ValueError:
+                return datetime.datetime.strptime(value['datetime'], '%Y-%m-%dT%H:%M:%S')
+        return datetime.datetime.strptime(value['date'], '%Y-%m-%d').date()
+    return value
+
+def encode_paginator_cursor(page, value, id_, fingerprint):
+    """Return an opaque cursor that lets the page after ``page`` be retrieved by seeking past
+    the row with ORDER BY value ``value`` and id ``id_``.
+
+    """
+    cursor = json.dumps({'page': page, 'key': [encode_cursor_value(value), id_],
+                         'query': fingerprint})
+    return unicode(base64.urlsafe_b64encode(cursor))
+
+def decode_paginator_cursor(cursor):
+    """Return the ``(page, value, id, fingerprint)`` encoded in a cursor or ``None`` if it is invalid."""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        value, id_ = cursor['key']
+        return int(cursor['page']), decode_cursor_value(value), int(id_), cursor['query']
+    except Exception:
+        return None
+
 def get_paginated_query_results(query, paginator):
+    """Return the page of the results of ``query`` specified by ``paginator``.
+
+    The count of the results is cached briefly (cf. ``CountCache``).  If the
+    query is ordered by a single column of the queried model, rows are ordered
+    by that column and then by id, and the returned paginator contains a
+    ``cursor`` value: if a request for the next page passes this cursor back in
+    its paginator, that page is retrieved by seeking past the last row of this
+    page (keyset pagination) instead of with OFFSET, so that late pages are as
+    fast as early ones.  Requests for any other page, with a stale or invalid
+    cursor or with a cursor whose last row has a NULL value, fall back to
+    OFFSET/LIMIT.
+
+    """
+    keyset = get_keyset_order_by(query)
+    fingerprint = get_query_fingerprint(query)
     if 'count' not in paginator:
-        paginator['count'] = query.count()
-    start, end = get_start_and_end_from_paginator(paginator)
+        count = paginator_count_cache.get(fingerprint)
+        if count is None:
+            count = query.count()
+            paginator_count_cache.set(fingerprint, count)
+        paginator['count'] = count
+    cursor = paginator.pop('cursor', None)
+    if keyset is None:
+        start, end = get_start_and_end_from_paginator(paginator)
+        return {
+            'paginator': paginator,
+            'items': query.slice(start, end).all()
+        }
+    model_, attribute, expression, direction = keyset
+    order, compare = {'asc': (asc, operator.gt), 'desc': (desc, operator.lt)}[direction]
+    if attribute != 'id':
+        query = query.order_by(order(model_.id))
+    cursor = cursor and decode_paginator_cursor(cursor)
+    if cursor and cursor[0] == paginator['page'] - 1 and cursor[3] == fingerprint and \
+        cursor[1] is not None:
+        cursor_page, value, id_, cursor_fingerprint = cursor
+        if attribute == 'id':
+            condition = compare(model_.id, id_)
+        else:
+            condition = or_(compare(expression, value),
+                            and_(expression == value, compare(model_.id, id_)))
+            if direction == 'desc':
+                # MySQL and SQLite order NULL values last in descending order.
+                condition = or_(condition, expression == None)
+        items = query.filter(condition).limit(paginator['items_per_page']).all()
+    else:
+        start, end = get_start_and_end_from_paginator(paginator)
+        items = query.slice(start, end).all()
+    if items:
+        paginator['cursor'] = encode_paginator_cursor(paginator['page'],
+            getattr(items[-1], attribute), items[-1].id, fingerprint)
     return {
         'paginator': paginator,
-        'items': query.slice(start, end).all()
+        'items': items
     }
 
 def add_pagination(query, paginator):
+    """Return the results of ``query``, paginated if ``paginator`` specifies a
+    page and a number of items per page; cf. ``get_paginated_query_results``.
+    If ``paginator`` specifies an ``export`` format (e.g., the query string of
+    ``GET /forms?export=ndjson``), return an ``ExportStream`` of all of the
+    results instead.
+
+    """
+    if paginator and paginator.get('export') is not None:
+        export = ExportSchema.to_python(paginator)['export']    # raises formencode.Invalid if export is invalid
+        return ExportStream(query, compress=export == u'ndjson.gz')
     if (paginator and paginator.get('page') is not None and
         paginator.get('items_per_page') is not None):
         paginator = PaginatorSchema.to_python(paginator)    # raises formencode.Invalid if paginator is invalid
@@ -959,6 +1594,61 @@ def add_pagination(query, paginator):
     else:
         return query.all()
 
+class ExportStream(object):
+    """A WSGI iterator over the results of a query as newline-delimited JSON,
+    optionally gzipped.  Only ``chunk_size`` models are in memory at a time:
+    chunks are retrieved in ``id`` order by seeking past the last ``id`` of the
+    previous chunk (``yield_per`` cannot be combined with the subquery eager
+    loading of form, file and collection queries) and are expunged from the
+    session once encoded.
+
+    The stream is iterated after the controller has returned and
+    ``Session.remove`` has closed the session of the query, which is therefore
+    reopened for the duration of the export and closed when it ends.
+
+    """
+
+    def __init__(self, query, compress=False, chunk_size=500):
+        self.query = query
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.model = query.column_descriptions[0]['type']
+        if compress:
+            self.content_type = 'application/x-gzip'
+            self.filename = '%s.ndjson.gz' % self.model.__tablename__
+        else:
+            self.content_type = 'application/x-ndjson'
+            self.filename = '%s.ndjson' % self.model.__tablename__
+
+    def __iter__(self):
+        session_ = self.query.session
+        compressor = self.compress and zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        query = self.query.order_by(None).order_by(asc(self.model.id))
+        last_id = None
+        try:
+            while True:
+                chunk_query = query
+                if last_id is not None:
+                    chunk_query = chunk_query.filter(self.model.id > last_id)
+                models = chunk_query.limit(self.chunk_size).all()
+                if not models:
+                    break
+                last_id = models[-1].id
+                if hasattr(self.model, 'reconstruct'):
+                    self.model.reconstruct(session_, models)    # e.g., delta-encoded form backups
+                chunk = ''.join(['%s\n' % json.dumps(model_, cls=JSONOLDEncoder)
+                                 for model_ in models])
+                del models
+                session_.expunge_all()
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+            if compressor:
+                yield compressor.flush()
+        finally:
+            session_.close()
+
 def add_order_by(query, order_by_params, query_builder, primary_key='id'):
     """Add an ORDER BY clause to the query using the get_SQLA_order_by method of
     the supplied query_builder (if possible) or using a default ORDER BY <primary_key> ASC.
@@ -1293,7 +1983,7 @@ def get_state_object(values):
 # Authorization Functions
 ################################################################################
 
-def user_is_authorized_to_access_model(user, model_object, unrestricted_users):
+def user_is_authorized_to_access_model(user, model_object, unrestricted_user_ids):
     """Return True if the user is authorized to access the model object.  Models
     tagged with the 'restricted' tag are only accessible to administrators, their
     enterers and unrestricted users.
@@ -1311,25 +2001,24 @@ def user_is_authorized_to_access_model(user, model_object, unrestricted_users):
         enterer_id = model_backup_dict['enterer'].get('id', None)
     return not tags or \
         'restricted' not in tag_names or \
-        user in unrestricted_users or \
+        user.id in unrestricted_user_ids or \
         user.id == enterer_id
 
 
-def user_is_unrestricted(user, unrestricted_users):
+def user_is_unrestricted(user, unrestricted_user_ids):
     """Return True if the user is an administrator, unrestricted or there is no
     restricted tag.
     """
     restricted_tag = get_restricted_tag()
     return not restricted_tag or user.role == u'administrator' or \
-                                           user in unrestricted_users
+                            user.id in unrestricted_user_ids
 
 
-def get_unrestricted_users():
-    """Return the list of unrestricted users in
-    app_globals.application_settings.application_settings.unrestricted_users.
+def get_unrestricted_user_ids():
+    """Return the set of the ids of the unrestricted users of the active
+    application settings, cf. ``ApplicationSettingsSnapshot``.
     """
-    return getattr(getattr(getattr(app_globals, 'application_settings', None),
-                   'application_settings', None), 'unrestricted_users', [])
+    return getattr(get_application_settings_snapshot(), 'unrestricted_user_ids', frozenset())
 
 
 unauthorized_msg = {'error': 'You are not authorized to access this resource.'}
@@ -1358,6 +2047,11 @@ class PaginatorSchema(Schema):
     items_per_page = Int(not_empty=True, min=1)
     page = Int(not_empty=True, min=1)
 
+class ExportSchema(Schema):
+    allow_extra_fields = True
+    filter_extra_fields = False
+    export = OneOf([u'ndjson', u'ndjson.gz'])
+
 class OrderBySchema(Schema):
     allow_extra_fields = True
     filter_extra_fields = False
@@ -1424,27 +2118,27 @@ collection_types = (
 # Corpus formats -- determine how a corpus is rendered as a file, e.g., a
 # treebank will output a file containing representations of phrase structure for
 # each form in the corpus and the file will be called ``corpus_1.tbk`` ...
+# ``columns`` lists the form attributes that the writer needs.
 
 corpus_formats = {
     'treebank': {
         'extension': 'tbk',
         'suffix': '',
+        'columns': ['id', 'syntax'],
         'writer': lambda f: u'(TOP-%d %s)\n' % (f.id, f.syntax)
     },
     'transcriptions only': {
         'extension': 'txt',
         'suffix': '_transcriptions',
+        'columns': ['transcription'],
         'writer': lambda f: u'%s\n' % f.transcription
     }
 }
 
 
-# This is the regex for finding form references in the contents of collections.
-form_reference_pattern = re.compile('[Ff]orm\[([0-9]+)\]')
-
-# This is the regex for finding collection references in the contents of collections.
-#collection_reference_pattern = re.compile('[cC]ollection[\(\[](\d+)[\)\]]')
-collection_reference_pattern = re.compile('[cC]ollection[\[\(](\d+)[\]\)]')
+# The regexes for finding form and collection references in the contents of
+# collections are defined in model/collection.py: form_reference_pattern and
+# collection_reference_pattern.
 
 def get_ids_of_forms_referenced(referencing_string):
     """Return a list of form ids corresponding to the form references in ``referencing_string``."""
@@ -1546,7 +2240,7 @@ def get_gmail_config(**kwargs):
         return None
 
 def get_object_language_id():
-    return getattr(get_application_settings(), 'object_language_id', 'old')
+    return getattr(get_application_settings_snapshot(), 'object_language_id', 'old')
 
 def send_password_reset_email_to(user, new_password, **kwargs):
     """Send the "password reset" email to the user.  **kwargs should contain a
@@ -1703,27 +2397,90 @@ def ffmpeg_encodes(format_):
 # Eager loading of model queries
 ################################################################################
 
-# It appears that SQLAlchemy does not query the db to retrieve a relational scalar
-# when the foreign key id col value is NULL.  Therefore, eager loading on relational
-# scalars is pointless if not wasteful.  However, collections that will always be
-# accessed should always be eager loaded.
+# The eagerload_<model> functions below make the number of SELECT statements
+# issued in serializing a page of models (via get_dict) independent of the
+# number of models on the page.  All relations accessed by get_dict are loaded
+# via subqueryload: relational scalars (e.g., enterer) cost one extra query per
+# page instead of one per distinct value and collections (e.g., tags) do not
+# multiply the rows of the main query as joinedload would.  Cf.
+# tests/functional/test_query_counts.py.
+
+# Relations accessed by Form.get_dict.
+form_eagerloaded_relations = ('elicitor', 'enterer', 'modifier', 'verifier',
+    'speaker', 'elicitation_method', 'syntactic_category', 'source',
+    'translations', 'tags', 'files')
+
+def get_eagerload_options(relations, prefix=u'', fields=None):
+    """Return a list of subqueryload options for ``relations``, each path
+    prefixed by ``prefix``.  If a list of ``fields`` is supplied (cf.
+    ``get_fields``), only the relations in it are loaded.
+
+    """
+    return [subqueryload_all('%s%s' % (prefix, relation)) for relation in relations
+            if fields is None or relation in fields]
+
+def get_fields(model_name, fields):
+    """Return the list of ``fields`` (i.e., ``get_dict`` keys) of ``model_name``
+    models requested in a search, or ``None`` if none were requested (i.e.,
+    all fields are to be returned).
+
+    :raises: formencode.Invalid if ``fields`` is not a non-empty list of keys of
+        the dicts returned by ``get_dict``.
+
+    """
+    if fields is None:
+        return None
+    valid_fields = getattr(model, model_name).get_dict_keys()
+    if not (isinstance(fields, list) and fields and
+            all(isinstance(f, basestring) and f in valid_fields for f in fields)):
+        msg = u'The fields of %s resources must be a non-empty list containing one or more of %s.' % (
+            model_name, u', '.join(sorted(valid_fields)))
+        raise Invalid(msg, fields, None, error_dict={'fields': Invalid(msg, fields, None)})
+    return fields
+
+def get_projection_options(query, model_, fields):
+    """Return a list of options that defer the loading of the columns of
+    ``model_`` that are not needed to build the requested ``fields``.  The
+    columns needed are those of the fields themselves, the primary key, the
+    local columns of the requested relations and the ORDER BY column used for
+    keyset pagination (cf. ``get_paginated_query_results``).
+
+    """
+    if fields is None:
+        return []
+    mapper = model_.__mapper__
+    needed = set(fields) | set(['id'])
+    for field in fields:
+        property_ = mapper.get_property(field)
+        if isinstance(property_, RelationshipProperty):
+            needed.update([mapper.get_property_by_column(c).key for c in property_.local_columns])
+    keyset = get_keyset_order_by(query)
+    if keyset:
+        needed.add(keyset[1])
+    return [defer(property_.key) for property_ in mapper.iterate_properties
+            if isinstance(property_, ColumnProperty) and property_.key not in needed]
+
+def project(result, fields):
+    """Replace the models in ``result`` (a list or a dict of paginated results)
+    with dicts containing only their ``fields``; if ``fields`` is ``None``,
+    return ``result`` unchanged.
+
+    """
+    if fields is None:
+        return result
+    if isinstance(result, dict):
+        result['items'] = [m.get_projected_dict(fields) for m in result['items']]
+        return result
+    return [m.get_projected_dict(fields) for m in result]
 
 def get_eagerloader(model_name):
-    return globals().get('eagerload' + model_name, lambda x: x)
+    """Return the eagerload_<model> function for ``model_name`` (e.g., 'FormSearch'), if there is one."""
+    return globals().get('eagerload_' + camel_case2lower_space(model_name).replace(u' ', u'_'),
+                         lambda x: x)
 
-def eagerload_form(query):
-    return query.options(
-        #subqueryload(model.Form.elicitor),
-        subqueryload(model.Form.enterer),   # All forms *should* have enterers
-        subqueryload(model.Form.modifier),
-        #subqueryload(model.Form.verifier),
-        #subqueryload(model.Form.speaker),
-        #subqueryload(model.Form.elicitation_method),
-        #subqueryload(model.Form.syntactic_category),
-        #subqueryload(model.Form.source),
-        joinedload(model.Form.translations),
-        joinedload(model.Form.files),
-        joinedload(model.Form.tags))
+def eagerload_form(query, fields=None):
+    return query.options(*(get_eagerload_options(form_eagerloaded_relations, fields=fields) +
+                           get_projection_options(query, model.Form, fields)))
 
 def eagerload_application_settings(query):
     return query.options(
@@ -1732,49 +2489,43 @@ def eagerload_application_settings(query):
         #subqueryload(model.ApplicationSettings.storage_orthography)
     )
 
-def eagerload_collection(query, eagerload_forms=False):
-    """Eagerload the relational attributes of collections most likely to have values.
-
-    subqueryload(model.Collection.speaker),
-    subqueryload(model.Collection.elicitor),
-    subqueryload(model.Collection.source),
+def eagerload_collection(query, eagerload_forms=False, fields=None):
+    """Eagerload the relational attributes of collections accessed by
+    ``Collection.get_dict`` and, if ``eagerload_forms`` is ``True``, those of
+    their forms, as accessed by ``Collection.get_full_dict``.  If ``fields``
+    are supplied, only the relations and columns they require are loaded.
 
     """
+    options = get_eagerload_options(('speaker', 'source', 'elicitor', 'enterer',
+                                     'modifier', 'tags', 'files'), fields=fields)
     if eagerload_forms:
-        return query.options(
-            subqueryload(model.Collection.enterer),
-            subqueryload(model.Collection.modifier),
-            subqueryload(model.Collection.forms),
-            joinedload(model.Collection.tags),
-            joinedload(model.Collection.files))
-    else:
-        return query.options(
-            subqueryload(model.Collection.enterer),
-            subqueryload(model.Collection.modifier),
-            joinedload(model.Collection.tags),
-            joinedload(model.Collection.files))
+        options += get_eagerload_options(form_eagerloaded_relations, u'forms.')
+    options += get_projection_options(query, model.Collection, fields)
+    return query.options(*options)
 
 def eagerload_corpus(query, eagerload_forms=False):
-    """Eagerload the relational attributes of corpora most likely to have values."""
+    """Eagerload the relational attributes of corpora accessed by
+    ``Corpus.get_dict`` and, if ``eagerload_forms`` is ``True``, those of their
+    forms.
+
+    """
+    options = get_eagerload_options(('enterer', 'modifier', 'form_search', 'tags', 'files'))
     if eagerload_forms:
-        return query.options(
-            subqueryload(model.Corpus.enterer),
-            subqueryload(model.Corpus.modifier),
-            subqueryload(model.Corpus.forms),
-            joinedload(model.Corpus.tags))
-    else:
-        return query.options(
-            subqueryload(model.Corpus.enterer),
-            subqueryload(model.Corpus.modifier),
-            joinedload(model.Corpus.tags))
+        options += get_eagerload_options(form_eagerloaded_relations, u'forms.')
+    return query.options(*options)
 
-def eagerload_file(query):
-    return query.options(
-        subqueryload(model.File.enterer),
-        #subqueryload(model.File.elicitor),
-        #subqueryload(model.File.speaker),
-        joinedload(model.File.tags),
-        joinedload(model.File.forms))
+def eagerload_file(query, fields=None):
+    """Eagerload the relational attributes of files accessed by ``File.get_dict``,
+    including those of the forms associated to each file.  If ``fields`` are
+    supplied, only the relations and columns they require are loaded.
+
+    """
+    options = get_eagerload_options(('enterer', 'elicitor', 'speaker', 'tags', 'forms',
+                                     'parent_file'), fields=fields)
+    if fields is None or 'forms' in fields:
+        options += get_eagerload_options(form_eagerloaded_relations, u'forms.')
+    options += get_projection_options(query, model.File, fields)
+    return query.options(*options)
 
 def eagerload_form_search(query):
     #return query.options(subqueryload(model.FormSearch.enterer))
@@ -2014,9 +2765,9 @@ def chunker(sequence, size):
 def get_morpheme_splitter():
     """Return a function that will split words into morphemes."""
     morpheme_splitter = lambda x: [x] # default, word is morpheme
-    morpheme_delimiters = get_morpheme_delimiters()
-    if morpheme_delimiters:
-        morpheme_splitter = re.compile(u'([%s])' % ''.join([esc_RE_meta_chars(d) for d in morpheme_delimiters])).split
+    application_settings = get_application_settings_snapshot()
+    if application_settings and application_settings.morpheme_delimiters_list:
+        morpheme_splitter = application_settings.morpheme_and_delimiter_splitter_regex.split
     return morpheme_splitter
 
 def extract_word_pos_sequences(form, unknown_category, morpheme_splitter=None, extract_morphemes=False):
@@ -26,7 +26,10 @@ from onlinelinguisticdatabase.model.file import File
 from onlinelinguisticdatabase.model.form import Form, FormFile
 from onlinelinguisticdatabase.model.formbackup import FormBackup
 from onlinelinguisticdatabase.model.formsearch import FormSearch
+from onlinelinguisticdatabase.model.formtrigram import formtrigram_table
+from onlinelinguisticdatabase.model.dataversion import dataversion_table
 from onlinelinguisticdatabase.model.translation import Translation
+from onlinelinguisticdatabase.model.job import Job
 from onlinelinguisticdatabase.model.language import Language
 from onlinelinguisticdatabase.model.morphemelanguagemodel import MorphemeLanguageModel
 from onlinelinguisticdatabase.model.morphemelanguagemodelbackup import MorphemeLanguageModelBackup
@@ -46,7 +49,7 @@ from onlinelinguisticdatabase.model.user import User, UserForm
 
 __all__ = ['Session', 'Base', 'ApplicationSettings', 'Collection', 'CollectionBackup', 
         'Corpus', 'CorpusFile', 'CorpusBackup', 'ElicitationMethod', 'File', 'Form', 
-        'FormFile', 'FormBackup', 'FormSearch', 'Translation', 'Language', 'MorphemeLanguageModel',
+        'FormFile', 'FormBackup', 'FormSearch', 'Translation', 'Job', 'Language', 'MorphemeLanguageModel',
         'MorphemeLanguageModelBackup', 'MorphologicalParser', 'MorphologicalParserBackup',
         'Morphology', 'MorphologyBackup', 'Orthography', 'Page', 'Parse', 'Phonology', 'PhonologyBackup',
         'Source', 'Speaker', 'SyntacticCategory', 'Tag', 'User', 'UserForm']
@@ -14,10 +14,14 @@
 
 """Collection model"""
 
-from sqlalchemy import Table, Column, Sequence, ForeignKey
-from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime
+import re
+from sqlalchemy import Table, Column, Sequence, ForeignKey, event
+from sqlalchemy.sql import select
+from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Boolean
 from sqlalchemy.orm import relation, backref
+from sqlalchemy.orm.attributes import get_history
 from onlinelinguisticdatabase.model.meta import Base, now
+from onlinelinguisticdatabase.model.tag import maintain_restricted_flag
 
 collectionfile_table = Table('collectionfile', Base.metadata,
     Column('id', Integer, Sequence('collectionfile_seq_id', optional=True), primary_key=True),
@@ -27,6 +31,26 @@ collectionfile_table = Table('collectionfile', Base.metadata,
     mysql_charset='utf8'
 )
 
+# The references to forms and collections in the contents of a collection, e.g.,
+# "form[12]" and "collection[3]" (or "collection(3)").
+form_reference_pattern = re.compile('[Ff]orm\[([0-9]+)\]')
+collection_reference_pattern = re.compile('[cC]ollection[\[\(](\d+)[\]\)]')
+
+# The forms and collections referenced directly in the contents of each
+# collection.  Each row records a reference to either a collection or a form.
+# The table lets us find the collections that reference a form or collection
+# without scanning the collection table with regular expressions (cf.
+# get_collections_referencing_this_collection in controllers/oldcollections.py).
+# A single row with a NULL collection_id records that the table has been built
+# (cf. rebuild_collection_references).
+collectionreference_table = Table('collectionreference', Base.metadata,
+    Column('id', Integer, Sequence('collectionreference_seq_id', optional=True), primary_key=True),
+    Column('collection_id', Integer, ForeignKey('collection.id'), index=True),
+    Column('referenced_collection_id', Integer, index=True),
+    Column('referenced_form_id', Integer, index=True),
+    mysql_charset='utf8'
+)
+
 collectiontag_table = Table('collectiontag', Base.metadata,
     Column('id', Integer, Sequence('collectiontag_seq_id', optional=True), primary_key=True),
     Column('collection_id', Integer, ForeignKey('collection.id')),
@@ -66,6 +90,7 @@ class Collection(Base):
     datetime_entered = Column(DateTime)
     datetime_modified = Column(DateTime, default=now)
     tags = relation('Tag', secondary=collectiontag_table)
+    restricted = Column(Boolean, default=False, index=True)    # cf. model.tag.maintain_restricted_flag
     files = relation('File', secondary=collectionfile_table, backref='collections')
     # forms attribute is defined in a relation/backref in the form model
 
@@ -115,3 +140,84 @@ class Collection(Base):
         result = self.get_dict()
         result['forms'] = self.get_forms_list(self.forms)
         return result
+
+    def get_backup_dict(self):
+        """Return the representation of the collection that is backed up (cf.
+        ``CollectionBackup.vivify``): the forms are represented by their ids.
+
+        """
+        result = self.get_dict()
+        result['forms'] = [form.id for form in self.forms]
+        return result
+
+def get_collection_reference_rows(collection_id, contents):
+    """Return the ``collectionreference`` rows (as dicts) for the contents of a
+    collection.  Every row has the same keys since an executemany insert is
+    compiled from the keys of its first row.
+
+    """
+    contents = contents or u''
+    return [get_collection_reference_row(collection_id, referenced_collection_id=int(id))
+            for id in set(collection_reference_pattern.findall(contents))] + \
+           [get_collection_reference_row(collection_id, referenced_form_id=int(id))
+            for id in set(form_reference_pattern.findall(contents))]
+
+def get_collection_reference_row(collection_id, referenced_collection_id=None,
+                                 referenced_form_id=None):
+    return {'collection_id': collection_id,
+            'referenced_collection_id': referenced_collection_id,
+            'referenced_form_id': referenced_form_id}
+
+def collection_references_are_built(connection):
+    table = collectionreference_table
+    return connection.execute(select([table.c.id]).where(
+        table.c.collection_id == None)).first() is not None
+
+def rebuild_collection_references(connection):
+    """(Re)build the table of references for every collection in the database.
+
+    :param connection: an SQLAlchemy connection (or session).
+    :returns: ``None``
+
+    """
+    table = collectionreference_table
+    connection.execute(table.delete())
+    rows = []
+    collection = Collection.__table__
+    for id, contents in connection.execute(select(
+            [collection.c.id, collection.c.contents])).fetchall():
+        rows += get_collection_reference_rows(id, contents)
+        if len(rows) >= 1000:
+            connection.execute(table.insert(), rows)
+            rows = []
+    rows.append(get_collection_reference_row(None))    # marks the table as built
+    connection.execute(table.insert(), rows)
+
+def ensure_collection_references(connection):
+    """Build the table of collection references if it has not been built."""
+    if not collection_references_are_built(connection):
+        rebuild_collection_references(connection)
+
+def index_collection_references(mapper, connection, target):
+    """Replace the reference rows of a collection that has just been inserted or updated."""
+    if target.id is None:
+        return
+    history = get_history(target, 'contents')
+    if not (history.added or history.deleted):
+        return
+    table = collectionreference_table
+    connection.execute(table.delete().where(table.c.collection_id == target.id))
+    rows = get_collection_reference_rows(target.id, target.contents)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def unindex_collection_references(mapper, connection, target):
+    """Remove the reference rows of a collection that is about to be deleted."""
+    table = collectionreference_table
+    connection.execute(table.delete().where(table.c.collection_id == target.id))
+
+event.listen(Collection, 'after_insert', index_collection_references)
+event.listen(Collection, 'after_update', index_collection_references)
+event.listen(Collection, 'before_delete', unindex_collection_references)
+
+maintain_restricted_flag(Collection)
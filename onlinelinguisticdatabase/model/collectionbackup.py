@@ -20,9 +20,10 @@ seemed like more trouble than it's worth.
 """
 
 from sqlalchemy import Table, Column, Sequence, ForeignKey
-from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime
+from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Boolean
 from sqlalchemy.orm import relation, backref
 from onlinelinguisticdatabase.model.meta import Base, now
+from onlinelinguisticdatabase.model.tag import tags_include_restricted
 import simplejson as json
 import datetime
 
@@ -44,6 +45,7 @@ class CollectionBackup(Base):
     markup_language = Column(Unicode(100))
     contents = Column(UnicodeText)
     html = Column(UnicodeText)
+    html_hash = Column(Unicode(40), index=True)    # cf. Model.compact
     date_elicited = Column(Date)
     datetime_entered = Column(DateTime)
     datetime_modified = Column(DateTime, default=now)
@@ -53,14 +55,18 @@ class CollectionBackup(Base):
     enterer = Column(UnicodeText)
     modifier = Column(UnicodeText)
     tags = Column(UnicodeText)
+    restricted = Column(Boolean, default=False, index=True)
     files = Column(UnicodeText)
-    forms = Column(UnicodeText)
+    forms = Column(UnicodeText)     # JSON array of form ids
+
+    compacted_attributes = ('html',)
 
     def vivify(self, collection_dict):
         """The vivify method gives life to CollectionBackup by specifying its
         attributes using the to-be-backed-up collection as represented in
-        ``collection_dict``.  The relational attributes of the backup are
-        converted to (truncated) JSON objects.
+        ``collection_dict`` (cf. ``Collection.get_backup_dict``).  The
+        relational attributes of the backup are converted to (truncated) JSON
+        objects; the forms are represented by their ids only.
 
         """
 
@@ -82,8 +88,9 @@ class CollectionBackup(Base):
         self.enterer = unicode(json.dumps(collection_dict['enterer']))
         self.modifier = unicode(json.dumps(collection_dict['modifier']))
         self.tags = unicode(json.dumps(collection_dict['tags']))
+        self.restricted = tags_include_restricted(collection_dict['tags'])
         self.files = unicode(json.dumps(collection_dict['files']))
-        self.forms = unicode(json.dumps([f['id'] for f in collection_dict['forms']]))
+        self.forms = unicode(json.dumps(collection_dict['forms']))
 
     def get_dict(self):
         return {
@@ -96,7 +103,7 @@ class CollectionBackup(Base):
             'description': self.description,
             'markup_language': self.markup_language,
             'contents': self.contents,
-            'html': self.html,
+            'html': self.get_backed_up_value('html'),
             'date_elicited': self.date_elicited,
             'datetime_entered': self.datetime_entered,
             'datetime_modified': self.datetime_modified,
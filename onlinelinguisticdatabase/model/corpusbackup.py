@@ -29,7 +29,9 @@ class CorpusBackup(Base):
         Unlike with the collection backup model, the corpus backup model does
         not backup references to forms.  This is because corpora will generally
         reference many, many forms and it would be inefficient to store all of
-        these references as massive (mostly redundant) JSON arrays...
+        these references as massive (mostly redundant) JSON arrays...  For the
+        same reason, a corpus backup stores its ``content`` only if no other
+        backup already stores the same content (cf. ``Model.compact``).
 
     """
     
@@ -46,6 +48,7 @@ class CorpusBackup(Base):
     type = Column(Unicode(255))
     description = Column(UnicodeText)
     content = Column(UnicodeText(length=2**31))
+    content_hash = Column(Unicode(40), index=True)     # cf. Model.compact
     enterer = Column(UnicodeText)
     modifier = Column(UnicodeText)
     form_search = Column(UnicodeText)
@@ -53,6 +56,8 @@ class CorpusBackup(Base):
     datetime_modified = Column(DateTime, default=now)
     tags = Column(UnicodeText)
 
+    compacted_attributes = ('content',)
+
     def vivify(self, corpus_dict):
         """The vivify method gives life to a corpus_backup by specifying its
         attributes using the to-be-backed-up corpus as represented in
@@ -89,7 +94,7 @@ class CorpusBackup(Base):
             'name': self.name,
             'type': self.type,
             'description': self.description,
-            'content': self.content,
+            'content': self.get_backed_up_value('content'),
             'enterer': self.json_loads(self.enterer),
             'modifier': self.json_loads(self.modifier),
             'form_search': self.json_loads(self.form_search),
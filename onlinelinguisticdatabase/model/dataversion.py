@@ -0,0 +1,65 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Versions of the tables of the database, shared by all application processes.
+
+Each row counts the committed transactions that have written to a table.  The
+version of a table is incremented inside the transaction that writes to it
+(cf. ``DataVersions`` in lib/utils.py), so a process that reads a version
+reads data at least as recent as that version.  The per-process caches of
+search results and of form JSON documents are keyed by, or validated against,
+these versions so that writes made by any process invalidate them.
+
+"""
+
+from sqlalchemy import Table, Column
+from sqlalchemy.sql import select
+from sqlalchemy.types import Integer, Unicode
+from onlinelinguisticdatabase.model.meta import Base
+
+dataversion_table = Table('dataversion', Base.metadata,
+    Column('table_name', Unicode(64), primary_key=True),
+    Column('version', Integer, nullable=False, default=0),
+    mysql_charset='utf8'
+)
+
+def ensure_data_versions(connection):
+    """Create the version rows of the tables that do not have one."""
+    table = dataversion_table
+    existing = set([name for (name,) in connection.execute(select([table.c.table_name]))])
+    rows = [{'table_name': unicode(name), 'version': 0}
+            for name in Base.metadata.tables if name not in existing]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def increment_data_versions(connection, table_names):
+    """Increment the versions of the tables in ``table_names``.  The rows are
+    updated in name order so that concurrent transactions lock them in the
+    same order.
+
+    """
+    table = dataversion_table
+    for name in sorted(table_names):
+        result = connection.execute(table.update().where(table.c.table_name == name).values(
+            version=table.c.version + 1))
+        if not result.rowcount:
+            connection.execute(table.insert(), {'table_name': unicode(name), 'version': 1})
+
+def get_data_versions(connection, table_names):
+    """Return a dict from the names in ``table_names`` to their versions (0 if there is no row)."""
+    table = dataversion_table
+    versions = dict.fromkeys(table_names, 0)
+    versions.update(connection.execute(select([table.c.table_name, table.c.version]).where(
+        table.c.table_name.in_(list(table_names)))).fetchall())
+    return versions
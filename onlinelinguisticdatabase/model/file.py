@@ -15,9 +15,10 @@
 """File model"""
 
 from sqlalchemy import Table, Column, Sequence, ForeignKey
-from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Float
+from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Float, Boolean
 from sqlalchemy.orm import relation
 from onlinelinguisticdatabase.model.meta import Base, now
+from onlinelinguisticdatabase.model.tag import maintain_restricted_flag
 
 import logging
 log = logging.getLogger(__name__)
@@ -65,6 +66,7 @@ class File(Base):
     speaker = relation('Speaker')
     utterance_type = Column(Unicode(255))
     tags = relation('Tag', secondary=filetag_table, backref='files')
+    restricted = Column(Boolean, default=False, index=True)    # cf. model.tag.maintain_restricted_flag
 
     # Attributes germane to externally hosted files.
     url = Column(Unicode(255))          # for external files
@@ -106,3 +108,5 @@ class File(Base):
             'start': self.start,
             'end': self.end
         }
+
+maintain_restricted_flag(File)
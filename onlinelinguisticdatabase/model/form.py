@@ -14,10 +14,15 @@
 
 """Form model"""
 
-from sqlalchemy import Table, Column, Sequence, ForeignKey
-from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime
+import re
+from sqlalchemy import Table, Column, Sequence, ForeignKey, Index, event
+from sqlalchemy.sql import select, and_, desc
+from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Boolean
 from sqlalchemy.orm import relation, backref
+from sqlalchemy.orm.attributes import get_history
 from onlinelinguisticdatabase.model.meta import Base, now
+from onlinelinguisticdatabase.model.tag import maintain_restricted_flag
+from onlinelinguisticdatabase.model.applicationsettings import ApplicationSettings
 
 class FormFile(Base):
 
@@ -45,6 +50,25 @@ collectionform_table = Table('collectionform', Base.metadata,
     mysql_charset='utf8'
 )
 
+# Inverted index from the morphemes and glosses of each form's analysis to the
+# form's id.  It lets us find the forms that may reference a lexical item (cf.
+# update_forms_containing_this_form_as_morpheme in controllers/forms.py)
+# without scanning the form table with regular expressions.  A single row with
+# a NULL form_id and an attribute of u'delimiters' records the morpheme
+# delimiters the index was built with; until that row exists (cf.
+# rebuild_morpheme_token_index) the index is not maintained.  The index is
+# built at startup and rebuilt whenever a change to the application settings
+# changes the morpheme delimiters (cf. ensure_morpheme_token_index).
+formmorphemetoken_table = Table('formmorphemetoken', Base.metadata,
+    Column('id', Integer, Sequence('formmorphemetoken_seq_id', optional=True), primary_key=True),
+    Column('form_id', Integer, ForeignKey('form.id'), index=True),
+    Column('attribute', Unicode(20)),    # u'morpheme_break', u'morpheme_gloss' or u'delimiters'
+    Column('token', Unicode(255)),
+    mysql_charset='utf8'
+)
+
+Index('ix_formmorphemetoken_token', formmorphemetoken_table.c.token)
+
 class Form(Base):
     __tablename__ = "form"
     __table_args__ = {'mysql_charset': 'utf8'}
@@ -52,6 +76,8 @@ class Form(Base):
     def __repr__(self):
         return "<Form (%s)>" % self.id
 
+    json_attributes = ('morpheme_break_ids', 'morpheme_gloss_ids')
+
     id = Column(Integer, Sequence('form_seq_id', optional=True), primary_key=True)
     UUID = Column(Unicode(36))
     transcription = Column(Unicode(255), nullable=False)
@@ -92,6 +118,7 @@ class Form(Base):
     files = relation('File', secondary=FormFile.__table__, backref='forms')
     collections = relation('Collection', secondary=collectionform_table, backref='forms')
     tags = relation('Tag', secondary=formtag_table, backref='forms')
+    restricted = Column(Boolean, default=False, index=True)    # cf. model.tag.maintain_restricted_flag
 
     def get_dict(self):
         """Return a Python dictionary representation of the Form.  This
@@ -164,3 +191,116 @@ class Form(Base):
                         morphemes.append((pos, (morpheme, gloss)))
         return pos_sequences, morphemes
 
+
+def get_morpheme_tokens(string, morpheme_delimiters):
+    """Return the set of morphemes in ``string``, i.e., its words split by the
+    morpheme delimiters.  This is the same splitting that
+    ``compile_morphemic_analysis`` (cf. controllers/forms.py) performs.
+
+    :param unicode string: a morpheme break or morpheme gloss value.
+    :param list morpheme_delimiters: the morpheme delimiters, e.g., [u'-', u'=']
+    :returns: a set of unicode morphemes.
+
+    """
+    if not string:
+        return set()
+    tokens = set(string.split())
+    if morpheme_delimiters:
+        splitter = u'[%s]' % u''.join([re.escape(d) for d in morpheme_delimiters])
+        tokens = set(t for word in tokens for t in re.split(splitter, word))
+    tokens.discard(u'')
+    return tokens
+
+def get_morpheme_token_rows(form_id, morpheme_break, morpheme_gloss, morpheme_delimiters):
+    """Return the ``formmorphemetoken`` rows (as dicts) for a form."""
+    rows = []
+    for attribute, value in ((u'morpheme_break', morpheme_break),
+                             (u'morpheme_gloss', morpheme_gloss)):
+        for token in get_morpheme_tokens(value, morpheme_delimiters):
+            rows.append({'form_id': form_id, 'attribute': attribute, 'token': token[:255]})
+    return rows
+
+def get_indexed_morpheme_delimiters(connection):
+    """Return the morpheme delimiters (a comma-delimited string) that the
+    morpheme token index was built with, or ``None`` if it has not been built.
+
+    """
+    table = formmorphemetoken_table
+    return connection.execute(select([table.c.token]).where(and_(
+        table.c.form_id == None, table.c.attribute == u'delimiters'))).scalar()
+
+def rebuild_morpheme_token_index(connection, morpheme_delimiters):
+    """(Re)build the morpheme token index for every form in the database.
+
+    :param connection: an SQLAlchemy connection (or session).
+    :param unicode morpheme_delimiters: the morpheme delimiters as a comma-delimited string.
+    :returns: ``None``
+
+    """
+    table = formmorphemetoken_table
+    delimiters = morpheme_delimiters and morpheme_delimiters.split(u',') or []
+    connection.execute(table.delete())
+    rows = []
+    form = Form.__table__
+    for id, morpheme_break, morpheme_gloss in connection.execute(select(
+            [form.c.id, form.c.morpheme_break, form.c.morpheme_gloss])).fetchall():
+        rows += get_morpheme_token_rows(id, morpheme_break, morpheme_gloss, delimiters)
+        if len(rows) >= 1000:
+            connection.execute(table.insert(), rows)
+            rows = []
+    rows.append({'form_id': None, 'attribute': u'delimiters', 'token': morpheme_delimiters or u''})
+    connection.execute(table.insert(), rows)
+
+def get_active_morpheme_delimiters(connection):
+    """Return the morpheme delimiters (a comma-delimited string) of the active,
+    i.e., most recent, application settings.
+
+    """
+    table = ApplicationSettings.__table__
+    return connection.execute(select([table.c.morpheme_delimiters]).order_by(
+        desc(table.c.id)).limit(1)).scalar() or u''
+
+def ensure_morpheme_token_index(connection):
+    """Build the morpheme token index if it has not been built or if it was
+    built with other morpheme delimiters than those of the active application
+    settings.  Nothing is committed.
+
+    """
+    morpheme_delimiters = get_active_morpheme_delimiters(connection)
+    if get_indexed_morpheme_delimiters(connection) != morpheme_delimiters:
+        rebuild_morpheme_token_index(connection, morpheme_delimiters)
+
+def update_morpheme_token_index(mapper, connection, target):
+    """Rebuild the morpheme token index within the flush that creates, updates
+    or deletes application settings if the morpheme delimiters have changed.
+
+    """
+    ensure_morpheme_token_index(connection)
+
+def index_form_morpheme_tokens(mapper, connection, target):
+    """Replace the morpheme token index rows of a form that has just been inserted or updated."""
+    if target.id is None:
+        return
+    history = [get_history(target, attr) for attr in ('morpheme_break', 'morpheme_gloss')]
+    if not [h for h in history if h.added or h.deleted]:
+        return
+    morpheme_delimiters = get_indexed_morpheme_delimiters(connection)
+    if morpheme_delimiters is None:
+        return
+    table = formmorphemetoken_table
+    connection.execute(table.delete().where(table.c.form_id == target.id))
+    rows = get_morpheme_token_rows(target.id, target.morpheme_break, target.morpheme_gloss,
+                                   morpheme_delimiters and morpheme_delimiters.split(u',') or [])
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def unindex_form_morpheme_tokens(mapper, connection, target):
+    """Remove the morpheme token index rows of a form that is about to be deleted."""
+    table = formmorphemetoken_table
+    connection.execute(table.delete().where(table.c.form_id == target.id))
+
+event.listen(Form, 'after_insert', index_form_morpheme_tokens)
+event.listen(Form, 'after_update', index_form_morpheme_tokens)
+event.listen(Form, 'before_delete', unindex_form_morpheme_tokens)
+
+maintain_restricted_flag(Form)
@@ -17,12 +17,19 @@
 Used to save Form data that has been updated or deleted.  This is a
 non-relational table, because keeping a copy of every single change relationally
 seemed like more trouble than it's worth.
+
+The backups of a form are delta-encoded: they form chains whose first backup is
+a full snapshot and whose subsequent backups store only those values of the
+long, mostly JSON-encoded, attributes that differ from those of the previous
+backup.  The values of the short attributes are stored by every backup.
 """
 
 from sqlalchemy import Table, Column, Sequence, ForeignKey
-from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime
-from sqlalchemy.orm import relation, backref
+from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime, Boolean
+from sqlalchemy.orm import relation, backref, object_session, column_property
+from sqlalchemy.sql import select, case, func, and_, or_, desc, bindparam
 from onlinelinguisticdatabase.model.meta import Base, now
+from onlinelinguisticdatabase.model.tag import tags_include_restricted
 import simplejson as json
 import datetime
 
@@ -35,6 +42,11 @@ class FormBackup(Base):
 
     The load method converts the JSON objects into Python Column objects, thus
     allowing the FormBackup to behave more like a Form object.
+
+    The encode method turns a new backup into a delta of the previous backup of
+    the same form, i.e., it clears the ``delta_attributes`` whose values have
+    not changed.  The get_values method (and the reconstruct class method, for
+    many backups at once) restores them from the earlier backups of the chain.
     """
 
     __tablename__ = "formbackup"
@@ -65,6 +77,9 @@ class FormBackup(Base):
     semantics = Column(Unicode(1023))
     elicitor = Column(UnicodeText)
     enterer = Column(UnicodeText)
+    # The id of the enterer, so that restricted backups can be filtered by an
+    # exact, indexed comparison instead of a match on the enterer JSON.
+    enterer_id = Column(Integer, index=True)
     verifier = Column(UnicodeText)
     speaker = Column(UnicodeText)
     elicitation_method = Column(UnicodeText)
@@ -72,8 +87,36 @@ class FormBackup(Base):
     source = Column(UnicodeText)
     translations = Column(UnicodeText)
     tags = Column(UnicodeText)
+    restricted = Column(Boolean, default=False, index=True)
     files = Column(UnicodeText) 
     modifier = Column(UnicodeText)
+    # The id of the snapshot that begins the chain of a delta backup (NULL for
+    # snapshots) and the JSON list of the delta attributes it stores.
+    snapshot_id = Column(Integer, index=True)
+    changed_attributes = Column(UnicodeText)
+
+    # Attributes that a delta backup stores only if their values have changed.
+    # The identifying, ordering and restricting attributes (UUID, form_id,
+    # transcription, datetime_modified, enterer and restricted) and the
+    # materialized_attributes are always stored.
+    delta_attributes = ('comments', 'speaker_comments', 'morpheme_break_ids',
+        'morpheme_gloss_ids', 'elicitor', 'verifier', 'speaker', 'elicitation_method',
+        'syntactic_category', 'source', 'translations', 'tags', 'files', 'modifier')
+
+    # Short attributes whose values every backup stores, so that searches and
+    # orderings on them use their columns (cf. update_materialized_values).  A
+    # delta backup lists those that have changed in changed_attributes too.
+    materialized_attributes = ('phonetic_transcription', 'narrow_phonetic_transcription',
+        'morpheme_break', 'morpheme_gloss', 'grammaticality', 'date_elicited',
+        'datetime_entered', 'syntactic_category_string', 'break_gloss_category',
+        'syntax', 'semantics')
+
+    # The maximum number of backups in a chain, i.e., every snapshot_interval-th
+    # backup of a form is a full snapshot.
+    snapshot_interval = 10
+
+    # The (reconstructed) values of the delta attributes, cf. get_values.
+    _values = None
 
     def vivify(self, form_dict):
         """The vivify method gives life to FormBackup by specifying its
@@ -108,13 +151,121 @@ class FormBackup(Base):
         self.speaker = unicode(json.dumps(form_dict['speaker']))
         self.elicitor = unicode(json.dumps(form_dict['elicitor']))
         self.enterer = unicode(json.dumps(form_dict['enterer']))
+        self.enterer_id = (form_dict['enterer'] or {}).get('id')
         self.verifier = unicode(json.dumps(form_dict['verifier']))
         self.modifier = unicode(json.dumps(form_dict['modifier']))
         self.translations = unicode(json.dumps(form_dict['translations']))
         self.tags = unicode(json.dumps(form_dict['tags']))
+        self.restricted = tags_include_restricted(form_dict['tags'])
         self.files = unicode(json.dumps(form_dict['files']))
 
+    def encode(self, session):
+        """Make this new backup a delta of the previous backup of the same form
+        by clearing the delta attributes whose values have not changed.  The
+        backup remains a full snapshot if it is the first backup of the form or
+        if the chain of the previous backup is full.  Call this after ``vivify``
+        and before adding the backup to ``session``.
+
+        """
+        self.encode_all(session, [self])
+
+    @classmethod
+    def encode_all(cls, session, backups, chunk_size=500):
+        """Encode the new ``backups`` (of distinct forms) as ``encode`` does,
+        retrieving their previous backups, the lengths of the chains of these
+        and their values with a constant number of queries per ``chunk_size``
+        backups.
+
+        """
+        UUIDs = list(set([backup.UUID for backup in backups]))
+        previous_backups = {}
+        for index in xrange(0, len(UUIDs), chunk_size):
+            ids = [id for id, in session.query(func.max(cls.id)).filter(
+                cls.UUID.in_(UUIDs[index:index + chunk_size])).group_by(cls.UUID)]
+            if ids:
+                previous_backups.update([(previous.UUID, previous) for previous in
+                                         session.query(cls).filter(cls.id.in_(ids))])
+        if not previous_backups:
+            return
+        snapshot_ids = list(set([previous.snapshot_id or previous.id
+                                 for previous in previous_backups.values()]))
+        chain_lengths = {}
+        for index in xrange(0, len(snapshot_ids), chunk_size):
+            chain_lengths.update(session.query(cls.snapshot_id, func.count(cls.id)).filter(
+                cls.snapshot_id.in_(snapshot_ids[index:index + chunk_size])).group_by(
+                cls.snapshot_id).all())
+        cls.reconstruct(session, previous_backups.values())
+        for backup in backups:
+            previous = previous_backups.get(backup.UUID)
+            if previous is not None:
+                snapshot_id = previous.snapshot_id or previous.id
+                backup.encode_delta(previous, snapshot_id, chain_lengths.get(snapshot_id, 0) + 1)
+
+    def encode_delta(self, previous, snapshot_id, chain_length):
+        if chain_length >= self.snapshot_interval:
+            return
+        previous_values = previous.get_values()
+        changed_attributes = []
+        for attribute in self.delta_attributes:
+            if getattr(self, attribute) == previous_values[attribute]:
+                setattr(self, attribute, None)
+            else:
+                changed_attributes.append(attribute)
+        for attribute in self.materialized_attributes:
+            if getattr(self, attribute) != getattr(previous, attribute):
+                changed_attributes.append(attribute)
+        self.snapshot_id = snapshot_id
+        self.changed_attributes = unicode(json.dumps(changed_attributes))
+
+    def get_stored_values(self):
+        """Return a dict from the delta attributes stored by this backup to their values."""
+        if self.snapshot_id is None:
+            attributes = self.delta_attributes
+        else:
+            attributes = [attribute for attribute in json.loads(self.changed_attributes)
+                          if attribute in self.delta_attributes]
+        return dict((attribute, getattr(self, attribute)) for attribute in attributes)
+
+    def get_values(self):
+        """Return a dict from the delta attributes to their values, reconstructing
+        those not stored by a delta backup from the earlier backups of its chain.
+
+        """
+        if self._values is None:
+            if self.snapshot_id is None:
+                self._values = self.get_stored_values()
+            else:
+                self.reconstruct(object_session(self), [self])
+        return self._values
+
+    @classmethod
+    def reconstruct(cls, session, backups, chunk_size=500):
+        """Reconstruct the values of the delta attributes of ``backups`` using
+        a single query for the backups of their chains (per ``chunk_size``
+        chains).
+
+        """
+        snapshot_ids = list(set([b.snapshot_id for b in backups if b.snapshot_id and b._values is None]))
+        if not snapshot_ids:
+            return
+        max_id = max([b.id for b in backups])
+        chains = []
+        for index in xrange(0, len(snapshot_ids), chunk_size):
+            chunk = snapshot_ids[index:index + chunk_size]
+            chains += session.query(cls).filter(or_(cls.id.in_(chunk),
+                cls.snapshot_id.in_(chunk))).filter(cls.id <= max_id).all()
+        chains.sort(key=lambda backup: backup.id)
+        values = {}
+        for backup in chains:
+            if backup.snapshot_id is None:
+                backup_values = backup.get_stored_values()
+            else:
+                backup_values = values[backup.snapshot_id].copy()
+                backup_values.update(backup.get_stored_values())
+            values[backup.snapshot_id or backup.id] = backup._values = backup_values
+
     def get_dict(self):
+        values = self.get_values()
         return {
             'id': self.id,
             'UUID': self.UUID,
@@ -125,28 +276,28 @@ class FormBackup(Base):
             'morpheme_break': self.morpheme_break,
             'morpheme_gloss': self.morpheme_gloss,
             'grammaticality': self.grammaticality,
-            'comments': self.comments,
-            'speaker_comments': self.speaker_comments,
+            'comments': values['comments'],
+            'speaker_comments': values['speaker_comments'],
             'date_elicited': self.date_elicited,
             'datetime_entered': self.datetime_entered,
             'datetime_modified': self.datetime_modified,
             'syntactic_category_string': self.syntactic_category_string,
-            'morpheme_break_ids': self.json_loads(self.morpheme_break_ids),
-            'morpheme_gloss_ids': self.json_loads(self.morpheme_gloss_ids),
+            'morpheme_break_ids': self.json_loads(values['morpheme_break_ids']),
+            'morpheme_gloss_ids': self.json_loads(values['morpheme_gloss_ids']),
             'break_gloss_category': self.break_gloss_category,
             'syntax': self.syntax,
             'semantics': self.semantics,
-            'elicitation_method': self.json_loads(self.elicitation_method),
-            'syntactic_category': self.json_loads(self.syntactic_category),
-            'source': self.json_loads(self.source),
-            'speaker': self.json_loads(self.speaker),
-            'elicitor': self.json_loads(self.elicitor),
+            'elicitation_method': self.json_loads(values['elicitation_method']),
+            'syntactic_category': self.json_loads(values['syntactic_category']),
+            'source': self.json_loads(values['source']),
+            'speaker': self.json_loads(values['speaker']),
+            'elicitor': self.json_loads(values['elicitor']),
             'enterer': self.json_loads(self.enterer),
-            'verifier': self.json_loads(self.verifier),
-            'modifier': self.json_loads(self.modifier),
-            'translations': self.json_loads(self.translations),
-            'tags': self.json_loads(self.tags),
-            'files': self.json_loads(self.files)
+            'verifier': self.json_loads(values['verifier']),
+            'modifier': self.json_loads(values['modifier']),
+            'translations': self.json_loads(values['translations']),
+            'tags': self.json_loads(values['tags']),
+            'files': self.json_loads(values['files'])
         }
 
     def load(self):
@@ -155,33 +306,34 @@ class FormBackup(Base):
 
         """
 
-        if self.elicitation_method:
-            elicitation_method = json.loads(self.elicitation_method)
+        values = self.get_values()
+        if values['elicitation_method']:
+            elicitation_method = json.loads(values['elicitation_method'])
             self.elicitation_method = self.Column()
             self.elicitation_method.id = elicitation_method['id']
             self.elicitation_method.name = elicitation_method['name']
-        if self.syntactic_category:
-            syntactic_category = json.loads(self.syntactic_category)
+        if values['syntactic_category']:
+            syntactic_category = json.loads(values['syntactic_category'])
             self.syntactic_category = self.Column()
             self.syntactic_category.id = syntactic_category['id']
             self.syntactic_category.name = syntactic_category['name']
-        if self.source:
-            source = json.loads(self.source)
+        if values['source']:
+            source = json.loads(values['source'])
             self.source = self.Column()
             self.source.id = source['id']
             self.source.author_first_name = source['author_first_name']
             self.source.author_last_name = source['author_last_name']
             self.source.year = source['year']
             self.source.full_reference = source['full_reference']
-        if self.speaker:
-            speaker = json.loads(self.speaker)
+        if values['speaker']:
+            speaker = json.loads(values['speaker'])
             self.speaker = self.Column()
             self.speaker.id = speaker['id']
             self.speaker.first_name = speaker['first_name']
             self.speaker.last_name = speaker['last_name']
             self.speaker.dialect = speaker['dialect']
-        if self.elicitor:
-            elicitor = json.loads(self.elicitor)
+        if values['elicitor']:
+            elicitor = json.loads(values['elicitor'])
             self.elicitor = self.Column()
             self.elicitor.id = elicitor['id']
             self.elicitor.first_name = elicitor['first_name']
@@ -192,14 +344,14 @@ class FormBackup(Base):
             self.enterer.id = enterer['id']
             self.enterer.first_name = enterer['first_name']
             self.enterer.last_name = enterer['last_name']
-        if self.verifier:
-            verifier = json.loads(self.verifier)
+        if values['verifier']:
+            verifier = json.loads(values['verifier'])
             self.verifier = self.Column()
             self.verifier.id = verifier['id']
             self.verifier.first_name = verifier['first_name']
             self.verifier.last_name = verifier['last_name']
-        if self.translations:
-            translations = json.loads(self.translations)
+        if values['translations']:
+            translations = json.loads(values['translations'])
             self.translations = []
             for translation_dict in translations:
                 translation = self.Column()
@@ -207,16 +359,16 @@ class FormBackup(Base):
                 translation.transcription = translation_dict['transcription']
                 translation.grammaticality = translation_dict['grammaticality']
                 self.translations.append(translation)
-        if self.tags:
-            tags = json.loads(self.tags)
+        if values['tags']:
+            tags = json.loads(values['tags'])
             self.tags = []
             for tag_dict in tags:
                 tag = self.Column()
                 tag.id = tag_dict['id']
                 tag.name = tag_dict['name']
                 self.tags.append(tag)
-        if self.files:
-            files = json.loads(self.files)
+        if values['files']:
+            files = json.loads(values['files'])
             self.files = []
             for file_dict in files:
                 file = self.Column()
@@ -225,9 +377,107 @@ class FormBackup(Base):
                 file.embedded_file_markup = file_dict['embedded_file_markup']
                 file.embedded_file_password = file_dict['embedded_file_password']
                 self.files.append(file)
-        if self.modifier:
-            modifier = json.loads(self.modifier)
+        if values['modifier']:
+            modifier = json.loads(values['modifier'])
             self.modifier = self.Column()
             self.modifier.id = modifier['id']
             self.modifier.first_name = modifier['first_name']
             self.modifier.last_name = modifier['last_name']
+
+def update_enterer_ids(connection, chunk_size=500):
+    """Set the ``enterer_id`` column of the form backups that lack one from
+    their ``enterer`` JSON, e.g., after adding the column to a pre-existing
+    database::
+
+        >>> from onlinelinguisticdatabase.model.formbackup import update_enterer_ids
+        >>> update_enterer_ids(Session.connection()); Session.commit()
+
+    """
+    table = FormBackup.__table__
+    last_id = 0
+    while True:
+        rows = connection.execute(select([table.c.id, table.c.enterer]).where(and_(
+            table.c.enterer_id == None, table.c.id > last_id)).order_by(
+            table.c.id).limit(chunk_size)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        updates = []
+        for id, enterer in rows:
+            try:
+                enterer_id = (json.loads(enterer) or {}).get('id')
+            except (TypeError, ValueError, AttributeError):
+                enterer_id = None
+            if enterer_id is not None:
+                updates.append({'id_': id, 'enterer_id': enterer_id})
+        if updates:
+            connection.execute(table.update().where(table.c.id == bindparam('id_')).values(
+                enterer_id=bindparam('enterer_id')), updates)
+
+def update_materialized_values(connection, chunk_size=100):
+    """Set the materialized attributes of the delta backups made before these
+    were stored by every backup, i.e., when they were delta attributes, from
+    the earlier backups of their chains.  Run this when upgrading a
+    pre-existing database, before new form backups are made::
+
+        >>> from onlinelinguisticdatabase.model.formbackup import update_materialized_values
+        >>> update_materialized_values(Session.connection()); Session.commit()
+
+    """
+    table = FormBackup.__table__
+    attributes = FormBackup.materialized_attributes
+    update = table.update().where(table.c.id == bindparam('id_')).values(
+        dict((attribute, bindparam('value_%s' % attribute)) for attribute in attributes))
+    last_id = 0
+    while True:
+        snapshot_ids = [id for id, in connection.execute(select([table.c.id]).where(and_(
+            table.c.snapshot_id == None, table.c.id > last_id)).order_by(
+            table.c.id).limit(chunk_size))]
+        if not snapshot_ids:
+            return
+        last_id = snapshot_ids[-1]
+        rows = connection.execute(select([table.c.id, table.c.snapshot_id,
+            table.c.changed_attributes] + [table.c[attribute] for attribute in attributes]).where(
+            or_(table.c.id.in_(snapshot_ids), table.c.snapshot_id.in_(snapshot_ids))).order_by(
+            table.c.id)).fetchall()
+        values = {}     # snapshot id => the values of the last backup of its chain
+        updates = []
+        for row in rows:
+            if row['snapshot_id'] is None:
+                values[row['id']] = dict((attribute, row[attribute]) for attribute in attributes)
+                continue
+            chain_values = values[row['snapshot_id']]
+            changed_attributes = json.loads(row['changed_attributes'] or u'[]')
+            for attribute in attributes:
+                if attribute in changed_attributes:
+                    chain_values[attribute] = row[attribute]
+            params = dict(('value_%s' % attribute, value) for attribute, value in chain_values.items())
+            params['id_'] = row['id']
+            updates.append(params)
+        if updates:
+            connection.execute(update, updates)
+
+def get_reconstructed_column(attribute):
+    """Return an SQL expression for the (reconstructed) value of the delta
+    attribute ``attribute`` of a form backup: the value stored by the backup
+    itself if it is a snapshot and otherwise that stored by the last backup of
+    its chain (up to it) that stored the attribute.
+
+    """
+    table = FormBackup.__table__
+    chain = table.alias()
+    stored_value = select([chain.c[attribute]]).where(and_(
+        or_(chain.c.id == table.c.snapshot_id, chain.c.snapshot_id == table.c.snapshot_id),
+        chain.c.id <= table.c.id,
+        or_(chain.c.snapshot_id == None,
+            chain.c.changed_attributes.like(u'%%"%s"%%' % attribute)))).order_by(
+        desc(chain.c.id)).limit(1).as_scalar()
+    return case([(table.c.snapshot_id == None, table.c[attribute])], else_=stored_value)
+
+# Searches and orderings on the delta attributes of form backups use these
+# reconstructed_<attribute> expressions instead of the columns of the
+# attributes, cf. the FormBackup schema of lib/SQLAQueryBuilder.py.  They are
+# deferred, so they are only evaluated by the queries of such searches.
+for attribute in FormBackup.delta_attributes:
+    setattr(FormBackup, 'reconstructed_%s' % attribute,
+            column_property(get_reconstructed_column(attribute), deferred=True))
@@ -0,0 +1,276 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Trigram index of the transcriptions, morpheme breaks, morpheme glosses and
+translations of forms.
+
+Substring searches like ``['Form', 'transcription', 'like', '%abc%']`` cannot
+use a B-tree index and so require a scan of the form table.  The index
+maps each three-character substring (trigram) of the indexed values of a form
+to the form's id.  Every form matching a like or regexp pattern contains the
+trigrams of the pattern's literal substrings, so SQLAQueryBuilder uses the
+index to restrict a search to those candidate forms; the original predicate
+is still applied to verify them.
+
+The index is optional (cf. the ``search_trigram_index`` setting in the config
+file).  A single row with a NULL form_id and an attribute of u'meta' records
+that the index has been built; until that row exists (cf.
+rebuild_trigram_index) the index is neither maintained nor used.
+
+"""
+
+import re
+from sqlalchemy import Table, Column, Sequence, ForeignKey, Index, event
+from sqlalchemy.sql import select, and_, func
+from sqlalchemy.types import Integer, Unicode
+from sqlalchemy.orm.attributes import get_history
+from onlinelinguisticdatabase.model.meta import Base
+from onlinelinguisticdatabase.model.form import Form
+from onlinelinguisticdatabase.model.translation import Translation
+
+# Trigrams are stored as the hex encoding of their UTF-8 bytes so that lookups
+# are exact (i.e., case- and diacritic-sensitive) whatever the collation of the
+# table.
+formtrigram_table = Table('formtrigram', Base.metadata,
+    Column('id', Integer, Sequence('formtrigram_seq_id', optional=True), primary_key=True),
+    Column('form_id', Integer, ForeignKey('form.id'), index=True),
+    Column('attribute', Unicode(20)),   # u'transcription', u'morpheme_break', u'morpheme_gloss', u'translation' or u'meta'
+    Column('trigram', Unicode(24)),
+    mysql_charset='utf8'
+)
+
+Index('ix_formtrigram_trigram', formtrigram_table.c.attribute,
+      formtrigram_table.c.trigram, formtrigram_table.c.form_id)
+
+# Maps the (model name, attribute name) pairs of the searchable attributes to
+# the value of the attribute column of their trigram rows.
+indexed_attributes = {
+    ('Form', 'transcription'): u'transcription',
+    ('Form', 'morpheme_break'): u'morpheme_break',
+    ('Form', 'morpheme_gloss'): u'morpheme_gloss',
+    ('Translation', 'transcription'): u'translation'
+}
+
+form_indexed_attributes = ('transcription', 'morpheme_break', 'morpheme_gloss')
+
+trigram_index_settings = {'enabled': False}
+
+def configure_trigram_index(enabled=False):
+    trigram_index_settings['enabled'] = bool(enabled)
+
+def trigram_index_is_enabled():
+    return trigram_index_settings['enabled']
+
+def encode_trigram(trigram):
+    return unicode(trigram.encode('utf8').encode('hex'))
+
+def get_trigrams(string):
+    """Return the set of three-character substrings of ``string``."""
+    if not string:
+        return set()
+    return set(string[i:i + 3] for i in range(len(string) - 2))
+
+def get_like_pattern_trigrams(pattern):
+    """Return the trigrams that every string matching the like pattern
+    ``pattern`` contains.  Patterns containing escape characters are not
+    analyzed and yield the empty set.
+
+    """
+    if u'\\' in pattern:
+        return set()
+    return set(t for fragment in re.split(u'[%_]', pattern) for t in get_trigrams(fragment))
+
+def get_regexp_pattern_trigrams(pattern):
+    """Return the trigrams that every string matching the regular expression
+    ``pattern`` contains, i.e., those of its runs of literal characters.  The
+    analysis is conservative: patterns with alternations, groups or nested
+    bracket expressions (e.g., ``[[:alpha:]]``) yield the empty set.
+
+    """
+    if u'|' in pattern or u'(' in pattern:
+        return set()
+    fragments = []
+    fragment = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in u'*?{':
+            if fragment:
+                fragment.pop()  # the preceding character is optional
+            if char == u'{':
+                i = pattern.find(u'}', i)
+                if i == -1:
+                    return set()
+        elif char == u'[':
+            j = i + 1
+            if pattern[j:j + 1] == u'^':
+                j += 1
+            if pattern[j:j + 1] == u']':
+                j += 1
+            i = pattern.find(u']', j)
+            if i == -1 or u'\\' in pattern[j:i] or u'[' in pattern[j:i]:
+                return set()    # e.g., POSIX classes like [[:alpha:]], whose ] is not the end
+        elif char == u'\\':
+            i += 1  # escape sequences are not analyzed
+        elif char not in u'.^$+':
+            fragment.append(char)
+            i += 1
+            continue
+        fragments.append(u''.join(fragment))
+        fragment = []
+        i += 1
+    fragments.append(u''.join(fragment))
+    return set(t for fragment in fragments for t in get_trigrams(fragment))
+
+def get_pattern_trigrams(pattern, relation_name):
+    """Return the trigrams of a like or regexp search pattern."""
+    if not isinstance(pattern, basestring):
+        return set()
+    if relation_name == 'like':
+        return get_like_pattern_trigrams(pattern)
+    if relation_name == 'regexp':
+        return get_regexp_pattern_trigrams(pattern)
+    return set()
+
+def get_trigram_indexed_attribute(model_name, attribute_name):
+    return indexed_attributes.get((model_name, attribute_name))
+
+def get_trigram_filter_expression(form_id, attribute, trigrams):
+    """Return an expression that restricts ``form_id`` to the ids of the forms
+    whose ``attribute`` values contain all of ``trigrams``.
+
+    """
+    table = formtrigram_table
+    trigrams = [encode_trigram(t) for t in trigrams]
+    return form_id.in_(select([table.c.form_id]).where(and_(
+        table.c.attribute == attribute, table.c.trigram.in_(trigrams))).group_by(
+        table.c.form_id).having(func.count(table.c.trigram) == len(trigrams)))
+
+def get_trigram_rows(form_id, attribute, values):
+    """Return the ``formtrigram`` rows (as dicts) for the values of an attribute of a form."""
+    trigrams = set()
+    for value in values:
+        trigrams |= get_trigrams(value)
+    return [{'form_id': form_id, 'attribute': attribute, 'trigram': encode_trigram(t)}
+            for t in trigrams]
+
+def get_form_trigram_rows(form_id, transcription, morpheme_break, morpheme_gloss):
+    rows = []
+    for attribute, value in zip(form_indexed_attributes, (transcription, morpheme_break, morpheme_gloss)):
+        rows += get_trigram_rows(form_id, attribute, [value])
+    return rows
+
+def trigram_index_is_built(connection):
+    table = formtrigram_table
+    return connection.execute(select([table.c.id]).where(and_(
+        table.c.form_id == None, table.c.attribute == u'meta'))).first() is not None
+
+def rebuild_trigram_index(connection):
+    """(Re)build the trigram index for every form in the database.
+
+    :param connection: an SQLAlchemy connection (or session).
+    :returns: ``None``
+
+    """
+    table = formtrigram_table
+    connection.execute(table.delete())
+    rows = []
+    form = Form.__table__
+    for id, transcription, morpheme_break, morpheme_gloss in connection.execute(select(
+            [form.c.id, form.c.transcription, form.c.morpheme_break, form.c.morpheme_gloss])).fetchall():
+        rows += get_form_trigram_rows(id, transcription, morpheme_break, morpheme_gloss)
+        if len(rows) >= 1000:
+            connection.execute(table.insert(), rows)
+            rows = []
+    translation = Translation.__table__
+    translations = {}
+    for form_id, transcription in connection.execute(select(
+            [translation.c.form_id, translation.c.transcription]).where(
+            translation.c.form_id != None)).fetchall():
+        translations.setdefault(form_id, []).append(transcription)
+    for form_id, transcriptions in translations.iteritems():
+        rows += get_trigram_rows(form_id, u'translation', transcriptions)
+        if len(rows) >= 1000:
+            connection.execute(table.insert(), rows)
+            rows = []
+    rows.append({'form_id': None, 'attribute': u'meta', 'trigram': u''})
+    connection.execute(table.insert(), rows)
+
+def ensure_trigram_index(connection):
+    """Build the trigram index if it is enabled and has not been built."""
+    if trigram_index_is_enabled() and not trigram_index_is_built(connection):
+        rebuild_trigram_index(connection)
+
+def index_form_trigrams(mapper, connection, target):
+    """Replace the trigram rows of a form that has just been inserted or updated."""
+    if target.id is None:
+        return
+    history = [get_history(target, attr) for attr in form_indexed_attributes]
+    if not [h for h in history if h.added or h.deleted]:
+        return
+    if not trigram_index_is_built(connection):
+        return
+    table = formtrigram_table
+    connection.execute(table.delete().where(and_(table.c.form_id == target.id,
+        table.c.attribute.in_(form_indexed_attributes))))
+    rows = get_form_trigram_rows(target.id, target.transcription, target.morpheme_break,
+                                 target.morpheme_gloss)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def unindex_form_trigrams(mapper, connection, target):
+    """Remove the trigram rows of a form that is about to be deleted."""
+    table = formtrigram_table
+    connection.execute(table.delete().where(table.c.form_id == target.id))
+
+def reindex_translation_trigrams(connection, form_ids):
+    """Replace the translation trigram rows of the forms with the given ids."""
+    form_ids = set(form_ids)
+    form_ids.discard(None)
+    if not form_ids or not trigram_index_is_built(connection):
+        return
+    table = formtrigram_table
+    translation = Translation.__table__
+    for form_id in form_ids:
+        connection.execute(table.delete().where(and_(table.c.form_id == form_id,
+            table.c.attribute == u'translation')))
+        transcriptions = [r[0] for r in connection.execute(select(
+            [translation.c.transcription]).where(translation.c.form_id == form_id))]
+        rows = get_trigram_rows(form_id, u'translation', transcriptions)
+        if rows:
+            connection.execute(table.insert(), rows)
+
+def index_translation_trigrams(mapper, connection, target):
+    """Update the translation trigram rows of the form of a translation that
+    has just been inserted or deleted.
+
+    """
+    reindex_translation_trigrams(connection, [target.form_id])
+
+def reindex_updated_translation_trigrams(mapper, connection, target):
+    """Update the translation trigram rows of the form(s) of a translation
+    whose transcription or form has just been updated.
+
+    """
+    history = [get_history(target, attr) for attr in ('transcription', 'form_id')]
+    if not [h for h in history if h.added or h.deleted]:
+        return
+    reindex_translation_trigrams(connection, get_history(target, 'form_id').sum() + [target.form_id])
+
+event.listen(Form, 'after_insert', index_form_trigrams)
+event.listen(Form, 'after_update', index_form_trigrams)
+event.listen(Form, 'before_delete', unindex_form_trigrams)
+event.listen(Translation, 'after_insert', index_translation_trigrams)
+event.listen(Translation, 'after_update', reindex_updated_translation_trigrams)
+event.listen(Translation, 'after_delete', index_translation_trigrams)
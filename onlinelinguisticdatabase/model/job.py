@@ -0,0 +1,70 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Job model"""
+
+from sqlalchemy import Column, Sequence, ForeignKey
+from sqlalchemy.types import Integer, Unicode, UnicodeText, DateTime
+from sqlalchemy.orm import relation
+from onlinelinguisticdatabase.model.meta import Base, now
+import logging
+log = logging.getLogger(__name__)
+
+class Job(Base):
+    """A long-running task (e.g., FST compilation or LM estimation) that is run
+    by a worker process.  Cf. :mod:`onlinelinguisticdatabase.lib.foma_worker`.
+
+    The ``status`` of a job is one of u'queued', u'running', u'succeeded' or
+    u'failed'.  Jobs with the same ``resource`` value (e.g., u'Morphology 3')
+    are never run concurrently.
+
+    """
+
+    __tablename__ = 'job'
+    __table_args__ = {'mysql_charset': 'utf8'}
+
+    def __repr__(self):
+        return '<Job (%s)>' % self.id
+
+    id = Column(Integer, Sequence('job_seq_id', optional=True), primary_key=True)
+    func = Column(Unicode(255))
+    args = Column(UnicodeText)      # The keyword arguments of func as JSON
+    resource = Column(Unicode(255), index=True)
+    status = Column(Unicode(40), default=u'queued', index=True)
+    progress = Column(Integer, default=0)   # percent complete
+    message = Column(UnicodeText)
+    worker = Column(Unicode(255))   # hostname:pid of the worker process
+    enterer_id = Column(Integer, ForeignKey('user.id'))
+    enterer = relation('User')
+    datetime_entered = Column(DateTime, default=now)
+    datetime_started = Column(DateTime)
+    datetime_finished = Column(DateTime)
+    datetime_modified = Column(DateTime, default=now)
+
+    def get_dict(self):
+        return {
+            'id': self.id,
+            'func': self.func,
+            'args': self.json_loads(self.args),
+            'resource': self.resource,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'worker': self.worker,
+            'enterer': self.get_mini_user_dict(self.enterer),
+            'datetime_entered': self.datetime_entered,
+            'datetime_started': self.datetime_started,
+            'datetime_finished': self.datetime_finished,
+            'datetime_modified': self.datetime_modified
+        }
@@ -15,6 +15,9 @@
 """Model model"""
 
 import simplejson as json
+from hashlib import sha1
+from sqlalchemy.orm import object_session
+from sqlalchemy.sql import select, and_, bindparam
 import logging
 log = logging.getLogger(__name__)
 
@@ -44,6 +47,17 @@ class Model(object):
         'user': ['id', 'first_name', 'last_name', 'role']
     }
 
+    # Attributes whose values are JSON strings that get_dict parses, cf. get_projected_dict.
+    json_attributes = ()
+
+    # Maps model classes to the keys of the dicts returned by their get_dict methods.
+    dict_keys = {}
+
+    # Attributes of backup models whose (large) values are stored only once:
+    # backups whose value is already stored by another backup store only its
+    # hash (in <attribute>_hash), cf. compact and get_backed_up_value.
+    compacted_attributes = ()
+
     def get_dict_from_model(self, model, attrs):
         """attrs is a list of attribute names (non-relational); returns a dict
         containing all of these attributes and their values.
@@ -145,4 +159,103 @@ class Model(object):
             changed = True
         return changed
 
+    @classmethod
+    def get_dict_keys(cls):
+        """Return the set of keys of the dicts returned by ``cls.get_dict``.
+        They are read (once) from the dict of a transient instance, which
+        requires no database access.
+
+        """
+        if cls not in cls.dict_keys:
+            cls.dict_keys[cls] = frozenset(cls().get_dict().keys())
+        return cls.dict_keys[cls]
+
+    def get_projected_dict(self, fields):
+        """Return the subset of ``self.get_dict()`` whose keys are in ``fields``.
+        Only the attributes named in ``fields`` are accessed, so that the rest
+        may remain unloaded, cf. ``utils.get_projection_options``.
+
+        """
+        result = {}
+        for field in fields:
+            value = getattr(self, field)
+            if field in self.json_attributes:
+                value = self.json_loads(value)
+            elif isinstance(value, Model):
+                value = self.get_related_dict(value)
+            elif isinstance(value, list):
+                value = [self.get_related_dict(related) for related in value]
+            result[field] = value
+        return result
+
+    def get_related_dict(self, model):
+        """Return the dict representation of a related model: a mini-dict if one is
+        defined for its table, otherwise its full dict (e.g., the forms of a file).
+
+        """
+        if model.__tablename__ in self.table_name2core_attributes:
+            return self.get_mini_dict(model)
+        return model.get_dict()
+
+    def compact(self, session):
+        """Hash the values of the ``compacted_attributes`` of a new backup and
+        drop those that another backup in the database already stores.  Call
+        this before adding the backup to ``session``.
+
+        """
+        model_ = type(self)
+        for attribute in self.compacted_attributes:
+            hash_ = get_compacted_hash(getattr(self, attribute))
+            setattr(self, attribute + '_hash', hash_)
+            if hash_ and session.query(model_.id).filter(
+                    getattr(model_, attribute + '_hash') == hash_).filter(
+                    getattr(model_, attribute) != None).first():
+                setattr(self, attribute, None)
+
+    @classmethod
+    def update_compacted_hashes(cls, connection, chunk_size=100):
+        """Set the hash columns of the backups that store the values of their
+        ``compacted_attributes`` but not their hashes, e.g., after adding the
+        columns to a pre-existing database::
+
+            >>> from onlinelinguisticdatabase.model import CollectionBackup, CorpusBackup
+            >>> CollectionBackup.update_compacted_hashes(Session.connection())
+            >>> CorpusBackup.update_compacted_hashes(Session.connection()); Session.commit()
+
+        Until then, new backups store their values in full (cf. ``compact``).
+
+        """
+        table = cls.__table__
+        for attribute in cls.compacted_attributes:
+            column = table.c[attribute]
+            hash_column = table.c[attribute + '_hash']
+            last_id = 0
+            while True:
+                rows = connection.execute(select([table.c.id, column]).where(and_(
+                    hash_column == None, column != None, table.c.id > last_id)).order_by(
+                    table.c.id).limit(chunk_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                connection.execute(table.update().where(table.c.id == bindparam('id_')).values(
+                    {hash_column.name: bindparam('hash_')}),
+                    [{'id_': id, 'hash_': get_compacted_hash(value)} for id, value in rows])
+
+    def get_backed_up_value(self, attribute):
+        """Return the value of a compacted attribute of a backup, retrieving it
+        from the backup that stores it if necessary (cf. ``compact``).
 
+        """
+        value = getattr(self, attribute)
+        hash_ = getattr(self, attribute + '_hash', None)
+        session = object_session(self)
+        if value is not None or hash_ is None or session is None:
+            return value
+        model_ = type(self)
+        return session.query(getattr(model_, attribute)).filter(
+            getattr(model_, attribute + '_hash') == hash_).filter(
+            getattr(model_, attribute) != None).limit(1).scalar()
+
+def get_compacted_hash(value):
+    """Return the sha1 hash of the value of a compacted attribute, cf. ``Model.compact``."""
+    return value is not None and unicode(sha1(value.encode('utf8')).hexdigest()) or None
@@ -40,7 +40,7 @@ Cache class.
 
 The following attributes are those crucial to parsing functionality.  (Note that the 
 files that are crucial to a parser's parsing functionality are ``morphophonology.foma``,
-``morpheme_language_model.pickle`` and (if needed) ``morphology_dictionary.pickle``.)
+``morpheme_language_model.trie`` and (if needed) ``morphology_dictionary.pickle``.)
 
 ``word_boundary_symbol``
 
@@ -93,7 +93,7 @@ import os
 import re
 import codecs
 from hashlib import md5
-from sqlalchemy import Column, Sequence, ForeignKey
+from sqlalchemy import Column, Sequence, ForeignKey, DDL, event
 from sqlalchemy.types import Integer, Unicode, UnicodeText, DateTime, Boolean
 from sqlalchemy.orm import relation
 from onlinelinguisticdatabase.model.meta import Base, now, Session
@@ -123,6 +123,15 @@ class Parse(Base):
     parser_id = Column(Integer, ForeignKey('morphologicalparser.id'))
     datetime_modified = Column(DateTime, default=now)
 
+# Parse cache look-ups are always by parser and transcription.  A composite index is created
+# via DDL because MySQL requires a prefix length when indexing the long transcription column.
+event.listen(Parse.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_parse_parser_id_transcription ON parse (parser_id, transcription(255))'
+    ).execute_if(dialect='mysql'))
+event.listen(Parse.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_parse_parser_id_transcription ON parse (parser_id, transcription)'
+    ).execute_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != 'mysql'))
+
 class MorphologicalParser(MorphologicalParser, Base):
 
     __tablename__ = 'morphologicalparser'
@@ -228,7 +237,7 @@ class MorphologicalParser(MorphologicalParser, Base):
 
         1. Generate and write to disk the morphophonology script
         2. Make copies of the phonology, morphology and LM attributes relevant to parsing behaviour
-        3. Copy the language model's pickled trie file
+        3. Copy the language model's compact trie file
         4. Copy the morphology's pickled dictionary file (if lacking rich morpheme representations)
 
         """
@@ -282,9 +291,9 @@ class MorphologicalParser(MorphologicalParser, Base):
                 f.write('define morphophonology ?*;\n')
 
     def replicate_lm(self):
-        """Copy the parser's LM's trie pickle and ARPA files to the parser's directory.
+        """Copy the parser's LM's trie and ARPA files to the parser's directory.
 
-        If this results in a new trie pickle or arpa file being written, set ``self.changed = True``.
+        If this results in a new trie or arpa file being written, set ``self.changed = True``.
 
         """
 
@@ -443,21 +452,33 @@ class Cache(object):
     - ``__setitem__(k, v)``
     - ``__getitem__(k)``
     - ``get(k, default)``
+    - ``get_many(keys)``
     - ``persist()``
     - ``clear()``
 
+    The cache remembers which keys it has found to be absent from the ``parse`` table (so that
+    they are not queried for again) and which keys have been set since the last flush (so that
+    ``persist`` only needs to insert those).
+
     """
 
+    # Maximum number of transcriptions in a single ``IN`` clause (SQLite's default limit
+    # on host parameters is 999).
+    chunk_size = 500
+
     def __init__(self, parser):
         # log.warn('DB CACHE CONSTRUCTED!')
         self.updated = False # means that ``self._store`` is in sync with persistent cache
         self.parser = parser
         self._store = {}
+        self._new = set()       # keys set since the last flush
+        self._missing = set()   # keys known not to be in the parse table
 
     def __setitem__(self, k, v):
         # log.warn('DB_CACHE[%s] = %s CALLED' % (k, v))
         if k not in self._store:
             self.updated = True
+            self._new.add(k)
         self._store[k] = v
 
     def __getitem__(self, k):
@@ -465,6 +486,8 @@ class Cache(object):
         try:
             return self._store[k]
         except KeyError, e:
+            if k in self._missing:
+                raise e
             parse = Session.query(Parse).filter(Parse.parser_id==self.parser.id).\
                 filter(Parse.transcription==k).first()
             if parse:
@@ -472,6 +495,7 @@ class Cache(object):
                 self._store[k] = parse.parse
                 return self._store[k]
             else:
+                self._missing.add(k)
                 raise e
 
     def get(self, k, default=None):
@@ -481,24 +505,55 @@ class Cache(object):
             # log.warn('DB_CACHE.get(%s, %s) RETURNED %s' % (k, default, default))
             return default
 
+    def get_many(self, keys):
+        """Load the parses of all of the transcriptions in ``keys`` using one query per chunk.
+
+        :param list keys: transcriptions.
+        :returns: a dictionary from those transcriptions in ``keys`` that are cached to their parses.
+
+        """
+        unknown = list(set(k for k in keys if k not in self._store and k not in self._missing))
+        for index in xrange(0, len(unknown), self.chunk_size):
+            chunk = unknown[index:index + self.chunk_size]
+            self._store.update(Session.query(Parse.transcription, Parse.parse).\
+                filter(Parse.parser_id==self.parser.id).\
+                filter(Parse.transcription.in_(chunk)).all())
+            self._missing.update(k for k in chunk if k not in self._store)
+        store = self._store
+        return dict((k, store[k]) for k in keys if k in store)
+
     def update(self, dict_, **kwargs):
-        old_keys = self._store.keys()
+        old_keys = set(self._store.keys())
         self._store.update(dict_, **kwargs)
-        if set(old_keys) != set(self._store.keys()):
+        new_keys = set(self._store.keys()) - old_keys
+        if new_keys:
+            self._new.update(new_keys)
             self.updated = True
 
     def persist(self):
-        """Update the persistence layer with the value of ``self._store``.
+        """Insert into the persistence layer the parses that have been set since the last flush.
+
+        Keys that were not confirmed to be absent from the ``parse`` table prior to being set are
+        checked for first so that no transcription is persisted twice.
+
         """
         if self.updated:
-            persisted = [parse.transcription for parse in Session.query(Parse).\
-                filter(Parse.parser_id==self.parser.id).\
-                filter(Parse.transcription.in_(self._store.keys())).all()]
-            unpersisted = [Parse(transcription=k, parse=v, parser=self.parser)
-                for k, v in self._store.iteritems() if k not in persisted]
+            new = self._new
+            unconfirmed = list(new - self._missing)
+            persisted = set()
+            for index in xrange(0, len(unconfirmed), self.chunk_size):
+                chunk = unconfirmed[index:index + self.chunk_size]
+                persisted.update(transcription for (transcription,) in
+                    Session.query(Parse.transcription).\
+                    filter(Parse.parser_id==self.parser.id).\
+                    filter(Parse.transcription.in_(chunk)).all())
+            unpersisted = [Parse(transcription=k, parse=self._store[k], parser=self.parser)
+                for k in new if k not in persisted and k in self._store]
             Session.add_all(unpersisted)
             Session.commit()
             # log.warn('DB_CACHE: PERSISTED %s' % u', '.join([p.transcription for p in unpersisted]))
+            self._missing -= new
+            self._new = set()
             self.updated = False
 
     def clear(self, persist=False):
@@ -512,6 +567,8 @@ class Cache(object):
 
         """
         self._store = {}
+        self._new = set()
+        self._missing = set()
         if persist:
             delete = Parse.__table__.delete().\
                 where(Parse.__table__.c.parser_id==self.parser.id)
@@ -14,9 +14,11 @@
 
 """Tag model"""
 
-from sqlalchemy import Table, Column, Sequence, ForeignKey
+from sqlalchemy import Table, Column, Sequence, ForeignKey, event
 from sqlalchemy.types import Integer, Unicode, UnicodeText, Date, DateTime
 from sqlalchemy.orm import relation, backref
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.sql import select
 from onlinelinguisticdatabase.model.meta import Base, now
 
 class Tag(Base):
@@ -39,3 +41,67 @@ class Tag(Base):
             'description': self.description,
             'datetime_modified': self.datetime_modified
         }
+
+def tags_include_restricted(tags):
+    """Return ``True`` if one of ``tags`` (tag models or tag dicts) is the restricted tag."""
+    for tag in tags or []:
+        name = tag.get('name') if isinstance(tag, dict) else tag.name
+        if name == u'restricted':
+            return True
+    return False
+
+def set_restricted_flag(mapper, connection, target):
+    """Set the ``restricted`` column of a tagged model (form, file or
+    collection) that is about to be inserted or updated.  The tags are only
+    inspected if they have changed (or if the flag has never been set).
+
+    """
+    if target.restricted is None or get_history(target, 'tags').has_changes():
+        target.restricted = tags_include_restricted(target.tags)
+
+def maintain_restricted_flag(class_):
+    """Keep the ``restricted`` column of the models of ``class_`` in sync with their tags."""
+    event.listen(class_, 'before_insert', set_restricted_flag)
+    event.listen(class_, 'before_update', set_restricted_flag)
+
+def update_restricted_flags(connection, tag_id=None):
+    """Recompute the ``restricted`` column of all forms, files, collections and
+    their backups, e.g., after adding the column to a pre-existing database::
+
+        >>> from onlinelinguisticdatabase.model.tag import update_restricted_flags
+        >>> update_restricted_flags(Session.connection()); Session.commit()
+
+    If ``tag_id`` is given, only the forms, files and collections tagged with
+    that tag are updated (the backups store the names of their tags).
+
+    """
+    from onlinelinguisticdatabase.model import Form, File, Collection, FormBackup, CollectionBackup
+    from onlinelinguisticdatabase.model.form import formtag_table
+    from onlinelinguisticdatabase.model.file import filetag_table
+    from onlinelinguisticdatabase.model.collection import collectiontag_table
+    restricted_tag_ids = select([Tag.__table__.c.id]).where(Tag.__table__.c.name == u'restricted')
+    for table, tag_table, fk in ((Form.__table__, formtag_table, 'form_id'),
+                                 (File.__table__, filetag_table, 'file_id'),
+                                 (Collection.__table__, collectiontag_table, 'collection_id')):
+        restricted_ids = select([tag_table.c[fk]]).where(tag_table.c.tag_id.in_(restricted_tag_ids))
+        update = table.update().values(restricted=table.c.id.in_(restricted_ids))
+        if tag_id is not None:
+            update = update.where(table.c.id.in_(
+                select([tag_table.c[fk]]).where(tag_table.c.tag_id == tag_id)))
+        connection.execute(update)
+    if tag_id is not None:
+        return
+    for table in (FormBackup.__table__, CollectionBackup.__table__):
+        connection.execute(table.update().values(
+            restricted=table.c.tags.like(u'%"name": "restricted"%')))
+
+def update_restricted_flags_of_renamed_tag(mapper, connection, target):
+    """Recompute the ``restricted`` column of the models tagged with a tag that
+    has been renamed to or from ``restricted``.
+
+    """
+    history = get_history(target, 'name')
+    if u'restricted' in list(history.added or []) + list(history.deleted or []):
+        update_restricted_flags(connection, target.id)
+
+event.listen(Tag, 'after_update', update_restricted_flags_of_renamed_tag)
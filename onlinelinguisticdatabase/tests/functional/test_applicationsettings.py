@@ -17,7 +17,7 @@ import logging
 import simplejson as json
 from nose.tools import nottest
 from onlinelinguisticdatabase.tests import TestController, url
-from onlinelinguisticdatabase.model import ApplicationSettings, User, Orthography
+from onlinelinguisticdatabase.model import ApplicationSettings, User, Orthography, Form, Tag
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
 
@@ -223,6 +223,12 @@ class TestApplicationsettingsController(TestController):
         assert resp['object_language_name'] == u'test_update object language name'
         assert resp['unrestricted_users'][0]['role'] == u'contributor'
         assert new_application_settings_count == application_settings_count + 1
+        assert h.get_morpheme_delimiters() == [u'+']
+        assert h.get_unrestricted_user_ids() == frozenset([contributor_id])
+        restricted_form = Form()
+        restricted_form.tags = [Tag(name=u'restricted')]
+        assert h.user_is_authorized_to_access_model(Session.query(User).get(contributor_id),
+                                                    restricted_form, h.get_unrestricted_user_ids())
 
         # Update the application settings we just created but expect to fail
         # because the unrestricted users ids are invalid.
@@ -259,6 +265,12 @@ class TestApplicationsettingsController(TestController):
         assert new_application_settings_count == application_settings_count
         assert response.content_type == 'application/json'
 
+        # The cached application settings snapshot reflects the update.
+        application_settings_snapshot = h.get_application_settings_snapshot()
+        assert application_settings_snapshot.object_language_name == u'Updated!'
+        assert h.get_morpheme_delimiters() == [u'-', u'=']
+        assert application_settings_snapshot.morpheme_splitter_regex.split(u'a-b=c') == [u'a', u'b', u'c']
+
         # Attempt an update with no new data -- expect a 400 status code where
         # the response body is a JSON object with an appropriate 'error'
         # attribute.
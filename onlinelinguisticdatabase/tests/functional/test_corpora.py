@@ -13,6 +13,7 @@
 #  limitations under the License.
 
 import datetime
+import gzip
 import logging
 import os
 import simplejson as json
@@ -25,6 +26,7 @@ import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.model import Corpus, CorpusBackup
+from onlinelinguisticdatabase.controllers.corpora import write_corpus_forms
 
 log = logging.getLogger(__name__)
 
@@ -1062,3 +1064,82 @@ class TestCorporaController(TestController):
             headers=self.json_headers, extra_environ=extra_environ)
         by_corpus_id_resp = json.loads(response.body)
         assert by_corpus_id_resp == by_UUID_resp
+
+    @nottest
+    def test_writetofile(self):
+        """Tests that PUT /corpora/id/writetofile writes the forms of the corpus, in order, to a plain and a gzipped file."""
+
+        forms = []
+        for index in range(1, 6):
+            form = model.Form()
+            form.transcription = u'Form %d \u00e9t\u00e9' % index
+            form.syntax = u'(S (NP form-%d))' % index
+            translation = model.Translation()
+            translation.transcription = u'Translation %d' % index
+            form.translations.append(translation)
+            forms.append(form)
+        Session.add_all(forms)
+        Session.commit()
+        forms = dict((form.id, form) for form in h.get_forms())
+        form_ids = sorted(forms)
+
+        # The forms of a corpus defined by its content are written in the order,
+        # and with the repetitions, of the content.
+        referenced_ids = [form_ids[3], form_ids[0], form_ids[3], form_ids[1]]
+        params = self.corpus_create_params.copy()
+        params.update({
+            'name': u'Corpus',
+            'content': u','.join(map(str, referenced_ids))
+        })
+        response = self.app.post(url('corpora'), json.dumps(params), self.json_headers,
+                                 self.extra_environ_admin)
+        corpus_id = json.loads(response.body)['id']
+        corpus_dir = os.path.join(self.corpora_path, 'corpus_%d' % corpus_id)
+
+        for format_, file_name, writer in (
+                (u'transcriptions only', 'corpus_%d_transcriptions.txt' % corpus_id,
+                    lambda f: u'%s\n' % f.transcription),
+                (u'treebank', 'corpus_%d.tbk' % corpus_id,
+                    lambda f: u'(TOP-%d %s)\n' % (f.id, f.syntax))):
+            response = self.app.put(url('/corpora/%d/writetofile' % corpus_id),
+                json.dumps({u'format': format_}), headers=self.json_headers,
+                extra_environ=self.extra_environ_admin)
+            resp = json.loads(response.body)
+            assert file_name in [cf['filename'] for cf in resp['files']]
+            corpus_file_path = os.path.join(corpus_dir, file_name)
+            corpus_file_content = open(corpus_file_path, 'rb').read()
+            assert corpus_file_content == u''.join(
+                [writer(forms[id]) for id in referenced_ids]).encode('utf8')
+            assert gzip.open('%s.gz' % corpus_file_path, 'rb').read() == corpus_file_content
+
+        # Writing in small chunks yields the same files.
+        corpus = Session.query(Corpus).get(corpus_id)
+        chunked_file_path = os.path.join(corpus_dir, 'chunked.txt')
+        gzipped_chunked_file_path = write_corpus_forms(corpus, u'transcriptions only',
+                                                       chunked_file_path, chunk_size=3)
+        assert gzipped_chunked_file_path == '%s.gz' % chunked_file_path
+        corpus_file_content = open(os.path.join(corpus_dir,
+            'corpus_%d_transcriptions.txt' % corpus_id), 'rb').read()
+        assert open(chunked_file_path, 'rb').read() == corpus_file_content
+        assert gzip.open(gzipped_chunked_file_path, 'rb').read() == corpus_file_content
+
+        # The forms of a corpus defined by a form search are those that match the search.
+        query = {'filter': ['Form', 'id', 'in', form_ids[1:4]]}
+        params = json.dumps({'name': u'form search', 'description': u'', 'search': query})
+        response = self.app.post(url('formsearches'), params, self.json_headers,
+                                 self.extra_environ_admin)
+        form_search_id = json.loads(response.body)['id']
+        params = self.corpus_create_params.copy()
+        params.update({'name': u'Corpus by search', 'form_search': form_search_id})
+        response = self.app.post(url('corpora'), json.dumps(params), self.json_headers,
+                                 self.extra_environ_admin)
+        corpus_id = json.loads(response.body)['id']
+        response = self.app.put(url('/corpora/%d/writetofile' % corpus_id),
+            json.dumps({u'format': u'transcriptions only'}), headers=self.json_headers,
+            extra_environ=self.extra_environ_admin)
+        corpus_file_path = os.path.join(self.corpora_path, 'corpus_%d' % corpus_id,
+                                        'corpus_%d_transcriptions.txt' % corpus_id)
+        corpus_file_content = open(corpus_file_path, 'rb').read()
+        assert sorted(corpus_file_content.decode('utf8').splitlines()) == \
+            sorted([forms[id].transcription for id in form_ids[1:4]])
+        assert gzip.open('%s.gz' % corpus_file_path, 'rb').read() == corpus_file_content
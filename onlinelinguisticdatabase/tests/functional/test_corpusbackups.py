@@ -260,6 +260,40 @@ class TestCorpusbackupsController(TestController):
         assert json.loads(response.body)['error'] == u'This resource is read-only.'
         assert response.content_type == 'application/json'
 
+        # A backup whose content is already stored by another backup stores
+        # only the hash of its content; the content is retrieved on demand.
+        params = self.corpus_create_params.copy()
+        params.update({
+            'name': u'Corpus',
+            'description': u'Covers a little less data (again).',
+            'content': test_corpus_half_content,
+            'tags': [tag_id]
+        })
+        params = json.dumps(params)
+        response = self.app.put(url('corpus', id=corpus_id), params,
+                self.json_headers, self.extra_environ_admin)
+        corpus_backups = Session.query(CorpusBackup).order_by(CorpusBackup.id).all()
+        assert len(corpus_backups) == 3
+        assert corpus_backups[1].content == test_corpus_half_content
+        assert corpus_backups[2].content is None
+        assert corpus_backups[2].content_hash == corpus_backups[1].content_hash
+        assert corpus_backups[0].content_hash != corpus_backups[1].content_hash
+        response = self.app.get(url('corpusbackup', id=corpus_backups[2].id),
+                                headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp['content'] == test_corpus_half_content
+
+        # The hashes of backups made before the hash column was added are set
+        # by update_compacted_hashes.
+        hashes = [b.content_hash for b in corpus_backups]
+        table = CorpusBackup.__table__
+        Session.execute(table.update().where(table.c.content != None).values(content_hash=None))
+        Session.commit()
+        CorpusBackup.update_compacted_hashes(Session.connection(), chunk_size=1)
+        Session.commit()
+        corpus_backups = Session.query(CorpusBackup).order_by(CorpusBackup.id).all()
+        assert [b.content_hash for b in corpus_backups] == hashes
+
     @nottest
     def test_new_search(self):
         """Tests that GET /corpusbackups/new_search returns the search parameters for searching the corpus backups resource."""
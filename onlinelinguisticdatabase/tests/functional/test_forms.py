@@ -13,16 +13,20 @@
 #  limitations under the License.
 
 import datetime
+import gzip
 import logging
 import os
 from time import sleep
 import simplejson as json
 from nose.tools import nottest
 from base64 import encodestring
+from StringIO import StringIO
 from sqlalchemy.sql import desc
 from uuid import uuid4
 from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder
 from onlinelinguisticdatabase.tests import TestController, url
+from onlinelinguisticdatabase.controllers.forms import LexicalIndex, compile_morphemic_analysis
+from onlinelinguisticdatabase.model.formbackup import update_enterer_ids, update_materialized_values
 import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
@@ -40,6 +44,46 @@ class TestFormsController(TestController):
         TestController.tearDown(self, dirs_to_clear=['reduced_files_path', 'files_path'],
                 del_global_app_set=True)
 
+    def create_forms(self, forms, extra_environ):
+        """Create the forms one at a time via POST /forms and return their ids.
+
+        :param list forms: (transcription, morpheme_break, morpheme_gloss, syntactic_category_id) 4-tuples.
+
+        """
+        ids = []
+        for transcription, morpheme_break, morpheme_gloss, syntactic_category in forms:
+            params = self.form_create_params.copy()
+            params.update({
+                'transcription': transcription,
+                'morpheme_break': morpheme_break,
+                'morpheme_gloss': morpheme_gloss,
+                'translations': [{'transcription': transcription, 'grammaticality': u''}],
+                'syntactic_category': syntactic_category
+            })
+            response = self.app.post(url('forms'), json.dumps(params), self.json_headers,
+                                     extra_environ)
+            ids.append(json.loads(response.body)['id'])
+        return ids
+
+    def get_morphemic_analyses(self):
+        """Return the morphological analysis-related values of every form, keyed by
+        transcription and with the ids of the matches replaced by their transcriptions,
+        so that the analyses of forms created in different ways can be compared.
+
+        """
+        response = self.app.get(url('forms'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        forms = json.loads(response.body)
+        transcriptions = dict((f['id'], f['transcription']) for f in forms)
+        def normalize(analysis):
+            if analysis is None:
+                return None
+            return [[[[transcriptions[match[0]]] + match[1:] for match in matches]
+                     for matches in word] for word in analysis]
+        return dict((f['transcription'], (normalize(f['morpheme_break_ids']),
+            normalize(f['morpheme_gloss_ids']), f['syntactic_category_string'],
+            f['break_gloss_category'])) for f in forms)
+
     @nottest
     def test_index(self):
         """Tests that GET /forms returns a JSON array of forms with expected values."""
@@ -195,6 +239,9 @@ class TestFormsController(TestController):
         Session.commit()
         forms = h.get_forms()    # ordered by Form.id ascending
 
+        # The restricted flag of each form mirrors its tags.
+        assert [f.restricted for f in forms] == [i % 2 == 0 for i in range(1, 101)]
+
         # An administrator should be able to retrieve all of the forms.
         extra_environ = {'test.authentication.role': 'administrator',
                          'test.application_settings': True}
@@ -230,6 +277,20 @@ class TestFormsController(TestController):
         resp = json.loads(response.body)
         assert result_set[46] == resp['items'][0]['transcription']
 
+        # Passing the paginator's cursor back retrieves the next page by seeking
+        # past the last form of the previous one; the result is the same.
+        params['page'] = 4
+        response = self.app.get(url('forms'), params,
+                        headers=self.json_headers, extra_environ=extra_environ)
+        offset_resp = json.loads(response.body)
+        params['cursor'] = resp['paginator']['cursor']
+        response = self.app.get(url('forms'), params,
+                        headers=self.json_headers, extra_environ=extra_environ)
+        keyset_resp = json.loads(response.body)
+        assert result_set[69] == keyset_resp['items'][0]['transcription']
+        assert [f['id'] for f in keyset_resp['items']] == [f['id'] for f in offset_resp['items']]
+        assert keyset_resp['paginator']['count'] == offset_resp['paginator']['count']
+
         # The default viewer should only be able to see the odd numbered forms,
         # even with a paginator.
         items_per_page = 7
@@ -278,6 +339,33 @@ class TestFormsController(TestController):
         assert resp['errors']['items_per_page'] == u'Please enter a number that is 1 or greater'
         assert resp['errors']['page'] == u'Please enter a number that is 1 or greater'
 
+    @nottest
+    def test_index_cursor_with_null_values(self):
+        """Tests that cursor pagination in descending order retrieves the forms whose order by values are NULL."""
+
+        application_settings = h.generate_default_application_settings()
+        Session.add(application_settings)
+        Session.commit()
+        forms = [h.generate_default_form() for i in range(5)]
+        for index, form in enumerate(forms[:3]):
+            form.date_elicited = datetime.date(2000, 1, index + 1)
+        Session.add_all(forms)
+        Session.commit()
+        form_ids = [form.id for form in forms]
+
+        params = {'order_by_model': 'Form', 'order_by_attribute': 'date_elicited',
+                  'order_by_direction': 'desc', 'items_per_page': 2, 'page': 1}
+        ids = []
+        for page in range(1, 4):
+            params['page'] = page
+            response = self.app.get(url('forms'), params, headers=self.json_headers,
+                                    extra_environ=self.extra_environ_admin)
+            resp = json.loads(response.body)
+            ids += [f['id'] for f in resp['items']]
+            params['cursor'] = resp['paginator']['cursor']
+        assert ids[:3] == [form_ids[2], form_ids[1], form_ids[0]]
+        assert sorted(ids[3:]) == sorted(form_ids[3:])
+
     @nottest
     def test_create(self):
         """Tests that POST /forms correctly creates a new form."""
@@ -2140,6 +2228,143 @@ class TestFormsController(TestController):
             u'2nd form restricted'
         assert resp['form']['transcription'] == u'2nd form unrestricted updated'
 
+    @nottest
+    def test_history_delta_encoding(self):
+        """Tests that form backups are delta-encoded and that GET /forms/history/id paginates and reconstructs them."""
+
+        application_settings = h.generate_default_application_settings()
+        tag = model.Tag()
+        tag.name = u'tag'
+        Session.add_all([application_settings, tag])
+        Session.commit()
+        tag_id = tag.id
+
+        # Create a form and update its transcription three times.
+        params = self.form_create_params.copy()
+        params.update({'transcription': u'version 1',
+                       'phonetic_transcription': u'phonetic',
+                       'translations': [{'transcription': u'test', 'grammaticality': u''}],
+                       'tags': [tag_id]})
+        response = self.app.post(url('forms'), json.dumps(params), self.json_headers,
+                                 self.extra_environ_admin)
+        form_id = json.loads(response.body)['id']
+        for version in range(2, 5):
+            params['transcription'] = u'version %d' % version
+            response = self.app.put(url('form', id=form_id), json.dumps(params),
+                                    self.json_headers, self.extra_environ_admin)
+
+        # The first backup is a snapshot; the others store only what has changed.
+        form_backups = Session.query(model.FormBackup).order_by(model.FormBackup.id).all()
+        assert [fb.transcription for fb in form_backups] == \
+            [u'version 1', u'version 2', u'version 3']
+        assert form_backups[0].snapshot_id is None
+        assert json.loads(form_backups[0].tags)[0]['id'] == tag_id
+        assert [fb.snapshot_id for fb in form_backups[1:]] == [form_backups[0].id] * 2
+        assert [fb.tags for fb in form_backups[1:]] == [None, None]
+        assert 'tags' not in json.loads(form_backups[2].changed_attributes)
+
+        # The short attributes are stored by every backup and searched on their
+        # columns rather than on reconstructed values.
+        assert [fb.phonetic_transcription for fb in form_backups] == [u'phonetic'] * 3
+        query = SQLAQueryBuilder('FormBackup').get_SQLA_query({'filter':
+            ['FormBackup', 'phonetic_transcription', '=', u'phonetic']})
+        assert str(query).count('SELECT') == 1
+        assert len(query.all()) == 3
+
+        # The history is reconstructed in full, most recent version first.
+        response = self.app.get(url(controller='forms', action='history', id=form_id),
+            headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert [v['transcription'] for v in resp['previous_versions']] == \
+            [u'version 3', u'version 2', u'version 1']
+        assert [v['tags'][0]['id'] for v in resp['previous_versions']] == [tag_id] * 3
+        assert [v['translations'][0]['transcription'] for v in resp['previous_versions']] == \
+            [u'test'] * 3
+
+        # Searches match the reconstructed values of the delta backups.
+        query = json.dumps({'query': {'filter': ['and', [
+            ['FormBackup', 'tags', 'like', u'%%"id": %d%%' % tag_id],
+            ['FormBackup', 'translations', 'like', u'%test%']]],
+            'order_by': ['FormBackup', 'grammaticality', 'asc']}})
+        response = self.app.post(url('/formbackups/search'), query, self.json_headers,
+                                 self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert sorted([fb['transcription'] for fb in resp]) == \
+            [u'version 1', u'version 2', u'version 3']
+
+        # Request the history one page at a time.
+        paginator = {'page': 2, 'items_per_page': 2}
+        response = self.app.get(url(controller='forms', action='history', id=form_id),
+            paginator, headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp['form']['transcription'] == u'version 4'
+        assert resp['previous_versions']['paginator']['count'] == 3
+        assert len(resp['previous_versions']['items']) == 1
+        assert resp['previous_versions']['items'][0]['transcription'] == u'version 1'
+        paginator = {'page': 1, 'items_per_page': 2}
+        response = self.app.get(url(controller='forms', action='history', id=form_id),
+            paginator, headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert [v['transcription'] for v in resp['previous_versions']['items']] == \
+            [u'version 3', u'version 2']
+        assert resp['previous_versions']['items'][1]['tags'][0]['id'] == tag_id
+
+        # An invalid paginator is rejected.
+        paginator = {'page': 0, 'items_per_page': 2}
+        response = self.app.get(url(controller='forms', action='history', id=form_id),
+            paginator, headers=self.json_headers, extra_environ=self.extra_environ_admin,
+            status=400)
+        resp = json.loads(response.body)
+        assert resp['errors']['page'] == u'Please enter a number that is 1 or greater'
+
+        # An export parameter is ignored.
+        response = self.app.get(url(controller='forms', action='history', id=form_id),
+            {'export': u'ndjson'}, headers=self.json_headers,
+            extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert [v['transcription'] for v in resp['previous_versions']] == \
+            [u'version 3', u'version 2', u'version 1']
+
+        # Restricted backups are filtered by the exact id of their enterer, so
+        # those of a user whose id merely begins with another's are not leaked.
+        contributor = Session.query(model.User).filter(model.User.role==u'contributor').first()
+        other_id = int('%d0' % contributor.id)
+        backup = model.FormBackup()
+        backup.UUID = unicode(uuid4())
+        backup.transcription = u'restricted'
+        backup.enterer = unicode(json.dumps({'id': other_id, 'first_name': u'Other',
+                                             'last_name': u'User'}))
+        backup.enterer_id = other_id
+        backup.restricted = True
+        Session.add(backup)
+        Session.commit()
+        backup_id = backup.id
+        query = h.filter_restricted_models_from_query(u'FormBackup',
+            Session.query(model.FormBackup), contributor)
+        assert backup_id not in [fb.id for fb in query]
+        assert len(query.all()) == 3
+
+        # The enterer ids of pre-existing backups can be set from their JSON.
+        administrator_id = json.loads(form_backups[0].enterer)['id']
+        Session.execute(model.FormBackup.__table__.update().values(enterer_id=None))
+        update_enterer_ids(Session.connection(), chunk_size=2)
+        Session.commit()
+        assert sorted([fb.enterer_id for fb in Session.query(model.FormBackup)]) == \
+            sorted([administrator_id] * 3 + [other_id])
+
+        # So can the short attributes of delta backups made when they were
+        # stored only if they had changed.
+        table = model.FormBackup.__table__
+        Session.execute(table.update().where(table.c.snapshot_id != None).values(
+            phonetic_transcription=None, grammaticality=None))
+        Session.commit()
+        update_materialized_values(Session.connection(), chunk_size=1)
+        Session.commit()
+        form_backups = Session.query(model.FormBackup).filter(
+            model.FormBackup.form_id == form_id).order_by(model.FormBackup.id).all()
+        assert [fb.phonetic_transcription for fb in form_backups] == [u'phonetic'] * 3
+        assert len(set([fb.grammaticality for fb in form_backups])) == 1
+
     @nottest
     def test_remember(self):
         """Tests that POST /forms/remember correctly saves the input list of forms to the logged in user's remembered_forms list.
@@ -2466,6 +2691,64 @@ class TestFormsController(TestController):
         resp = json.loads(response.body)
         assert resp['search_parameters'] == h.get_search_parameters(query_builder)
 
+    @nottest
+    def test_json_cache(self):
+        """Tests that the cached JSON documents of forms reflect changes to the forms and to the models they reference."""
+
+        application_settings = h.generate_default_application_settings()
+        tag = model.Tag()
+        tag.name = u'tag'
+        Session.add_all([application_settings, tag])
+        Session.commit()
+        tag_id = tag.id
+
+        params = self.form_create_params.copy()
+        params.update({'transcription': u'test_json_cache',
+                       'translations': [{'transcription': u'test', 'grammaticality': u''}],
+                       'tags': [tag_id]})
+        response = self.app.post(url('forms'), json.dumps(params), self.json_headers,
+                                 self.extra_environ_admin)
+        form_id = json.loads(response.body)['id']
+
+        # Requesting the forms twice (the second time from the cache) returns the same data.
+        response = self.app.get(url('forms'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert h.form_json_cache.documents.get(form_id) is not None
+        response = self.app.get(url('forms'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        assert json.loads(response.body) == resp
+        assert resp[0]['tags'][0]['name'] == u'tag'
+
+        # Renaming the tag is reflected in the form.
+        response = self.app.put(url('tag', id=tag_id), json.dumps({'name': u'renamed tag',
+            'description': u''}), self.json_headers, self.extra_environ_admin)
+        response = self.app.get(url('form', id=form_id), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        assert json.loads(response.body)['tags'][0]['name'] == u'renamed tag'
+
+        # So is renaming it in another process, through the shared versions of
+        # the tables: simulate one by forgetting the local versions of a write.
+        local_versions = dict(h.data_versions.versions)
+        Session.execute(model.Tag.__table__.update().where(model.Tag.__table__.c.id == tag_id).values(
+            name=u'tag renamed elsewhere'))
+        Session.commit()
+        h.data_versions.versions = local_versions
+        response = self.app.get(url('form', id=form_id), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        assert json.loads(response.body)['tags'][0]['name'] == u'tag renamed elsewhere'
+
+        # Updating the form is reflected too.
+        sleep(1)
+        params['transcription'] = u'test_json_cache updated'
+        response = self.app.put(url('form', id=form_id), json.dumps(params), self.json_headers,
+                                self.extra_environ_admin)
+        response = self.app.get(url('forms'), {'page': 1, 'items_per_page': 10},
+                                headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp['items'][0]['transcription'] == u'test_json_cache updated'
+        assert resp['paginator']['count'] == 1
+
     @nottest
     def test_create_restricted(self):
         """Tests what happens when a restricted user restricts a form.
@@ -2927,6 +3210,27 @@ class TestFormsController(TestController):
         assert resp['morpheme_gloss_ids'] == xyz_morpheme_gloss_ids
         assert resp['break_gloss_category'] == u'x|7|Num=y|8|?-z|9|?'
 
+        # The morpheme token index used to find the forms affected by a lexical
+        # change is kept current as forms are written.
+        token_table = model.form.formmorphemetoken_table
+        tokens = Session.execute(token_table.select().where(
+            token_table.c.form_id == xyz_id)).fetchall()
+        assert sorted((t['attribute'], t['token']) for t in tokens) == [
+            (u'morpheme_break', u'x'), (u'morpheme_break', u'y'), (u'morpheme_break', u'z'),
+            (u'morpheme_gloss', u'7'), (u'morpheme_gloss', u'8'), (u'morpheme_gloss', u'9')]
+
+        # Changing the morpheme delimiters rebuilds the index as part of the
+        # change to the application settings.
+        application_settings = h.get_application_settings()
+        application_settings.morpheme_delimiters = u'-'
+        Session.commit()
+        assert model.form.get_indexed_morpheme_delimiters(Session) == u'-'
+        tokens = Session.execute(token_table.select().where(
+            token_table.c.form_id == xyz_id)).fetchall()
+        assert sorted((t['attribute'], t['token']) for t in tokens) == [
+            (u'morpheme_break', u'x=y'), (u'morpheme_break', u'z'),
+            (u'morpheme_gloss', u'7'), (u'morpheme_gloss', u'8=9')]
+
     @nottest
     def test_morphemic_analysis_compilation(self):
         """Tests the behaviour of compile_morphemic_analysis in the forms controller.
@@ -3230,3 +3534,394 @@ class TestFormsController(TestController):
         })
         params = json.dumps(params)
         response = self.app.post(url('forms'), params, self.json_headers, extra_environ)
+
+    @nottest
+    def test_import_forms(self):
+        """Tests that POST /forms/import creates forms in bulk, analyzes them and percolates the lexical changes."""
+
+        Num = h.generate_num_syntactic_category()
+        application_settings = h.generate_default_application_settings()
+        tag = model.Tag()
+        tag.name = u'imported'
+        Session.add_all([Num, application_settings, tag])
+        Session.commit()
+        NumId = Num.id
+        tag_id = tag.id
+        extra_environ = {'test.authentication.role': u'administrator',
+                         'test.application_settings': True}
+
+        # Create a phrasal form whose morphemes are not yet in the database.
+        params = self.form_create_params.copy()
+        params.update({
+            'transcription': u'xyz',
+            'morpheme_break': u'x-y-z',
+            'morpheme_gloss': u'7-8-9',
+            'translations': [{'transcription': u'789', 'grammaticality': u''}]
+        })
+        response = self.app.post(url('forms'), json.dumps(params), self.json_headers, extra_environ)
+        xyz_id = json.loads(response.body)['id']
+
+        # Import two lexical items and a phrasal form as newline-delimited JSON.
+        forms = []
+        for transcription, morpheme_break, morpheme_gloss, syntactic_category in (
+                (u'x', u'x', u'7', NumId), (u'y', u'y', u'8', NumId), (u'xy', u'x-y', u'7-8', u'')):
+            params = self.form_create_params.copy()
+            params.update({
+                'transcription': transcription,
+                'morpheme_break': morpheme_break,
+                'morpheme_gloss': morpheme_gloss,
+                'translations': [{'transcription': u'imported %s' % morpheme_gloss,
+                                  'grammaticality': u''}],
+                'syntactic_category': syntactic_category,
+                'tags': [tag_id]
+            })
+            forms.append(json.dumps(params))
+        response = self.app.post(url('/forms/import'), u'\n'.join(forms),
+                                 self.json_headers, extra_environ)
+        x_id, y_id, xy_id = json.loads(response.body)
+        assert response.content_type == 'application/json'
+        assert Session.query(model.Form).count() == 4
+
+        response = self.app.get(url('forms'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        resp = dict((f['id'], f) for f in json.loads(response.body))
+        assert resp[x_id]['morpheme_break_ids'] == [[[[x_id, u'7', u'Num']]]]
+        assert resp[x_id]['break_gloss_category'] == u'x|7|Num'
+        assert resp[xy_id]['morpheme_break_ids'] == [[[[x_id, u'7', u'Num']], [[y_id, u'8', u'Num']]]]
+        assert resp[xy_id]['syntactic_category_string'] == u'Num-Num'
+        assert resp[xy_id]['translations'][0]['transcription'] == u'imported 7-8'
+        assert resp[xy_id]['tags'][0]['id'] == tag_id
+        assert resp[xy_id]['enterer']['role'] == u'administrator'
+
+        # The pre-existing phrasal form has been updated and backed up.
+        assert resp[xyz_id]['morpheme_break_ids'] == \
+            [[[[x_id, u'7', u'Num']], [[y_id, u'8', u'Num']], []]]
+        assert resp[xyz_id]['syntactic_category_string'] == u'Num-Num-?'
+        assert Session.query(model.FormBackup).count() == 1
+
+        # The imported forms are searchable.
+        json_query = json.dumps({'query': {'filter':
+            ['Form', 'translations', 'transcription', 'like', u'%imported 7%']}})
+        response = self.app.post(url('/forms/search'), json_query,
+            self.json_headers, self.extra_environ_admin)
+        assert sorted([f['id'] for f in json.loads(response.body)]) == [x_id, xy_id]
+
+        # If any form is invalid, none is created.
+        params = self.form_create_params.copy()
+        params.update({'transcription': u'valid',
+            'translations': [{'transcription': u'valid', 'grammaticality': u''}]})
+        invalid_params = self.form_create_params.copy()
+        invalid_params.update({'transcription': u'invalid'})
+        response = self.app.post(url('/forms/import'), json.dumps({'forms': [params, invalid_params]}),
+                                 self.json_headers, extra_environ, status=400)
+        resp = json.loads(response.body)
+        assert resp['errors'].keys() == [u'1']
+        assert resp['errors'][u'1']['translations'] == u'Please enter one or more translations'
+        assert Session.query(model.Form).count() == 4
+
+        # A single line of newline-delimited JSON is a form; bodies that do not
+        # represent a list of forms are rejected.
+        response = self.app.post(url('/forms/import'), json.dumps(params),
+                                 self.json_headers, extra_environ)
+        assert len(json.loads(response.body)) == 1
+        for body in ('null', '5', '"form"', json.dumps([params, 5])):
+            response = self.app.post(url('/forms/import'), body,
+                                     self.json_headers, extra_environ, status=400)
+            assert json.loads(response.body)['error'] == \
+                u'The forms must be provided as a list of JSON objects.'
+        assert Session.query(model.Form).count() == 5
+
+        # Contributors can import forms; viewers cannot.
+        response = self.app.post(url('/forms/import'), json.dumps([params]),
+                                 self.json_headers, self.extra_environ_contrib)
+        assert len(json.loads(response.body)) == 1
+        response = self.app.post(url('/forms/import'), json.dumps([params]),
+                                 self.json_headers, self.extra_environ_view, status=403)
+        assert Session.query(model.Form).count() == 6
+
+    @nottest
+    def test_lexical_index(self):
+        """Tests that analyses against a LexicalIndex of the whole database match those made by lexical percolation."""
+
+        Agr = model.SyntacticCategory()
+        Agr.name = u'Agr'
+        N = h.generate_n_syntactic_category()
+        Num = h.generate_num_syntactic_category()
+        application_settings = h.generate_default_application_settings()
+        Session.add_all([N, Num, Agr, application_settings])
+        Session.commit()
+        NId = N.id
+        NumId = Num.id
+        AgrId = Agr.id
+        extra_environ = {'test.authentication.role': u'administrator',
+                         'test.application_settings': True}
+
+        # Create the phrasal forms first and then the lexical items one at a
+        # time so that the analyses of the former are built up by percolation.
+        self.create_forms([
+            (u'chiens', u'chien-s', u'dog-PL', u''),
+            (u'les chiens', u'le-s chien-s', u'the-PL dog-PL', u''),
+            (u'chats', u'chat-s', u'cat-PL', u'')], extra_environ)
+        chien_id, s_num_id, s_agr_id, le_id, chat_id, matou_id, chienne_id = self.create_forms([
+            (u'chien', u'chien', u'dog', NId),
+            (u's (Num)', u's', u'PL', NumId),
+            (u's (Agr)', u's', u'PL', AgrId),
+            (u'le', u'le', u'the', u''),
+            (u'chat', u'chat', u'kitty', NId),
+            (u'matou', u'matou', u'cat', NId),
+            (u'chienne', u'chien', u'bitch', NId)], extra_environ)
+
+        forms = h.get_forms()
+        lexical_index = LexicalIndex(forms)
+        assert len(lexical_index) == len(forms) == 10
+        assert [f.id for f in lexical_index.get_perfect_matches(u's', u'PL')] == [s_num_id, s_agr_id]
+        assert [f.id for f in lexical_index.get_partial_matches(u'morpheme_break', u'chien')] == \
+            [chien_id, chienne_id]
+        assert [f.id for f in lexical_index.get_partial_matches(u'morpheme_gloss', u'cat')] == [matou_id]
+        assert lexical_index.get_perfect_matches(u'chat', u'cat') == []
+        lexical_index.get_perfect_matches(u's', u'PL').pop()
+        assert len(lexical_index.get_perfect_matches(u's', u'PL')) == 2
+
+        morpheme_delimiters = [u'-', u'=']
+        for form in forms:
+            percolated = (form.morpheme_break_ids, form.morpheme_gloss_ids,
+                          form.syntactic_category_string, form.break_gloss_category)
+            assert compile_morphemic_analysis(form, morpheme_delimiters, whole_db=lexical_index)[:4] == \
+                percolated
+            assert compile_morphemic_analysis(form, morpheme_delimiters)[:4] == percolated
+
+        analyses = dict((f.transcription, f) for f in forms)
+        s_ids = [[s_num_id, u'PL', u'Num'], [s_agr_id, u'PL', u'Agr']]
+        assert json.loads(analyses[u'les chiens'].morpheme_break_ids) == \
+            [[[[le_id, u'the', None]], s_ids], [[[chien_id, u'dog', u'N']], s_ids]]
+        assert analyses[u'les chiens'].syntactic_category_string == u'?-Num N-Num'
+        assert json.loads(analyses[u'chats'].morpheme_break_ids)[0][0] == [[chat_id, u'kitty', u'N']]
+        assert json.loads(analyses[u'chats'].morpheme_gloss_ids)[0][0] == [[matou_id, u'matou', u'N']]
+        assert analyses[u'chats'].break_gloss_category == u'chat|cat|N-s|PL|Num'
+
+    @nottest
+    def test_bulk_lexical_percolation(self):
+        """Tests that bulk lexical percolation (on import and on category changes) yields the same analyses as percolation form by form."""
+
+        Agr = model.SyntacticCategory()
+        Agr.name = u'Agr'
+        N = h.generate_n_syntactic_category()
+        Num = h.generate_num_syntactic_category()
+        application_settings = h.generate_default_application_settings()
+        Session.add_all([N, Num, Agr, application_settings])
+        Session.commit()
+        NId = N.id
+        NumId = Num.id
+        AgrId = Agr.id
+        extra_environ = {'test.authentication.role': u'administrator',
+                         'test.application_settings': True}
+
+        self.create_forms([
+            (u'chiens', u'chien-s', u'dog-PL', u''),
+            (u'les chiens', u'le-s chien-s', u'the-PL dog-PL', u''),
+            (u'chats', u'chat-s', u'cat-PL', u''),
+            (u'le chat', u'le chat', u'the cat', u'')], extra_environ)
+        unanalyzed = self.get_morphemic_analyses()
+        lexical_items = [
+            (u'chien', u'chien', u'dog', NId),
+            (u's (Num)', u's', u'PL', NumId),
+            (u's (Agr)', u's', u'PL', AgrId),
+            (u'le', u'le', u'the', u''),
+            (u'chat', u'chat', u'kitty', NId),
+            (u'matou', u'matou', u'cat', NId),
+            (u'chienne', u'chien', u'bitch', NId)]
+
+        # Create the lexical items one at a time and then delete them.
+        lexical_item_ids = self.create_forms(lexical_items, extra_environ)
+        percolated = self.get_morphemic_analyses()
+        for id in lexical_item_ids:
+            self.app.delete(url('form', id=id), headers=self.json_headers,
+                            extra_environ=extra_environ)
+        assert self.get_morphemic_analyses() == unanalyzed
+
+        # Import the same lexical items in bulk.
+        forms = []
+        for transcription, morpheme_break, morpheme_gloss, syntactic_category in lexical_items:
+            params = self.form_create_params.copy()
+            params.update({
+                'transcription': transcription,
+                'morpheme_break': morpheme_break,
+                'morpheme_gloss': morpheme_gloss,
+                'translations': [{'transcription': transcription, 'grammaticality': u''}],
+                'syntactic_category': syntactic_category
+            })
+            forms.append(params)
+        response = self.app.post(url('/forms/import'), json.dumps(forms),
+                                 self.json_headers, extra_environ)
+        assert len(json.loads(response.body)) == len(lexical_items)
+        imported = self.get_morphemic_analyses()
+        assert imported == percolated
+        assert imported[u'les chiens'][2] == u'?-Num N-Num'
+        assert imported[u'chats'][0][0][0] == [[u'chat', u'kitty', u'N']]
+        assert imported[u'chats'][1][0][0] == [[u'matou', u'matou', u'N']]
+
+        # Renaming and deleting a category percolate in one pass; the results are
+        # those of analyzing each form from scratch.
+        def assert_analyses_are_current():
+            morpheme_delimiters = [u'-', u'=']
+            for form in h.get_forms():
+                assert compile_morphemic_analysis(form, morpheme_delimiters)[:4] == \
+                    (form.morpheme_break_ids, form.morpheme_gloss_ids,
+                     form.syntactic_category_string, form.break_gloss_category)
+
+        params = json.dumps({'name': u'Noun', 'type': u'lexical', 'description': u''})
+        self.app.put(url('syntacticcategory', id=NId), params, self.json_headers, extra_environ)
+        assert_analyses_are_current()
+        renamed = self.get_morphemic_analyses()
+        assert renamed[u'les chiens'][2] == u'?-Num Noun-Num'
+        assert renamed[u'le chat'][3] == u'le|the|? chat|cat|Noun'
+
+        self.app.delete(url('syntacticcategory', id=NumId), headers=self.json_headers,
+                        extra_environ=extra_environ)
+        assert_analyses_are_current()
+        deleted = self.get_morphemic_analyses()
+        assert deleted[u'les chiens'][2] == u'?-? Noun-?'
+        assert deleted[u'chiens'][0] == [[[[u'chien', u'dog', u'Noun']],
+            [[u's (Num)', u'PL', None], [u's (Agr)', u'PL', u'Agr']]]]
+
+    @nottest
+    def test_export(self):
+        """Tests that GET /forms?export=ndjson(.gz) streams all of the forms as newline-delimited JSON."""
+
+        restricted_tag = h.generate_restricted_tag()
+        application_settings = h.generate_default_application_settings()
+        Session.add_all([restricted_tag, application_settings])
+        Session.commit()
+        restricted_tag = h.get_restricted_tag()
+        forms = [h.generate_default_form() for i in range(5)]
+        for index, form in enumerate(forms):
+            form.transcription = u'form %d' % index
+        forms[0].tags = [restricted_tag]
+        Session.add_all(forms)
+        Session.commit()
+
+        response = self.app.get(url('forms'), {'export': 'ndjson'},
+                                headers=self.json_headers, extra_environ=self.extra_environ_admin)
+        assert response.content_type == 'application/x-ndjson'
+        lines = response.body.splitlines()
+        assert [json.loads(line)['transcription'] for line in lines] == \
+            [u'form %d' % index for index in range(5)]
+        response = self.app.get(url('forms'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        assert [json.loads(line) for line in lines] == json.loads(response.body)
+
+        # Gzipped exports decompress to the same documents and restricted forms
+        # are omitted for restricted users.
+        response = self.app.get(url('forms'), {'export': 'ndjson.gz'},
+                                headers=self.json_headers, extra_environ=self.extra_environ_view)
+        assert response.content_type == 'application/x-gzip'
+        assert 'forms.ndjson.gz' in response.headers['Content-Disposition']
+        lines = gzip.GzipFile(fileobj=StringIO(response.body)).read().splitlines()
+        assert [json.loads(line)['transcription'] for line in lines] == \
+            [u'form %d' % index for index in range(1, 5)]
+
+        # Invalid export formats are rejected.
+        response = self.app.get(url('forms'), {'export': 'xml'}, headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin, status=400)
+        assert 'export' in json.loads(response.body)['errors']
+
+    @nottest
+    def test_search_result_cache(self):
+        """Tests that cached form search results are invalidated by writes and restricted per user."""
+
+        restricted_tag = h.generate_restricted_tag()
+        application_settings = h.generate_default_application_settings()
+        Session.add_all([restricted_tag, application_settings])
+        Session.commit()
+        restricted_tag = h.get_restricted_tag()
+        forms = [h.generate_default_form() for i in range(5)]
+        for index, form in enumerate(forms):
+            form.transcription = u'form %d' % index
+        forms[0].tags = [restricted_tag]
+        Session.add_all(forms)
+        Session.commit()
+        h.search_result_cache.clear()
+
+        query = json.dumps({'query': {'filter': ['Form', 'transcription', 'like', u'form%'],
+                                      'order_by': ['Form', 'transcription', 'desc']},
+                            'paginator': {'page': 1, 'items_per_page': 2}})
+        def search(extra_environ):
+            response = self.app.post(url('/forms/search'), query, self.json_headers, extra_environ)
+            return json.loads(response.body)
+
+        # The same search is answered from the cache; the cached ids are
+        # filtered for restricted users.
+        resp = search(self.extra_environ_admin)
+        assert resp['paginator']['count'] == 5
+        assert [f['transcription'] for f in resp['items']] == [u'form 4', u'form 3']
+        assert len(h.search_result_cache.results) == 1
+        assert search(self.extra_environ_admin) == resp
+        assert len(h.search_result_cache.results) == 1
+        resp = search(self.extra_environ_view)
+        assert resp['paginator']['count'] == 4
+        assert len(h.search_result_cache.results) == 1
+        query = json.dumps({'query': {'filter': ['Form', 'transcription', 'like', u'form%'],
+                                      'order_by': ['Form', 'transcription', 'desc']},
+                            'paginator': {'page': 2, 'items_per_page': 2}})
+        assert [f['transcription'] for f in search(self.extra_environ_view)['items']] == \
+            [u'form 2', u'form 1']
+
+        # Creating a form invalidates the cached result.
+        params = self.form_create_params.copy()
+        params.update({'transcription': u'form 5',
+            'translations': [{'transcription': u'test', 'grammaticality': u''}]})
+        self.app.post(url('forms'), json.dumps(params), self.json_headers,
+                      self.extra_environ_admin)
+        resp = search(self.extra_environ_view)
+        assert resp['paginator']['count'] == 5
+        assert [f['transcription'] for f in resp['items']] == [u'form 3', u'form 2']
+
+        # So does restricting a form by tagging it.
+        form = Session.query(model.Form).filter(model.Form.transcription == u'form 5').first()
+        form.tags = [restricted_tag]
+        Session.commit()
+        assert search(self.extra_environ_view)['paginator']['count'] == 4
+        assert search(self.extra_environ_admin)['paginator']['count'] == 6
+
+        # So do writes made by other processes, through the shared versions of
+        # the tables: simulate one by forgetting the local versions of a write.
+        local_versions = dict(h.data_versions.versions)
+        shared_version = h.data_versions.get(['form'])[0][2]
+        form = Session.query(model.Form).filter(model.Form.transcription == u'form 4').first()
+        form.transcription = u'form 6'
+        Session.commit()
+        h.data_versions.versions = local_versions
+        assert h.data_versions.get(['form'])[0][2] == shared_version + 1
+        resp = search(self.extra_environ_admin)
+        assert [f['transcription'] for f in resp['items']] == [u'form 6', u'form 5']
+        form = Session.query(model.Form).filter(model.Form.transcription == u'form 6').first()
+        form.transcription = u'form 4'
+        Session.commit()
+
+        # Forms matched through several of their translations are returned once.
+        form = Session.query(model.Form).filter(model.Form.transcription == u'form 1').first()
+        form.translations += [model.Translation(transcription=u'test translation %d' % i)
+                              for i in range(2)]
+        Session.commit()
+        query = json.dumps({'query': {'filter': ['Translation', 'transcription', 'like', u'test%']}})
+        response = self.app.post(url('/forms/search'), query, self.json_headers,
+                                 self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert sorted([f['transcription'] for f in resp]) == [u'form %d' % i for i in range(6)]
+
+        # The cursor of a page makes the next page start after its last form,
+        # even if a form before it is deleted in the meantime.
+        query = json.dumps({'query': {'filter': ['Form', 'transcription', 'like', u'form%'],
+                                      'order_by': ['Form', 'transcription', 'desc']},
+                            'paginator': {'page': 1, 'items_per_page': 2}})
+        resp = search(self.extra_environ_admin)
+        assert [f['transcription'] for f in resp['items']] == [u'form 5', u'form 4']
+        self.app.delete(url('form', id=resp['items'][0]['id']), headers=self.json_headers,
+                        extra_environ=self.extra_environ_admin)
+        query = json.dumps({'query': {'filter': ['Form', 'transcription', 'like', u'form%'],
+                                      'order_by': ['Form', 'transcription', 'desc']},
+                            'paginator': {'page': 2, 'items_per_page': 2,
+                                          'cursor': resp['paginator']['cursor']}})
+        resp = search(self.extra_environ_admin)
+        assert resp['paginator']['count'] == 5
+        assert [f['transcription'] for f in resp['items']] == [u'form 3', u'form 2']
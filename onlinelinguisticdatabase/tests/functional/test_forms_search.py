@@ -24,6 +24,7 @@ I altered the global valid_methods tuple of webtest.lint at runtime by adding a
 """
 
 import re
+import threading
 from onlinelinguisticdatabase.tests import TestController, url
 from nose.tools import nottest
 import simplejson as json
@@ -32,6 +33,9 @@ from datetime import date, datetime, timedelta
 import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
+from onlinelinguisticdatabase.lib.SQLAQueryBuilder import SQLAQueryBuilder, compiled_query_cache
+from onlinelinguisticdatabase.model.formtrigram import trigram_index_is_enabled, \
+    trigram_index_is_built, get_pattern_trigrams
 
 log = logging.getLogger(__name__)
 
@@ -1853,6 +1857,164 @@ class TestFormsSearchController(TestController):
         assert len(resp) == 1
         assert response.content_type == 'application/json'
 
+    @nottest
+    def test_search_zc_fields(self):
+        """Tests SEARCH /forms: field projection."""
+        forms = json.loads(json.dumps(h.get_forms(), cls=h.JSONOLDEncoder))
+        result_set = [f for f in forms if 'T' in f['transcription']]
+
+        # Only the requested fields are returned and their values are those of
+        # the full representations.
+        fields = [u'id', u'transcription', u'translations', u'enterer', u'morpheme_break_ids']
+        json_query = json.dumps({'query': {
+                'filter': ['Form', 'transcription', 'like', '%T%']},
+            'paginator': {'page': 2, 'items_per_page': 10}, 'fields': fields})
+        response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+            headers=self.json_headers, environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp['paginator']['count'] == len(result_set)
+        assert len(resp['items']) == 10
+        for form, expected in zip(resp['items'], result_set[10:20]):
+            assert sorted(form.keys()) == sorted(fields)
+            assert form == dict([(f, expected[f]) for f in fields])
+
+        # Without a paginator.
+        json_query = json.dumps({'query': {
+                'filter': ['Form', 'transcription', 'like', '%T%']}, 'fields': [u'transcription']})
+        response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+            headers=self.json_headers, environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp == [{u'transcription': f['transcription']} for f in result_set]
+
+        # Invalid fields result in a 400 error.
+        json_query = json.dumps({'query': {
+                'filter': ['Form', 'transcription', 'like', '%T%']}, 'fields': [u'password']})
+        response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+            headers=self.json_headers, environ=self.extra_environ_admin, status=400)
+        resp = json.loads(response.body)
+        assert resp['errors']['fields'].startswith(u'The fields of Form resources must be')
+        json_query = json.dumps({'query': {
+                'filter': ['Form', 'transcription', 'like', '%T%']}, 'fields': [u'id', 5]})
+        response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+            headers=self.json_headers, environ=self.extra_environ_admin, status=400)
+        resp = json.loads(response.body)
+        assert resp['errors']['fields'].startswith(u'The fields of Form resources must be')
+
+    @nottest
+    def test_search_zd_compiled_query_cache(self):
+        """Tests SEARCH /forms: queries that differ only in their values reuse a cached filter expression."""
+        forms = json.loads(json.dumps(h.get_forms(), cls=h.JSONOLDEncoder))
+        compiled_query_cache.clear()
+
+        def search(transcriptions, date_elicited):
+            json_query = json.dumps({'query': {'filter': ['and', [
+                ['Form', 'transcription', 'in', transcriptions],
+                ['or', [['Form', 'date_elicited', '!=', date_elicited],
+                        ['Form', 'date_elicited', '=', None]]]]]}})
+            response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+                headers=self.json_headers, environ=self.extra_environ_admin)
+            return [f['id'] for f in json.loads(response.body)]
+
+        def expected(transcriptions, date_elicited):
+            return [f['id'] for f in forms if f['transcription'] in transcriptions and
+                    f['date_elicited'] != date_elicited]
+
+        transcriptions = [f['transcription'] for f in forms[:2]]
+        assert search(transcriptions, u'2000-01-01') == expected(transcriptions, u'2000-01-01')
+        assert len(compiled_query_cache.entries) == 1
+        transcriptions = [f['transcription'] for f in forms[2:4]]
+        date_elicited = forms[2]['date_elicited'] or u'2000-01-01'
+        assert search(transcriptions, date_elicited) == expected(transcriptions, date_elicited)
+        assert len(compiled_query_cache.entries) == 1
+
+        # Invalid values in a cached query structure still generate errors.
+        json_query = json.dumps({'query': {'filter': ['and', [
+            ['Form', 'transcription', 'in', transcriptions],
+            ['or', [['Form', 'date_elicited', '!=', u'not a date'],
+                    ['Form', 'date_elicited', '=', None]]]]]}})
+        response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+            headers=self.json_headers, environ=self.extra_environ_admin, status=400)
+        resp = json.loads(response.body)
+        assert resp['errors']['date not a date'] == u'Date search parameters must be valid ISO 8601 date strings.'
+
+        # A builder shared by several threads (as the controllers' builders
+        # are) builds each thread's query from that thread's own state.
+        filters = [[['Form', 'id', 'in', range(1, i + 2)],
+                    ['not', ['Form', 'transcription', 'like', u'%%%d%%' % i]],
+                    ['Translation', 'transcription', 'like', u'%%%d%%' % i]][i % 3]
+                   for i in range(9)]
+        expected_sql = [str(SQLAQueryBuilder('Form').get_SQLA_query({'filter': filter_}))
+                        for filter_ in filters]
+        query_builder = SQLAQueryBuilder('Form')
+        built_sql = dict([(index, set()) for index in range(len(filters))])
+        def build(index):
+            try:
+                for i in range(20):
+                    query = query_builder.get_SQLA_query({'filter': filters[index]})
+                    built_sql[index].add(str(query))
+            finally:
+                Session.remove()
+        threads = [threading.Thread(target=build, args=(index,)) for index in range(len(filters))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [built_sql[index] for index in range(len(filters))] == \
+            [set([sql]) for sql in expected_sql]
+
+    @nottest
+    def test_search_ze_trigram_index(self):
+        """Tests SEARCH /forms: like and regexp searches restricted by the trigram index."""
+        if not trigram_index_is_enabled():
+            return
+        assert trigram_index_is_built(Session)
+        forms = json.loads(json.dumps(h.get_forms(), cls=h.JSONOLDEncoder))
+
+        # Pattern analysis: only literal substrings contribute trigrams.
+        assert get_pattern_trigrams(u'%ption 1_%', 'like') == set([u'pti', u'tio', u'ion', u'on ', u'n 1'])
+        assert get_pattern_trigrams(u'a\\%bcd', 'like') == set()
+        assert get_pattern_trigrams(u'^abc.*de+f[xyz]gh?ij{2}k', 'regexp') == set([u'abc'])
+        assert get_pattern_trigrams(u'abc|def', 'regexp') == set()
+        assert get_pattern_trigrams(u'[[:alpha:]]abc', 'regexp') == set()
+        assert get_pattern_trigrams(u'[^[.hyphen.]x]abc', 'regexp') == set()
+
+        query_builder = SQLAQueryBuilder('Form')
+        query = query_builder.get_SQLA_query({'filter': ['Form', 'transcription', 'like', u'%tion 1%']})
+        assert 'formtrigram' in str(query)
+        query = query_builder.get_SQLA_query({'filter':
+            ['not', ['Form', 'transcription', 'like', u'%tion 1%']]})
+        assert 'formtrigram' not in str(query)
+
+        def search(filter_):
+            json_query = json.dumps({'query': {'filter': filter_}})
+            response = self.app.request(url('forms'), method='SEARCH', body=json_query,
+                headers=self.json_headers, environ=self.extra_environ_admin)
+            return [f['id'] for f in json.loads(response.body)]
+
+        assert search(['Form', 'transcription', 'like', u'%tion 1%']) == \
+            [f['id'] for f in forms if u'tion 1' in f['transcription']]
+        assert search(['Form', 'transcription', 'like', u'%TION 1%']) == \
+            [f['id'] for f in forms if u'TION 1' in f['transcription']]
+        assert search(['Form', 'morpheme_gloss', 'regex', u'^morpheme_gloss [5-7]5$']) == \
+            [f['id'] for f in forms if re.search(u'^morpheme_gloss [5-7]5$', f['morpheme_gloss'])]
+        assert search(['Translation', 'transcription', 'like', u'%lation 2%']) == \
+            [f['id'] for f in forms if [t for t in f['translations'] if u'lation 2' in t['transcription']]]
+        assert search(['Form', 'translations', 'transcription', 'regex', u'lation 3']) == \
+            [f['id'] for f in forms if [t for t in f['translations'] if u'lation 3' in t['transcription']]]
+
+        # The index is maintained when forms and translations are written.
+        form = Session.query(model.Form).get(forms[0]['id'])
+        form.transcription = u'qwertyuiop'
+        form.translations[0].transcription = u'asdfghjkl'
+        Session.commit()
+        assert search(['Form', 'transcription', 'like', u'%rtyu%']) == [form.id]
+        assert search(['Translation', 'transcription', 'regex', u'dfgh']) == [form.id]
+        assert search(['Form', 'transcription', 'like', forms[0]['transcription']]) == []
+        form.transcription = forms[0]['transcription']
+        form.translations[0].transcription = forms[0]['translations'][0]['transcription']
+        Session.commit()
+        assert search(['Form', 'transcription', 'like', forms[0]['transcription']]) == [form.id]
+
     @nottest
     def test_z_cleanup(self):
         """Tests POST /forms/search: clean up the database."""
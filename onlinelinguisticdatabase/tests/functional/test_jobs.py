@@ -0,0 +1,158 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import datetime
+import simplejson as json
+from nose.tools import nottest
+from sqlalchemy.sql import and_
+from onlinelinguisticdatabase.tests import TestController, url
+import onlinelinguisticdatabase.model as model
+from onlinelinguisticdatabase.model.meta import Session
+import onlinelinguisticdatabase.lib.helpers as h
+from onlinelinguisticdatabase.lib.foma_worker import enqueue_job, job_table, \
+    get_resource_is_free_condition, JobDispatcher
+
+log = logging.getLogger(__name__)
+
+class TestJobsController(TestController):
+
+    def create_job(self, resource, status, worker=None, datetime_modified=None):
+        job = model.Job()
+        job.func = u'compile_phonology'
+        job.args = u'{}'
+        job.resource = resource
+        job.status = status
+        job.worker = worker
+        job.datetime_entered = job.datetime_modified = datetime_modified or h.now()
+        Session.add(job)
+        Session.commit()
+        return job.id
+
+    @nottest
+    def test_index_and_show(self):
+        """Tests that ``GET /jobs`` and ``GET /jobs/id`` behave correctly."""
+
+        job1_id = self.create_job(u'Phonology 1', u'succeeded')
+        job2_id = self.create_job(u'Phonology 2', u'failed')
+
+        response = self.app.get(url('jobs'), headers=self.json_headers,
+                                extra_environ=self.extra_environ_view)
+        resp = json.loads(response.body)
+        assert [j['id'] for j in resp] == [job1_id, job2_id]
+        assert response.content_type == 'application/json'
+
+        response = self.app.get(url('jobs'), {'status': u'failed'},
+                                headers=self.json_headers, extra_environ=self.extra_environ_view)
+        resp = json.loads(response.body)
+        assert [j['id'] for j in resp] == [job2_id]
+
+        response = self.app.get(url('jobs'), {'resource': u'Phonology 1'},
+                                headers=self.json_headers, extra_environ=self.extra_environ_view)
+        resp = json.loads(response.body)
+        assert [j['id'] for j in resp] == [job1_id]
+
+        response = self.app.get(url('job', id=job1_id), headers=self.json_headers,
+                                extra_environ=self.extra_environ_view)
+        resp = json.loads(response.body)
+        assert resp['status'] == u'succeeded'
+        assert resp['resource'] == u'Phonology 1'
+        assert resp['args'] == {}
+
+        response = self.app.get(url('job', id=100987), headers=self.json_headers,
+                                extra_environ=self.extra_environ_view, status=404)
+        assert json.loads(response.body)['error'] == u'There is no job with id 100987'
+
+        # Jobs are read-only.
+        response = self.app.post(url('jobs'), json.dumps({}), self.json_headers,
+                                 self.extra_environ_admin, status=404)
+        assert json.loads(response.body)['error'] == u'This resource is read-only.'
+        response = self.app.delete(url('job', id=job1_id), headers=self.json_headers,
+                                   extra_environ=self.extra_environ_admin, status=404)
+        assert json.loads(response.body)['error'] == u'This resource is read-only.'
+
+    @nottest
+    def test_enqueue(self):
+        """Tests that jobs on a busy resource wait and that identical queued jobs are not duplicated."""
+
+        # A job that is running on another host keeps the resource busy.
+        self.create_job(u'Phonology 1', u'running', u'elsewhere:1')
+        args = {'phonology_id': 1, 'user_id': 1, 'timeout': 1}
+        job1 = enqueue_job('compile_phonology', args, resource=u'Phonology 1')
+        job2 = enqueue_job('compile_phonology', args, resource=u'Phonology 1')
+        assert job1.id == job2.id
+        assert job1.status == u'queued'
+        assert Session.query(model.Job).filter(model.Job.status == u'queued').count() == 1
+
+    @nottest
+    def test_claim(self):
+        """Tests that a job can only be claimed if it is the earliest unfinished job of its resource."""
+
+        def claim(job_id, resource):
+            rowcount = Session.execute(job_table.update().where(and_(
+                job_table.c.id == job_id, job_table.c.status == u'queued',
+                get_resource_is_free_condition(job_id, resource))).values(
+                status=u'running')).rowcount
+            Session.commit()
+            return rowcount
+
+        running_id = self.create_job(u'Phonology 1', u'running', u'elsewhere:1')
+        job1_id = self.create_job(u'Phonology 1', u'queued')
+        job2_id = self.create_job(u'Phonology 1', u'queued')
+        job3_id = self.create_job(u'Phonology 2', u'queued')
+
+        # Neither queued job of the busy resource can be claimed, e.g., by
+        # dispatchers in two application processes.
+        assert claim(job1_id, u'Phonology 1') == 0
+        assert claim(job2_id, u'Phonology 1') == 0
+        assert claim(job3_id, u'Phonology 2') == 1
+
+        # Once the running job has finished, only the earlier queued job can be.
+        Session.query(model.Job).get(running_id).status = u'succeeded'
+        Session.commit()
+        assert claim(job2_id, u'Phonology 1') == 0
+        assert claim(job1_id, u'Phonology 1') == 1
+        assert claim(job2_id, u'Phonology 1') == 0
+
+    @nottest
+    def test_recover(self):
+        """Tests that running jobs that have not been updated for a while are requeued by any dispatcher."""
+
+        long_ago = h.now() - datetime.timedelta(hours=1)
+        stale_id = self.create_job(u'Phonology 1', u'running', u'elsewhere:1', long_ago)
+        queued_id = self.create_job(u'Phonology 1', u'queued')
+        running_id = self.create_job(u'Phonology 2', u'running', u'elsewhere:2')
+        finished_id = self.create_job(u'Phonology 3', u'succeeded', u'elsewhere:3', long_ago)
+
+        # The dispatcher is not started: its methods are called directly.
+        dispatcher = JobDispatcher(Session.bind, stale_timeout=60)
+        dispatcher.recover()
+        Session.expire_all()
+        assert [Session.query(model.Job).get(id_).status for id_ in
+                (stale_id, queued_id, running_id, finished_id)] == \
+            [u'queued', u'queued', u'running', u'succeeded']
+        stale_job = Session.query(model.Job).get(stale_id)
+        assert stale_job.worker is None
+        assert stale_job.progress == 0
+
+        # The requeued job no longer blocks its resource and is run first.
+        condition = and_(job_table.c.status == u'queued',
+                         get_resource_is_free_condition(queued_id, u'Phonology 1'))
+        assert Session.execute(job_table.select().where(and_(
+            job_table.c.id == queued_id, condition))).fetchall() == []
+        condition = and_(job_table.c.status == u'queued',
+                         get_resource_is_free_condition(stale_id, u'Phonology 1'))
+        assert len(Session.execute(job_table.select().where(and_(
+            job_table.c.id == stale_id, condition))).fetchall()) == 1
+        Session.commit()
@@ -15,6 +15,8 @@
 import logging
 import os
 import codecs
+import tempfile
+from shutil import rmtree
 import simplejson as json
 from time import sleep
 from nose.tools import nottest
@@ -25,6 +27,8 @@ from onlinelinguisticdatabase.model.meta import Session
 from subprocess import call
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.model import MorphemeLanguageModel, MorphemeLanguageModelBackup
+from onlinelinguisticdatabase.lib import simplelm
+from onlinelinguisticdatabase.lib.parser import LanguageModel
 
 log = logging.getLogger(__name__)
 
@@ -49,6 +53,35 @@ class TestMorphemelanguagemodelsController(TestController):
     def human_readable_seconds(self, seconds):
         return u'%02dm%02ds' % (seconds / 60, seconds % 60)
 
+    def write_small_arpa(self, path):
+        """Write a small trigram LM in ARPA format to ``path``.  Some 2- and 3-grams are
+        missing so that look-ups have to back off.
+
+        """
+        lines = [
+            u'\\data\\', u'ngram 1=6', u'ngram 2=6', u'ngram 3=3', u'',
+            u'\\1-grams:',
+            u'-1.0\t</s>',
+            u'-99\t<s>\t-0.5',
+            u'-0.6\tchien\t-0.3',
+            u'-0.7\tchat\t-0.2',
+            u'-0.8\tmange\t-0.25',
+            u'-0.9\t\xe9t\xe9\t-0.1',
+            u'', u'\\2-grams:',
+            u'-0.2\t<s> chien\t-0.15',
+            u'-0.3\t<s> chat\t-0.05',
+            u'-0.4\tchien mange\t-0.1',
+            u'-0.35\tchat mange',
+            u'-0.5\tmange chat\t-0.2',
+            u'-0.45\tmange </s>',
+            u'', u'\\3-grams:',
+            u'-0.1\t<s> chien mange',
+            u'-0.12\tchien mange chat',
+            u'-0.3\tmange chat </s>',
+            u'', u'\\end\\', u'']
+        with codecs.open(path, 'w', 'utf8') as f:
+            f.write(u'\n'.join(lines))
+
     @nottest
     def test_a_create(self):
         """Tests that POST /morphemelanguagemodels creates a new morphology.
@@ -1202,6 +1235,84 @@ class TestMorphemelanguagemodelsController(TestController):
         sleep(1) # If I don't sleep here I get an odd thread-related error (conditional upon
         # this being the last test to be run, I think)...
 
+    @nottest
+    def test_y_compact_lm(self):
+        """Tests that a ``simplelm.CompactLM`` round-trips through its binary format and agrees with ``simplelm.LMTree``."""
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            arpa_path = os.path.join(tmp_dir, 'lm.lm')
+            compact_path = os.path.join(tmp_dir, 'lm.trie')
+            self.write_small_arpa(arpa_path)
+            tree = simplelm.load_arpa(arpa_path, 'utf8')
+            simplelm.CompactLM.from_arpa(arpa_path, 'utf8').save(compact_path)
+            ngrams = [[], [u'chien'], [u'\xe9t\xe9'], [u'<s>', u'chien'], [u'chien', u'mange', u'chat'],
+                      [u'chat', u'chien'], [u'<s>', u'chien', u'mange', u'chat'], [u'inconnu'],
+                      [u'mange', u'inconnu']]
+            sentences = [[u'<s>', u'chien', u'mange', u'chat', u'</s>'],
+                         [u'<s>', u'chat', u'mange', u'\xe9t\xe9', u'inconnu', u'</s>']]
+            for use_mmap in (False, True):
+                compact_lm = simplelm.CompactLM.load(compact_path, use_mmap=use_mmap)
+                assert compact_lm.max_order == tree.max_order == 3
+                assert u'\xe9t\xe9' in compact_lm.vocabulary
+                for ngram in ngrams:
+                    assert compact_lm.get_ngram_p(ngram) == tree.get_ngram_p(ngram)
+                for sentence in sentences:
+                    assert abs(simplelm.compute_sentence_prob(compact_lm, sentence[:]) -
+                               simplelm.compute_sentence_prob(tree, sentence[:])) < 1e-9
+                del compact_lm
+
+            # A file that is not a compact LM is rejected.
+            try:
+                simplelm.CompactLM.load(arpa_path)
+                assert False
+            except ValueError:
+                pass
+        finally:
+            rmtree(tmp_dir)
+
+    @nottest
+    def test_y_compute_sentence_probs(self):
+        """Tests that batched LM probabilities are the same as those computed one sentence at a time."""
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            language_model = LanguageModel(tmp_dir)
+            self.write_small_arpa(language_model.get_file_path('arpa'))
+            tree = simplelm.load_arpa(language_model.get_file_path('arpa'), 'utf8')
+            language_model.generate_trie()
+
+            # Shared prefixes, a duplicate, unknown words, sentences much longer than
+            # max_order - 1 and degenerate sentences.
+            sentences = [
+                [u'<s>', u'chien', u'mange', u'chat', u'</s>'],
+                [u'<s>', u'chien', u'mange', u'chat', u'mange', u'chien', u'mange', u'chat', u'</s>'],
+                [u'<s>', u'chien', u'mange', u'</s>'],
+                [u'<s>', u'chat', u'mange', u'\xe9t\xe9', u'inconnu', u'chat', u'</s>'],
+                [u'<s>', u'chien', u'mange', u'chat', u'</s>'],
+                [u'<s>', u'chien'],
+                [u'<s>', u'</s>'],
+                [u'<s>']]
+            copies = [sentence[:] for sentence in sentences]
+            for lm in (tree, language_model.trie):
+                expected = [simplelm.compute_sentence_prob(lm, sentence[:]) for sentence in sentences]
+                batched = simplelm.compute_sentence_probs(lm, sentences)
+                assert len(batched) == len(sentences)
+                for expected_prob, batched_prob in zip(expected, batched):
+                    assert abs(expected_prob - batched_prob) < 1e-9
+                assert sentences == copies # the input sentences are not modified
+
+            expected = [language_model.get_probability_one(sentence[:]) for sentence in sentences]
+            batched = language_model.get_probability_many(sentences)
+            for expected_prob, batched_prob in zip(expected, batched):
+                assert abs(expected_prob - batched_prob) < 1e-9
+            assert sentences == copies
+            probabilities = language_model.get_probabilities([u'chien mange chat', u'chien mange'])
+            assert abs(probabilities[u'chien mange chat'] - expected[0]) < 1e-9
+            assert abs(probabilities[u'chien mange'] - expected[2]) < 1e-9
+        finally:
+            rmtree(tmp_dir)
+
     @nottest
     def test_z_cleanup(self):
         """Clean up after the tests."""
@@ -26,6 +26,7 @@ from onlinelinguisticdatabase.model.meta import Session
 from subprocess import call
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.model import MorphologicalParser, MorphologicalParserBackup
+from onlinelinguisticdatabase.lib.parser import Cache
 from sqlalchemy.sql import desc
 
 log = logging.getLogger(__name__)
@@ -542,6 +543,11 @@ define phonology eDrop .o. breakDrop;
         assert resp[transcription3] == transcription3_correct_parse
         assert resp['abc'] == None
 
+        # Only the parses that were new to the cache were inserted on the second request.
+        persisted = [p.transcription for p in Session.query(model.Parse).\
+            filter(model.Parse.parser_id==morphological_parser_id).all()]
+        assert sorted(persisted) == sorted([transcription1, transcription3, u'abc'])
+
         ################################################################################
         # END MORPHOLOGICAL PARSER 1
         ################################################################################
@@ -610,6 +616,30 @@ define phonology eDrop .o. breakDrop;
         # from the morphophonology before selecting the most probable candidate.
         assert resp[transcription1] == transcription1_correct_parse
 
+        # Parsing transcriptions in a batch yields the same parses as parsing
+        # each of them on its own.
+        parser = Session.query(MorphologicalParser).get(morphological_parser_id)
+        transcriptions = [transcription1, transcription2, transcription3, u'abc', transcription1]
+        parser.cache = Cache()
+        parses = parser.parse_many(transcriptions)
+        parser.cache = Cache()
+        assert parses == dict((t, parser.parse_one(t)) for t in transcriptions)
+        assert parses[transcription1] == transcription1_correct_parse
+
+        # A dictionary that cannot be loaded is not loaded again for each
+        # transcription: disambiguation yields no candidates.
+        dictionary_path = parser.my_morphology.get_file_path('dictionary')
+        os.rename(dictionary_path, dictionary_path + '.bk')
+        try:
+            parser.cache = Cache()
+            assert parser.load_dictionary() == {}
+            assert parser.load_dictionary() is parser.load_dictionary()
+            assert parser.parse_many([transcription1]) == {transcription1: None}
+        finally:
+            os.rename(dictionary_path + '.bk', dictionary_path)
+        assert parser.load_dictionary()
+        Session.expunge(parser)
+
         ################################################################################
         # END MORPHOLOGICAL PARSER 2
         ################################################################################
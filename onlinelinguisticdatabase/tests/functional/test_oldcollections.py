@@ -26,6 +26,9 @@ from onlinelinguisticdatabase.tests import TestController, url
 import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
+from onlinelinguisticdatabase.model.collection import collectionreference_table
+from onlinelinguisticdatabase.controllers.oldcollections import \
+    get_collections_referencing_this_collection, get_collections_referencing_this_form
 
 log = logging.getLogger(__name__)
 
@@ -2072,3 +2075,68 @@ class TestOldcollectionsController(TestController):
                                 extra_environ=self.extra_environ_view)
         resp = json.loads(response.body)
         assert resp['search_parameters'] == h.get_search_parameters(query_builder)
+
+    @nottest
+    def test_collection_references(self):
+        """Tests that the references in the contents of collections are recorded and resolved."""
+
+        def create(model_name, params):
+            response = self.app.post(url(model_name), json.dumps(params), self.json_headers,
+                                     self.extra_environ_admin)
+            return json.loads(response.body)
+
+        def get_references(collection_id):
+            table = collectionreference_table
+            return sorted([(r.referenced_collection_id, r.referenced_form_id) for r in
+                Session.execute(table.select().where(table.c.collection_id == collection_id))])
+
+        form_ids = []
+        for i in range(3):
+            params = self.form_create_params.copy()
+            params.update({'transcription': u'transcription %d' % i,
+                'translations': [{'transcription': u'translation %d' % i, 'grammaticality': u''}]})
+            form_ids.append(create('forms', params)['id'])
+
+        # B references a form; C references B; A references B and C (a diamond).
+        params = self.collection_create_params.copy()
+        params.update({'title': u'B', 'contents': u'form[%d]' % form_ids[0]})
+        B = create('collections', params)
+        params.update({'title': u'C', 'contents': u'collection[%d] form[%d]' % (B['id'], form_ids[1])})
+        C = create('collections', params)
+        params.update({'title': u'A', 'contents': u'collection(%d) collection[%d] form[%d]' % (
+            B['id'], C['id'], form_ids[2])})
+        A = create('collections', params)
+        assert get_references(B['id']) == [(None, form_ids[0])]
+        assert get_references(C['id']) == [(None, form_ids[1]), (B['id'], None)]
+        assert get_references(A['id']) == [(None, form_ids[2]), (B['id'], None), (C['id'], None)]
+        assert A['contents_unpacked'] == u'form[%d] form[%d] form[%d] form[%d]' % (
+            form_ids[0], form_ids[0], form_ids[1], form_ids[2])
+        assert sorted(set(f['id'] for f in A['forms'])) == sorted(form_ids)
+
+        B_model = Session.query(model.Collection).get(B['id'])
+        assert [c.id for c in get_collections_referencing_this_collection(B_model)] == \
+            sorted([A['id'], C['id']])
+        form = Session.query(model.Form).get(form_ids[0])
+        assert [c.id for c in get_collections_referencing_this_form(form)] == [B['id']]
+
+        # Updating B propagates to C and A.
+        params.update({'title': u'B', 'contents': u'form[%d] form[%d]' % (form_ids[0], form_ids[1])})
+        response = self.app.put(url('collection', id=B['id']), json.dumps(params),
+                                self.json_headers, self.extra_environ_admin)
+        assert get_references(B['id']) == [(None, form_ids[0]), (None, form_ids[1])]
+        response = self.app.get(url('collection', id=A['id']), headers=self.json_headers,
+                                extra_environ=self.extra_environ_admin)
+        resp = json.loads(response.body)
+        assert resp['contents_unpacked'] == u'form[%d] form[%d] form[%d] form[%d] form[%d] form[%d]' % (
+            form_ids[0], form_ids[1], form_ids[0], form_ids[1], form_ids[1], form_ids[2])
+
+        # A circular reference is an error.
+        params.update({'title': u'B', 'contents': u'collection[%d]' % A['id']})
+        response = self.app.put(url('collection', id=B['id']), json.dumps(params),
+                                self.json_headers, self.extra_environ_admin, status=400)
+        resp = json.loads(response.body)
+        assert resp['error'].startswith(u'Circular collection reference error')
+
+        # Deleting a collection removes its references.
+        self.app.delete(url('collection', id=A['id']), extra_environ=self.extra_environ_admin)
+        assert get_references(A['id']) == []
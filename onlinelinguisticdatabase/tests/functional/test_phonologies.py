@@ -25,6 +25,7 @@ import onlinelinguisticdatabase.model as model
 from onlinelinguisticdatabase.model.meta import Session
 import onlinelinguisticdatabase.lib.helpers as h
 from onlinelinguisticdatabase.model import Phonology, PhonologyBackup
+import onlinelinguisticdatabase.lib.parser as parser
 
 log = logging.getLogger(__name__)
 
@@ -1083,6 +1084,61 @@ class TestPhonologiesController(TestController):
         resp = json.loads(response.body)
         assert resp['error'] == u'Phonology %d has not been compiled yet.' % phonology2_id
 
+    @nottest
+    def test_flookup_pool(self):
+        """Tests that FST applications reuse pooled flookup processes, restart dead ones and fall back to files."""
+
+        if not h.foma_installed(force_check=True):
+            return
+        fst = parser.FomaFST(os.path.join(self.phonologies_path, 'flookup_pool'),
+                             object_type=u'phonology')
+        fst.script = u'define phonology a -> b || c _ d;'
+        fst.save_script()
+        fst.compile()
+        assert fst.compile_succeeded
+        key = (fst.get_file_path('binary'), 'down')
+        pool = parser.flookup_pool
+        pool.clear()
+
+        # The process started by the first application is reused by later ones.
+        assert fst.applydown(u'cad') == {u'cad': [u'cbd']}
+        process = pool.processes[key]
+        assert fst.applydown([u'cad', u'dog']) == {u'cad': [u'cbd'], u'dog': [u'dog']}
+        assert pool.processes[key] is process
+        assert process.is_alive()
+
+        # A process that has died is replaced by a new one.
+        process.process.kill()
+        process.process.wait()
+        assert fst.applydown(u'cad') == {u'cad': [u'cbd']}
+        assert pool.processes[key] is not process
+        assert pool.processes[key].is_alive()
+        process = pool.processes[key]
+
+        # Inputs that cannot be sent to a process and failures of the pool
+        # make the application fall back to temporary files.
+        def fail(*args):
+            raise IOError('the pool cannot be used')
+        assert fst.applydown([u'cad', u'dog', u'']).get(u'cad') == [u'cbd']
+        pool.apply = fail
+        try:
+            assert fst.applydown([u'cad', u'dog']) == {u'cad': [u'cbd'], u'dog': [u'dog']}
+        finally:
+            del pool.apply
+        assert pool.processes[key] is process
+        assert not [fn for fn in os.listdir(fst.directory)
+                    if fn.startswith(('inputs_', 'outputs_', 'apply_'))]
+
+        # A recompiled binary is loaded by a new process.
+        sleep(1)
+        fst.script = u'define phonology a -> e || c _ d;'
+        fst.save_script()
+        fst.compile()
+        assert fst.applydown(u'cad') == {u'cad': [u'ced']}
+        assert pool.processes[key] is not process
+        pool.clear()
+        assert key not in pool.processes
+
     @nottest
     def test_runtests(self):
         """Tests that ``GET /phonologies/id/runtests`` runs the tests in the phonology's script."""
@@ -0,0 +1,171 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Regression tests for N+1 query problems: the number of SQL statements issued
+by the index and search actions must not grow with the size of the requested
+page.  Cf. the eagerload_<model> functions of lib/utils.py.
+
+"""
+
+import logging
+import simplejson as json
+from nose.tools import nottest
+from sqlalchemy import event
+from onlinelinguisticdatabase.tests import TestController, url
+import onlinelinguisticdatabase.model as model
+from onlinelinguisticdatabase.model.meta import Session
+import onlinelinguisticdatabase.lib.helpers as h
+
+log = logging.getLogger(__name__)
+
+class StatementCounter(object):
+    """Counts the SQL statements executed by an engine while ``self.count`` is not ``None``."""
+
+    def __init__(self):
+        self.count = None
+        self.engines = []
+
+    def listen(self, engine):
+        # Listeners cannot be removed in SQLAlchemy 0.7 so each engine is listened to once.
+        if engine not in self.engines:
+            event.listen(engine, 'before_cursor_execute', self)
+            self.engines.append(engine)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.count is not None:
+            self.count += 1
+
+    def count_statements(self, requester):
+        self.count = 0
+        try:
+            requester()
+            return self.count
+        finally:
+            self.count = None
+
+statement_counter = StatementCounter()
+
+class TestQueryCounts(TestController):
+
+    items = 30
+
+    def tearDown(self):
+        TestController.tearDown(self, del_global_app_set=True)
+
+    def create_data(self):
+        """Create forms, files, collections and corpora whose relational
+        attributes are all valuated and (where possible) all distinct.
+
+        """
+        application_settings = h.generate_default_application_settings()
+        restricted_tag = h.generate_restricted_tag()
+        tags = [model.Tag() for i in range(3)]
+        for index, tag in enumerate(tags):
+            tag.name = u'tag %d' % index
+        users = Session.query(model.User).all()
+        Session.add_all([application_settings, restricted_tag] + tags)
+        forms = []
+        files = []
+        for index in range(self.items):
+            speaker = model.Speaker()
+            speaker.first_name = u'John%d' % index
+            speaker.last_name = u'Doe%d' % index
+            source = model.Source()
+            source.type = u'book'
+            source.key = u'key%d' % index
+            source.author = u'Chomsky, N.'
+            source.title = u'Syntactic Structures %d' % index
+            source.publisher = u'Mouton'
+            source.year = 1957
+            elicitation_method = model.ElicitationMethod()
+            elicitation_method.name = u'elicitation method %d' % index
+            syntactic_category = model.SyntacticCategory()
+            syntactic_category.name = u'category %d' % index
+            file = model.File()
+            file.filename = u'name_%d.jpg' % index
+            file.enterer = file.elicitor = users[index % len(users)]
+            file.speaker = speaker
+            file.tags = [tags[index % len(tags)]]
+            form = model.Form()
+            form.transcription = u'transcription %d' % index
+            form.elicitor = form.enterer = form.modifier = form.verifier = \
+                users[index % len(users)]
+            form.speaker = speaker
+            form.source = source
+            form.elicitation_method = elicitation_method
+            form.syntactic_category = syntactic_category
+            for translation_index in range(2):
+                translation = model.Translation()
+                translation.transcription = u'translation %d.%d' % (index, translation_index)
+                form.translations.append(translation)
+            form.tags = tags[:2]
+            form.files = [file]
+            forms.append(form)
+            files.append(file)
+            collection = model.Collection()
+            collection.title = u'collection %d' % index
+            collection.speaker = speaker
+            collection.source = source
+            collection.elicitor = collection.enterer = collection.modifier = \
+                users[index % len(users)]
+            collection.tags = tags[:2]
+            collection.files = [file]
+            corpus = model.Corpus()
+            corpus.name = u'corpus %d' % index
+            corpus.enterer = corpus.modifier = users[index % len(users)]
+            corpus.tags = tags[:2]
+            Session.add_all([form, file, collection, corpus])
+        viewer = Session.query(model.User).filter(model.User.role == u'viewer').first()
+        viewer.remembered_forms = forms
+        Session.commit()
+        return viewer.id
+
+    @nottest
+    def test_index_and_search_query_counts(self):
+        """Tests that index and search actions issue a constant number of queries regardless of page size."""
+
+        viewer_id = self.create_data()
+        statement_counter.listen(Session.bind)
+        self._add_SEARCH_to_web_test_valid_methods()
+        extra_environ = self.extra_environ_contrib_appset
+        query = {'filter': ['Form', 'transcription', 'like', u'transcription%']}
+
+        requesters = {
+            'GET /forms': lambda paginator: self.app.get(url('forms'), paginator,
+                headers=self.json_headers, extra_environ=extra_environ),
+            'SEARCH /forms': lambda paginator: self.app.request(url('forms'), method='SEARCH',
+                body=json.dumps({'query': query, 'paginator': paginator}),
+                headers=self.json_headers, environ=extra_environ),
+            'GET /files': lambda paginator: self.app.get(url('files'), paginator,
+                headers=self.json_headers, extra_environ=extra_environ),
+            'GET /collections': lambda paginator: self.app.get(url('collections'), paginator,
+                headers=self.json_headers, extra_environ=extra_environ),
+            'GET /corpora': lambda paginator: self.app.get(url('corpora'), paginator,
+                headers=self.json_headers, extra_environ=extra_environ),
+            'GET /rememberedforms': lambda paginator: self.app.get(
+                url(controller='rememberedforms', action='show', id=viewer_id), paginator,
+                headers=self.json_headers, extra_environ=extra_environ)
+        }
+
+        for endpoint, requester in sorted(requesters.items()):
+            counts = []
+            for items_per_page in (1, 10, self.items):
+                paginator = {'page': 1, 'items_per_page': items_per_page}
+                # Warm up, e.g., the application settings cache.
+                requester(paginator)
+                counts.append(statement_counter.count_statements(lambda: requester(paginator)))
+            log.debug('%s statement counts for page sizes 1, 10 and %d: %s' % (
+                endpoint, self.items, counts))
+            assert len(set(counts)) == 1, '%s issues %s statements for page sizes 1, 10 and %d' % (
+                endpoint, counts, self.items)
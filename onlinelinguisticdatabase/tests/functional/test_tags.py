@@ -338,3 +338,34 @@ class TestTagsController(TestController):
         assert resp['tag']['name'] == u'name'
         assert resp['data'] == {}
         assert response.content_type == 'application/json'
+
+    @nottest
+    def test_rename_restricted_tag(self):
+        """Tests that renaming a tag to or from restricted updates the restricted flags of the tagged models."""
+
+        application_settings = h.generate_default_application_settings()
+        tag = model.Tag()
+        tag.name = u'secret'
+        form = h.generate_default_form()
+        form.tags = [tag]
+        Session.add_all([application_settings, tag, form])
+        Session.commit()
+        tag_id, form_id = tag.id, form.id
+        def form_is_restricted():
+            return Session.query(model.Form.restricted).filter(model.Form.id == form_id).scalar()
+        def viewer_form_ids():
+            response = self.app.get(url('forms'), headers=self.json_headers,
+                                    extra_environ=self.extra_environ_view)
+            return [f['id'] for f in json.loads(response.body)]
+        assert not form_is_restricted()
+        assert viewer_form_ids() == [form_id]
+
+        params = json.dumps({'name': u'restricted', 'description': u''})
+        self.app.put(url('tag', id=tag_id), params, self.json_headers, self.extra_environ_admin)
+        assert form_is_restricted()
+        assert viewer_form_ids() == []
+
+        params = json.dumps({'name': u'public', 'description': u''})
+        self.app.put(url('tag', id=tag_id), params, self.json_headers, self.extra_environ_admin)
+        assert not form_is_restricted()
+        assert viewer_form_ids() == [form_id]
@@ -0,0 +1,100 @@
+# Copyright 2013 Joel Dunham
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Tests of the REGEXP function that the OLD provides for SQLite: its fast
+paths must agree with ``re.search``.
+
+"""
+
+import re
+from unittest import TestCase
+from onlinelinguisticdatabase.lib.sqliteregexp import get_literal_prefix, get_matcher, \
+    get_regexp_function, PatternCache
+
+items = [u'', u'a', u'b', u'ab', u'abc', u'abcd', u'xabc', u'abc\n', u'abc\n\n', u'\nabc',
+         u'abcabc', u'ABC', u'aabbcc', u'abbbc', u'ac', u'b\n', u'12', u'123', u'0123',
+         u'a|b', u'(?i)', u'abc$', u'\u0101bc', u'\u0101\u0101']
+
+expressions = [
+    # Literals and anchored literals
+    u'', u'abc', u'b', u'^', u'$', u'^$', u'^abc', u'^abc$', u'abc$', u'^a', u'^\u0101', u'12',
+    # Quantifiers after the literal prefix
+    u'abc*', u'^abc*', u'^abc?$', u'^ab+c', u'^ab{2}c', u'ab{2,}', u'^a*', u'^abc*$', u'^a.c',
+    # Other metacharacters after the prefix
+    u'^ab[cd]', u'^ab(c|d)$', u'^ab\\w', u'^abc\\n', u'a\\|b', u'^\\(\\?i\\)',
+    # Alternation and groups with flags or other extensions
+    u'a|^b', u'^a|b$', u'^abc$|^b', u'abc|', u'(?i)abc', u'(?i)^abc$', u'^(?:ab)c', u'(?=ab)a',
+    u'^ab(?!c)', u'(?m)^abc$']
+
+def search(expr, item):
+    return re.search(expr, item) is not None
+
+class TestSQLiteRegexp(TestCase):
+
+    def test_get_literal_prefix(self):
+        """Tests that the literal prefix excludes characters made optional by a quantifier."""
+        assert get_literal_prefix(u'abc') == (u'abc', u'')
+        assert get_literal_prefix(u'abc$') == (u'abc', u'$')
+        assert get_literal_prefix(u'abc*') == (u'ab', u'c*')
+        assert get_literal_prefix(u'abc?d') == (u'ab', u'c?d')
+        assert get_literal_prefix(u'abc{2}') == (u'ab', u'c{2}')
+        assert get_literal_prefix(u'abc+') == (u'abc', u'+')
+        assert get_literal_prefix(u'ab[c]') == (u'ab', u'[c]')
+        assert get_literal_prefix(u'*a') == (u'', u'*a')
+        assert get_literal_prefix(u'') == (u'', u'')
+        for expr in expressions:
+            prefix, rest = get_literal_prefix(expr)
+            assert prefix + rest == expr
+            # Every match of the pattern begins with its prefix.
+            if u'|' not in expr and u'(?' not in expr:
+                for item in items:
+                    match = re.match(expr, item)
+                    if match:
+                        assert match.group().startswith(prefix), (expr, item)
+
+    def test_get_matcher(self):
+        """Tests that the matchers of patterns agree with ``re.search``."""
+        for expr in expressions:
+            matcher = get_matcher(expr)
+            for item in items:
+                assert matcher(item) == search(expr, item), (expr, item)
+
+    def test_trailing_newline(self):
+        """Tests that ``$`` matches at the end of a string and before a final newline only."""
+        matcher = get_matcher(u'^abc$')
+        assert matcher(u'abc')
+        assert matcher(u'abc\n')
+        assert not matcher(u'abc\n\n')
+        assert not matcher(u'abc\r\n')
+        assert not matcher(u'abcd')
+
+    def test_regexp_function(self):
+        """Tests the ``regexp`` function on NULL, integer and empty values."""
+        regexp = get_regexp_function(PatternCache(max_size=2))
+        assert regexp(u'abc', None) is None
+        assert regexp(u'^$', None) is None
+        assert regexp(u'^12', 123) is True
+        assert regexp(u'^12$', 123) is False
+        assert regexp(u'3$', 123) is True
+        assert regexp(u'^1.3$', 123) is True
+        assert regexp(u'^$', u'') is True
+        assert regexp(u'', u'') is True
+        assert regexp(u'a', u'') is False
+        assert regexp(u'^a*$', u'') is True
+        for expr in expressions:
+            for item in items:
+                assert regexp(expr, item) == search(expr, item), (expr, item)
+        assert regexp(u'^abc$', 'abc') is True
+        self.assertRaises(re.error, regexp, u'ab(', u'ab(')
+        self.assertRaises(re.error, regexp, u'ab(', u'ab(')
@@ -18,6 +18,10 @@ from shutil import copyfile
 import pylons.test
 from onlinelinguisticdatabase.config.environment import load_environment
 from onlinelinguisticdatabase.model.meta import Base, Session
+from onlinelinguisticdatabase.model.formtrigram import ensure_trigram_index
+from onlinelinguisticdatabase.model.collection import ensure_collection_references
+from onlinelinguisticdatabase.model.form import ensure_morpheme_token_index
+from onlinelinguisticdatabase.model.dataversion import ensure_data_versions
 import onlinelinguisticdatabase.lib.helpers as h
 
 log = logging.getLogger(__name__)
@@ -54,6 +58,12 @@ def setup_app(command, conf, vars):
         # Create the tables if they don't already exist
         Base.metadata.create_all(bind=Session.bind, checkfirst=True)
         log.info('Tables created.')
+        ensure_trigram_index(Session)
+        ensure_collection_references(Session)
+        ensure_morpheme_token_index(Session)
+        ensure_data_versions(Session)
+        h.data_versions.configure(shared=True)
+        Session.commit()
 
         Session.add_all(languages + [administrator, contributor, viewer])
         Session.commit()
@@ -69,6 +79,12 @@ def setup_app(command, conf, vars):
         # Create the tables if they don't already exist
         Base.metadata.create_all(bind=Session.bind, checkfirst=True)
         log.info('Tables created.')
+        ensure_trigram_index(Session)
+        ensure_collection_references(Session)
+        ensure_morpheme_token_index(Session)
+        ensure_data_versions(Session)
+        h.data_versions.configure(shared=True)
+        Session.commit()
 
         # Get default home & help pages.
         log.info("Creating default home and help pages.")